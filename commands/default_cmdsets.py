@@ -20,6 +20,7 @@ from evennia.contrib.ingame_python.commands import CmdCallback
 from commands import containercommands
 from commands import command
 from commands import emotes
+from commands import llmcommands
 from world import gendersub
 
 
@@ -67,6 +68,7 @@ class CharacterCmdSet(default_cmds.CharacterCmdSet):
         self.add(command.CmdOpen())
         self.add(command.CmdDrop())
         self.add(CmdCallback())
+        self.add(llmcommands.CmdLLMStatus())
 
 
 class AccountCmdSet(default_cmds.AccountCmdSet):
@@ -0,0 +1,136 @@
+from evennia import GLOBAL_SCRIPTS, default_cmds
+from evennia.utils.evtable import EvTable
+from world import arbiter as room_arbiter, llm
+
+
+class CmdLLMStatus(default_cmds.MuxCommand):
+    """
+    Show the state of the LLM request pipeline
+
+    Usage:
+      llmstatus
+      llmstatus/calls
+      llmstatus/npcs [<count>]
+
+    Switches:
+      calls - latency, token and cache figures per request class
+      npcs - the NPCs (or other objects) with the slowest calls, by p99
+
+    Without switches, lists queue depth, in-flight requests and queue
+    wait times for each LLM request class, and the health of each LLM
+    backend. The same data is served as JSON at /llm/stats/.
+
+    """
+    key = "llmstatus"
+    switch_options = ("calls", "npcs")
+    locks = "cmd:perm(Developer)"
+    help_category = "Admin"
+
+    def func(self):
+        if "calls" in self.switches:
+            self.show_calls()
+        elif "npcs" in self.switches:
+            self.show_sources()
+        else:
+            self.show_status()
+
+    def show_calls(self):
+        classes = llm.get_stats()["telemetry"]["classes"]
+        table = EvTable("|wclass|n", "|wcalls|n", "|wqueue p50/p99|n", "|wfirst text p50/p99|n",
+                        "|wlatency p50/p95/p99|n", "|wtokens in/cached/out|n", "|wcache|n", "|woutcomes|n",
+                        border="cells")
+        for name, row in classes.items():
+            table.add_row(name, row["calls"], _percentiles(row["queue_wait"], 50, 99),
+                          _percentiles(row["first_text"], 50, 99),
+                          _percentiles(row["total"], 50, 95, 99),
+                          _tokens(row),
+                          _counts(row["cache"]), _counts(row["outcomes"]))
+        self.caller.msg("|wLLM calls|n (seconds; latency as seen by the caller)\n%s" % table)
+
+    def show_sources(self):
+        count = int(self.args) if self.args.strip().isdigit() else 10
+        sources = llm.get_stats()["telemetry"]["sources"]
+        ranked = sorted(sources.items(), key=lambda item: item[1]["total"]["p99"], reverse=True)
+        table = EvTable("|wobject|n", "|wcalls|n", "|wlatency p50/p95/p99|n", "|wmax|n",
+                        "|wtokens in/cached/out|n", "|wcache|n", "|woutcomes|n", border="cells")
+        for source, row in ranked[:count]:
+            table.add_row("%s %s" % (row["key"], source), row["calls"],
+                          _percentiles(row["total"], 50, 95, 99), "%.2f" % row["total"]["max"],
+                          _tokens(row),
+                          _counts(row["cache"]), _counts(row["outcomes"]))
+        self.caller.msg("|wSlowest LLM callers|n (seconds)\n%s" % table)
+
+    def show_status(self):
+        stats = llm.get_stats()
+        table = EvTable("|wclass|n", "|wqueued|n", "|wactive|n", "|wdone|n", "|wdropped|n", "|wstale|n",
+                        "|wcancelled|n", "|wthrottled|n", "|wavg wait|n", "|wmax wait|n", border="cells")
+        for name, row in stats["scheduler"].items():
+            table.add_row(name, row["queued"], row["in_flight"], row["completed"], row["dropped"],
+                          row["stale"], row["cancelled"], row["throttled"], "%.2fs" % row["wait_avg"],
+                          "%.2fs" % row["wait_max"])
+        backends = EvTable("|wbackend|n", "|wmodel|n", "|wstate|n", "|wactive|n", "|wrequests|n",
+                           "|wthrottled|n", "|werror rate|n", "|wp50|n", "|wp95|n", border="cells")
+        for name, row in stats["backends"].items():
+            backends.add_row(name, row["model"], row["state"], row["in_flight"], row["requests"], row["throttled"],
+                             "%.0f%%" % (row["error_rate"] * 100), "%.2fs" % row["latency_p50"],
+                             "%.2fs" % row["latency_p95"])
+        cache = stats["cache"]
+        coalesce = stats["coalesce"]
+        prompt = stats["prompt"]
+        resilience = stats["resilience"]
+        rate_limit = stats["rate_limit"]
+        semantic = stats["semantic_cache"]
+        prefetch = stats["prefetch"]
+        memory = stats["episodic_memory"]
+        if semantic:
+            semantic_line = "%d answers in %d conversations, %d hits, %d misses (%.0f%% hit rate)" % (
+                semantic["entries"], semantic["npcs"], semantic["hits"], semantic["misses"],
+                semantic["hit_rate"] * 100)
+        else:
+            semantic_line = "off"
+        if memory:
+            memory_line = "%d memories of %d NPCs loaded (%d loading), %d recalls, %d memories recalled" % (
+                memory["memories"], memory["loaded"], memory["loading"], memory["recalls"], memory["recalled"])
+        else:
+            memory_line = "off"
+        if rate_limit:
+            rate_line = "%.0f%% headroom (requests %.0f%%, tokens %.0f%%), %d backoffs" % (
+                rate_limit["headroom"] * 100, rate_limit["requests_headroom"] * 100,
+                rate_limit["tokens_headroom"] * 100, rate_limit["backoffs"])
+        else:
+            rate_line = "off"
+        brain = GLOBAL_SCRIPTS.npc_brain.stats()
+        arbiter = room_arbiter.stats()
+        self.caller.msg(
+            "|wLLM scheduler|n\n%s\n|wResponse cache|n: %d/%d entries, %d hits, %d misses (%.0f%% hit rate), "
+            "%d evicted, %d expired, %d restored\n|wSemantic cache|n: %s\n|wEpisodic memory|n: %s"
+            "\n|wPrefetch|n: %d pending, %d started, %d used, %d discarded"
+            "\n|wCoalescing|n: %d calls made, %d duplicate calls avoided, %d pending"
+            "\n|wPrompt tokens|n: %.0f avg, %d max, %d last; %d history turns dropped, %d compacted"
+            "\n|wLLM backends|n\n%s\n|wRequests|n: %d timeouts, %d failures, %d failovers, %d fallbacks, "
+            "%d hedged, %d stale\n|wRate limit|n: %s"
+            "\n|wNPC brain|n: %d NPCs awake, %d dormant; %d players in %d rooms"
+            "\n|wRoom arbiter|n: %d rounds, %d replies, %d group replies, %d NPCs kept quiet"
+            % (table, cache["size"], cache["max_size"], cache["hits"], cache["misses"],
+               cache["hit_rate"] * 100, cache["evictions"], cache["expirations"], cache["restored"], semantic_line,
+               memory_line,
+               prefetch["pending"], prefetch["started"], prefetch["used"], prefetch["discarded"],
+               coalesce["calls"], coalesce["coalesced"], coalesce["in_flight"],
+               prompt["tokens_avg"], prompt["tokens_max"], prompt["tokens_last"],
+               prompt["dropped_turns"], prompt["compacted_turns"],
+               backends, resilience["timeouts"], resilience["failures"], resilience["failovers"],
+               resilience["fallbacks"], resilience["hedged"], resilience["stale"], rate_line,
+               brain["awake"], brain["dormant"], brain["presence"]["players"], brain["presence"]["rooms"],
+               arbiter["rounds"], arbiter["replies"], arbiter["group_replies"], arbiter["overheard"]))
+
+
+def _percentiles(histogram, *pcts):
+    return "/".join("%.2f" % histogram["p%d" % pct] for pct in pcts)
+
+
+def _counts(counter):
+    return ", ".join("%s %d" % (name, count) for name, count in sorted(counter.items()))
+
+
+def _tokens(row):
+    return "%d/%d/%d" % (row["prompt_tokens"], row["cached_tokens"], row["completion_tokens"])
@@ -16,6 +16,7 @@ at_server_cold_start()
 at_server_cold_stop()
 
 """
+from world import history, llm
 
 
 def at_server_init():
@@ -30,7 +31,7 @@ def at_server_start():
     This is called every time the server starts up, regardless of
     how it was shut down.
     """
-    pass
+    llm.load_cache()
 
 
 def at_server_stop():
@@ -38,7 +39,9 @@ def at_server_stop():
     This is called just before the server is shut down, regardless
     of it is for a reload, reset or shutdown.
     """
-    pass
+    history.flush()
+    llm.flush_memories(block=True)
+    llm.close()
 
 
 def at_server_reload_start():
@@ -52,7 +55,7 @@ def at_server_reload_stop():
     """
     This is called only time the server stops before a reload.
     """
-    pass
+    llm.flush_cache()
 
 
 def at_server_cold_start():
@@ -68,4 +71,4 @@ def at_server_cold_stop():
     This is called only when the server goes down due to a shutdown or
     reset.
     """
-    pass
+    llm.flush_cache()
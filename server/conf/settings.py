@@ -38,6 +38,198 @@ SERVERNAME = "mygame"
 # OpenAI API Key
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", None)
 OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_API_BASE = "https://api.openai.com/v1"
+
+# LLM backend: "openai" talks to OPENAI_API_BASE (any OpenAI-compatible
+# server), "mock" uses the offline fake in world/llm_mock.py with the
+# latency, token rate and failure injection given in LLM_MOCK_OPTIONS.
+LLM_BACKEND = "openai"
+LLM_MOCK_OPTIONS = {
+    "latency": ("lognormal", 0.8, 0.5),  # seconds to first token
+    "tokens_per_second": 40,
+    "failure_rate": 0.0,  # HTTP 500
+    "rate_limit_rate": 0.0,  # HTTP 429
+    "hang_rate": 0.0,  # never answers
+}
+
+# LLM transport. Requests run on the reactor over a pool of keep-alive
+# connections; this caps how many are on the wire at once.
+LLM_MAX_CONNECTIONS = 8
+# Seconds an idle pooled connection is kept open for reuse.
+LLM_CONNECTION_IDLE_TIMEOUT = 60
+
+# LLM backends. Each entry may set model, api_base, api_key, mock,
+# max_connections, idle_timeout, max_in_flight (requests before overflowing
+# to the next backend of the tier) and circuit_breaker; anything left out
+# comes from the OPENAI_* and LLM_* settings above.
+LLM_BACKENDS = {
+    "openai": {"model": OPENAI_MODEL},
+    # "openai-quality": {"model": "gpt-4o"},
+    # "local": {"model": "llama-3.1-8b-instruct", "api_base": "http://localhost:8080/v1"},
+}
+# Tiers list their backends in order of preference; requests fail over
+# down the list. Request classes use LLM_CLASS_TIERS unless an NPC pins a
+# tier with its llm_tier attribute.
+LLM_TIERS = {
+    "fast": ["openai"],  # e.g. ["openai", "local"]
+    "quality": ["openai"],  # e.g. ["openai-quality", "openai", "local"]
+}
+LLM_CLASS_TIERS = {"reply": "quality", "shard": "fast", "ambient": "fast", "summary": "fast"}
+# A backend whose median latency (seconds to first text) is above its
+# tier's target, or whose recent error rate is above the threshold, is only
+# used when no better backend of the tier is free.
+LLM_TIER_LATENCY_TARGETS = {"fast": 1.5, "quality": 4}
+LLM_BACKEND_ERROR_THRESHOLD = 0.5
+
+# LLM request scheduling. Lower priority values are dispatched first;
+# requests that wait longer than their class deadline (seconds) are dropped.
+# Once dispatched, a backend that takes longer than the timeout (seconds)
+# is cancelled, counts as a failure and the request fails over.
+LLM_MAX_CONCURRENT = LLM_MAX_CONNECTIONS
+LLM_REQUEST_CLASSES = {
+    "reply": {"priority": 0, "deadline": None, "timeout": 15, "min_headroom": 0.0},  # NPC answering a player
+    "shard": {"priority": 1, "deadline": None, "timeout": 15, "min_headroom": 0.1},  # Memetic Shard whispers
+    "ambient": {"priority": 2, "deadline": 15, "timeout": 20, "min_headroom": 0.3},  # NPC ticks
+    "prefetch": {"priority": 3, "deadline": 10, "timeout": 20, "min_headroom": 0.5},  # greetings ahead of time
+    "summary": {"priority": 4, "deadline": None, "timeout": 30, "min_headroom": 0.5},  # NPC memory upkeep
+}
+# NPCs with llm_prefetch set generate their greeting when a player enters a
+# neighbouring room, so it is ready the moment the player walks in. Unused
+# greetings are thrown away after LLM_PREFETCH_TTL seconds.
+LLM_PREFETCH_TTL = 60
+# Provider rate limits, shared by all requests. Requests wait in the queue
+# while either budget is spent, and a class only dispatches while at least
+# its min_headroom share of both is left, so ambient ticks give way before
+# replies do. burst_seconds is how much of the budget may be spent at once;
+# after an HTTP 429 nothing is sent for backoff seconds. None disables.
+LLM_RATE_LIMIT = {
+    "requests_per_minute": 500,
+    "tokens_per_minute": 200000,
+    "burst_seconds": 10,
+    "backoff": 10,
+}
+
+# After failure_threshold consecutive failures a backend is considered
+# down: nothing is dispatched for reset_timeout seconds, then one trial
+# request decides whether to resume.
+LLM_CIRCUIT_BREAKER = {"failure_threshold": 5, "reset_timeout": 30}
+# Served instead of a reply when a request fails or the breaker is open.
+# Classes without lines just get no reply.
+LLM_FALLBACK_LINES = {
+    "reply": [
+        "emote scratches their head, lost in thought.",
+        "say Hm? Sorry, my mind wandered. What were we talking about?",
+    ],
+    "shard": [
+        "...zzzt... who... who is speaking...?",
+        "The colours swirl too fast to make out any words.",
+    ],
+}
+# Hedged requests: if a request in one of these classes has not answered
+# (or started streaming) by this latency percentile of recent requests, a
+# second copy is sent and whichever answers first is used.
+LLM_HEDGE = {"reply": 95}
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# LLM response cache. Identical requests (same model, system prompt and
+# history) within LLM_CACHE_TTL seconds are answered without an API call.
+LLM_CACHE_SIZE = 512
+LLM_CACHE_TTL = 600
+# The cache is saved here when the server reloads or stops, and loaded
+# again when it starts. None keeps it in memory only.
+LLM_CACHE_PATH = os.path.join(GAME_DIR, "server", "llm_cache.db3")
+# Semantic cache (optional): a player question close enough (cosine
+# similarity of local embeddings, at least threshold) to one the same player
+# asked of the same NPC within ttl seconds gets the same answer. Each
+# NPC/player pair remembers max_entries questions; at most max_npcs pairs
+# have a store. The embedder is a class path; it is created with
+# embedder_options. Needs numpy.
+LLM_SEMANTIC_CACHE = {
+    "enabled": False,
+    "embedder": "world.llm_semantic.HashingEmbedder",
+    "embedder_options": {"dim": 512},
+    "threshold": 0.9,
+    "max_entries": 64,
+    "max_npcs": 500,
+    "ttl": 1800,
+}
+
+# Prompt size. Each request (system prompt, current turn and history) is
+# fitted into this many tokens, dropping or compacting the oldest history
+# first. Single turns longer than LLM_MAX_TURN_TOKENS are compacted.
+LLM_PROMPT_TOKEN_BUDGET = 1200
+LLM_MAX_TURN_TOKENS = 200
+
+# Rules every LLM NPC gets in its system prompt, after its persona and
+# before its memories. Keep this stable: any change here invalidates the
+# providers' prompt prefix caches for every NPC.
+LLM_WORLD_RULES = [
+    "Stay in character. You live in a text-based fantasy world.",
+    "Keep replies short, one or two sentences.",
+]
+
+# NPC memory. Once an NPC's chat history is longer than history_tokens, its
+# oldest turns (down to keep_tokens) are folded into a rolling summary of
+# recent events in the background; once that summary is longer than
+# summary_tokens, it is merged into the NPC's permanent_memory. Both are
+# part of the NPC's system prompt. None disables summarizing, and turns
+# past memory_size are simply forgotten.
+LLM_MEMORY = {"history_tokens": 600, "keep_tokens": 300, "summary_tokens": 100}
+# Episodic memory: what players said to an NPC is kept, as it leaves the
+# chat history, in a per-NPC store of embeddings saved under path. The
+# top_k memories at least min_similarity similar to what a player just said
+# are added to the NPC's prompt. Each NPC keeps max_entries memories, a
+# memory's strength halving every half_life seconds it goes unrecalled; the
+# weakest are forgotten first. At most max_loaded NPC stores stay in memory.
+# Needs numpy.
+LLM_EPISODIC_MEMORY = {
+    "enabled": True,
+    "path": os.path.join(GAME_DIR, "server", "memories"),
+    "embedder": "world.llm_semantic.HashingEmbedder",
+    "embedder_options": {"dim": 512},
+    "max_entries": 256,
+    "half_life": 14 * 86400,
+    "max_loaded": 200,
+    "top_k": 3,
+    "min_similarity": 0.3,
+}
+
+# Stream replies and deliver them to players sentence by sentence as they
+# arrive, instead of waiting for the whole completion.
+LLM_STREAMING = True
+
+# NPCs collect what is said in their room for LLM_CHATTER_WINDOW seconds
+# after the first line (and until their llm_cooldown is over) and answer it
+# all in one turn. At most LLM_CHATTER_MAX_LINES lines make up a turn; once
+# that many are waiting the NPC answers right away, cooldown permitting.
+LLM_CHATTER_WINDOW = 0.75
+LLM_CHATTER_MAX_LINES = 6
+# With several LLM NPCs in a room, only the most addressed one (named,
+# recently talking with the speaker, highest llm_priority) answers what was
+# said, plus up to max_speakers in all that score at least min_score (named
+# or in a recent conversation); the others just remember it. With
+# group_reply, two or more answer together from a single LLM call. None
+# lets every NPC answer on its own.
+LLM_ROOM_ARBITER = {"max_speakers": 2, "min_score": 3, "group_reply": False}
+
+# NPC chat histories live in memory; changed ones are saved to the database
+# every NPC_HISTORY_FLUSH_INTERVAL seconds and when the server stops.
+NPC_HISTORY_FLUSH_INTERVAL = 30
+# NPC brain: one global script wakes every NPC with an auto_act_interval,
+# each at its own offset within the interval. At most NPC_BRAIN_MAX_WAKES
+# NPCs are woken per second, and none once NPC_BRAIN_TIME_BUDGET seconds of
+# that second were spent; the rest wait for the next one.
+GLOBAL_SCRIPTS = {
+    "npc_brain": {"typeclass": "typeclasses.scripts.NPCBrain", "interval": 1, "persistent": True},
+    "history_flusher": {"typeclass": "typeclasses.scripts.HistoryFlusher",
+                        "interval": NPC_HISTORY_FLUSH_INTERVAL, "persistent": True},
+}
+NPC_BRAIN_MAX_WAKES = 20
+NPC_BRAIN_TIME_BUDGET = 0.05
+# NPCs only act while a player is at most this many exits away; the others
+# go dormant until one comes within range. "zone" means anywhere in the
+# same zone (the room's "zone" tag); None wakes NPCs regardless.
+NPC_INTEREST_RADIUS = 1
 
 ######################################################################
 # Settings given in secret_settings.py override those in this file.
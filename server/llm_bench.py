@@ -0,0 +1,223 @@
+"""
+Headless NPC load test.
+
+Spawns N LLMCharacters from the LLM_NPC prototype and M scripted players in
+a temporary room, drives NPC ticks and player speech for a while against
+the mock LLM backend (no API key or money needed), then reports LLM latency
+percentiles per request class and how long the reactor was stalled.
+
+Run from the game directory, with the server stopped:
+
+    python server/llm_bench.py --npcs 30 --players 10 --duration 60
+
+Use --backend openai to measure against the configured endpoint instead.
+All objects created by the run are deleted afterwards.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import django
+
+# Setup Django environment
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.conf.settings")
+django.setup()
+
+import evennia
+evennia._init()
+
+from django.conf import settings
+from twisted.internet import reactor, task
+from evennia.prototypes.spawner import spawn
+from evennia.utils import create
+from world import llm
+
+_PLAYER_LINES = [
+    "Hello there, {npc}!",
+    "{npc}, have you heard any news lately?",
+    "What do you know about the old watchtower, {npc}?",
+    "Any work for a traveler around here?",
+    "Where can I find the blacksmith?",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class Benchmark:
+    """
+    Drives the load and collects the measurements.
+    """
+
+    def __init__(self, npcs, players, duration, tick_interval, say_interval, stall_interval=0.05):
+        self.num_npcs = npcs
+        self.num_players = players
+        self.duration = duration
+        self.tick_interval = tick_interval
+        self.say_interval = say_interval
+        self.stall_interval = stall_interval
+        self.objects = []
+        self.loops = []
+        self.first_text = {}  # request class -> [seconds]
+        self.complete = {}  # request class -> [seconds]
+        self.empty = {}  # request class -> count of None replies
+        self.stalls = []
+        self._last_check = None
+
+    def setup(self):
+        self.room = create.create_object("typeclasses.rooms.Room", key="LLM Benchmark Room")
+        self.objects.append(self.room)
+        prototypes = [
+            {"prototype_parent": "LLM_NPC", "key": f"BenchNPC{i}", "location": self.room.dbref}
+            for i in range(self.num_npcs)
+        ]
+        self.npcs = spawn(*prototypes)
+        self.objects.extend(self.npcs)
+        self.players = [
+            create.create_object("typeclasses.characters.Character", key=f"BenchPlayer{i}",
+                                 location=self.room)
+            for i in range(self.num_players)
+        ]
+        self.objects.extend(self.players)
+
+    def instrument(self):
+        stream_response = llm.stream_response
+        get_response = llm.get_response
+
+        def _record(request_class, start, result):
+            self.complete.setdefault(request_class, []).append(time.time() - start)
+            if not result:
+                self.empty[request_class] = self.empty.get(request_class, 0) + 1
+            return result
+
+        def timed_stream_response(prompt, on_chunk, *args, **kwargs):
+            request_class = kwargs.get("request_class", llm.REPLY)
+            start = time.time()
+            seen = []
+
+            def _on_chunk(text, new_line):
+                if not seen:
+                    seen.append(True)
+                    self.first_text.setdefault(request_class, []).append(time.time() - start)
+                on_chunk(text, new_line)
+
+            d = stream_response(prompt, _on_chunk, *args, **kwargs)
+            d.addBoth(lambda result: _record(request_class, start, result))
+            return d
+
+        def timed_get_response(prompt, *args, **kwargs):
+            # not streamed: the first text is the whole reply
+            request_class = kwargs.get("request_class", llm.REPLY)
+            start = time.time()
+
+            def _done(result):
+                if result:
+                    self.first_text.setdefault(request_class, []).append(time.time() - start)
+                return _record(request_class, start, result)
+
+            return get_response(prompt, *args, **kwargs).addBoth(_done)
+
+        llm.stream_response = timed_stream_response
+        llm.get_response = timed_get_response
+
+    def _check_stall(self):
+        now = time.time()
+        if self._last_check is not None:
+            self.stalls.append(max(0.0, now - self._last_check - self.stall_interval))
+        self._last_check = now
+
+    def _start_loop(self, func, interval, *args):
+        loop = task.LoopingCall(func, *args)
+        self.loops.append(loop)
+        # spread the first calls over the interval, like a running server
+        reactor.callLater(random.uniform(0, interval), loop.start, interval, now=True)
+
+    def _player_says(self, player):
+        npc = random.choice(self.npcs)
+        player.execute_cmd("say " + random.choice(_PLAYER_LINES).format(npc=npc.key))
+
+    def start(self):
+        self._start_loop(self._check_stall, self.stall_interval)
+        for npc in self.npcs:
+            self._start_loop(npc.at_tick, self.tick_interval)
+        for player in self.players:
+            self._start_loop(self._player_says, self.say_interval, player)
+        reactor.callLater(self.duration, self.stop)
+
+    def stop(self):
+        for loop in self.loops:
+            if loop.running:
+                loop.stop()
+        # let in-flight requests finish so they are counted
+        reactor.callLater(5, reactor.stop)
+
+    def cleanup(self):
+        for obj in reversed(self.objects):
+            obj.delete()
+
+    def report(self):
+        print(f"\n{self.num_npcs} NPCs, {self.num_players} players, {self.duration}s, "
+              f"backend={getattr(settings, 'LLM_BACKEND', 'openai')}")
+        print("%-8s %6s %6s | %-26s | %-26s" % (
+            "class", "calls", "empty", "first text p50/p90/p99", "complete p50/p90/p99"))
+        for request_class in sorted(self.complete):
+            first = self.first_text.get(request_class, [])
+            done = self.complete[request_class]
+            print("%-8s %6d %6d | %7.3f %7.3f %7.3f    | %7.3f %7.3f %7.3f" % (
+                request_class, len(done), self.empty.get(request_class, 0),
+                percentile(first, 50), percentile(first, 90), percentile(first, 99),
+                percentile(done, 50), percentile(done, 90), percentile(done, 99)))
+        stalled = [stall for stall in self.stalls if stall > 0.005]
+        print("reactor stalls: %d over 5ms, max %.1fms, total %.2fs, p99 %.1fms" % (
+            len(stalled), max(self.stalls or [0]) * 1000, sum(stalled),
+            percentile(self.stalls, 99) * 1000))
+        stats = llm.get_stats()
+        print("cache: %(hits)d hits, %(misses)d misses" % stats["cache"])
+        print("coalescing: %(calls)d calls, %(coalesced)d avoided" % stats["coalesce"])
+        prompt = sum(row["prompt_tokens"] for row in stats["telemetry"]["classes"].values())
+        cached = sum(row["cached_tokens"] for row in stats["telemetry"]["classes"].values())
+        print("prompt tokens: %d, %d (%.0f%%) from the provider's prefix cache" % (
+            prompt, cached, cached * 100.0 / prompt if prompt else 0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test LLM NPCs.")
+    parser.add_argument("--npcs", type=int, default=30)
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--tick-interval", type=float, default=None,
+                        help="seconds between NPC ticks (default: the prototype's auto_act_interval)")
+    parser.add_argument("--say-interval", type=float, default=10,
+                        help="seconds between lines from each player")
+    parser.add_argument("--backend", default="mock", choices=("mock", "openai"))
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    settings.LLM_BACKEND = args.backend
+    if args.seed is not None:
+        settings.LLM_MOCK_OPTIONS = dict(getattr(settings, "LLM_MOCK_OPTIONS", {}), seed=args.seed)
+
+    bench = Benchmark(args.npcs, args.players, args.duration, args.tick_interval, args.say_interval)
+    try:
+        bench.setup()
+        if bench.tick_interval is None:
+            bench.tick_interval = bench.npcs[0].db.auto_act_interval if bench.npcs else 60
+        bench.instrument()
+        reactor.callWhenRunning(bench.start)
+        reactor.run()
+        bench.report()
+    finally:
+        bench.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,42 @@ from evennia.utils import logger
 from evennia.commands.cmdset import CmdSet
 from evennia.commands.default.muxcommand import MuxCommand as Command
 
+class _ShardWhisper:
+    """
+    Relays a streamed shard reply to its holder one sentence at a time.
+    The reply is dropped if the holder drops the shard, leaves the game or
+    asks the shard something else first.
+    """
+
+    def __init__(self, shard, holder):
+        self.shard = shard
+        self.holder = holder
+        self.deferred = None
+        self.started = False
+        self.turn = shard.ndb.whisper_turn = (shard.ndb.whisper_turn or 0) + 1
+
+    def is_valid(self):
+        return (self.shard.location == self.holder and bool(self.holder.sessions.count())
+                and self.shard.ndb.whisper_turn == self.turn)
+
+    def cancel(self):
+        if self.deferred and not self.deferred.called:
+            self.deferred.cancel()
+
+    def feed(self, text, new_line):
+        if not self.started:
+            self.started = True
+            text = f"The Shard whispers: {text}"
+        self.holder.msg(text)
+
+    def finish(self, response):
+        if not response and not self.started and self.is_valid():
+            self.holder.msg("The shard crackles, but says nothing.")
+
+    def fail(self, failure):
+        logger.log_trace(failure)
+        self.holder.msg("The shard screams in static.")
+
 class CmdTalkToShard(Command):
     """
     Talk to the shard.
@@ -31,17 +67,15 @@ class CmdTalkToShard(Command):
         self.caller.msg(f"You say to the shard: {msg}")
         self.caller.msg(f"The shard flickers with new colors...")
 
-        # Asynchronous LLM call
-        d = llm.get_response(prompt) # Helper function from world.llm
-        d.addCallback(self._handle_response)
-        d.addErrback(self._handle_error)
-
-    def _handle_response(self, response):
-        self.caller.msg(f"The Shard whispers: {response}")
-
-    def _handle_error(self, failure):
-        logger.log_trace(failure)
-        self.caller.msg("The shard screams in static.")
+        # Asynchronous LLM call, whispered sentence by sentence as it streams in
+        previous = shard.ndb.whisper
+        whisper = shard.ndb.whisper = _ShardWhisper(shard, self.caller)
+        if previous:
+            # it is stale now, so it ends quietly
+            previous.cancel()
+        whisper.deferred = llm.stream_response(prompt, whisper.feed, request_class=llm.SHARD,
+                                               source=shard, is_valid=whisper.is_valid)
+        whisper.deferred.addCallbacks(whisper.finish, whisper.fail)
 
 class ShardCmdSet(CmdSet):
     key = "ShardCmdSet"
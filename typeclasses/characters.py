@@ -7,11 +7,17 @@ is setup to be the "default" character type created by the default
 creation commands.
 
 """
+from evennia import GLOBAL_SCRIPTS
 from evennia.objects.objects import DefaultCharacter
 from world.gendersub import GenderCharacter
+from world import perception
+from world.presence import PRESENCE
 
+LEAVE_MSG = "{object} leaves {exit}."
+ARRIVE_MSG = "{object} arrives from the {exit}."
 
-class Character(GenderCharacter):
+
+class Character(perception.PerceptionMixin, GenderCharacter):
     """
     The Character defaults to reimplementing some of base Object's hook methods with the
     following functionality:
@@ -34,10 +40,54 @@ class Character(GenderCharacter):
 
 
     def announce_move_from(self, destination, msg=None, mapping=None):
-        super().announce_move_from(destination, msg="{object} leaves {exit}.")
+        super().announce_move_from(destination, msg=LEAVE_MSG)
 
     def announce_move_to(self, source_location, msg=None, mapping=None):
-        super().announce_move_to(source_location, msg="{object} arrives from the {exit}.")
+        super().announce_move_to(source_location, msg=ARRIVE_MSG)
+        if self.has_account and self.location:
+            self._prefetch_greetings()
+
+    def at_post_move(self, source_location, **kwargs):
+        super().at_post_move(source_location, **kwargs)
+        if self.has_account:
+            self._update_presence()
+
+    def at_post_puppet(self, **kwargs):
+        super().at_post_puppet(**kwargs)
+        self._update_presence()
+        # back on the grid from prelogout_location, which bypasses the room's hooks
+        perception.enter(self, self.location)
+
+    def at_post_unpuppet(self, account=None, session=None, **kwargs):
+        location = self.location
+        super().at_post_unpuppet(account=account, session=session, **kwargs)
+        if not self.has_account:
+            PRESENCE.remove(self)
+        if location and self.location is None:
+            perception.leave(self, location)
+
+    def _update_presence(self):
+        # keep the per-room player counts current and wake NPCs we come near
+        PRESENCE.place(self, self.location)
+        GLOBAL_SCRIPTS.npc_brain.wake_near(self.location)
+
+    def arrival_message(self, source_location, destination, looker):
+        """
+        The message `looker` in `destination` gets when this character
+        arrives there from `source_location`.
+        """
+        exits = [exit for exit in destination.exits if exit.destination == source_location]
+        return ARRIVE_MSG.format(object=self.get_display_name(looker),
+                                 exit=exits[0].get_display_name(looker) if exits else "somewhere")
+
+    def _prefetch_greetings(self):
+        # let NPCs one room away get their greeting ready in case we walk in
+        for exit in self.location.exits:
+            if not exit.destination or exit.destination == self.location:
+                continue
+            for obj in exit.destination.contents:
+                if hasattr(obj, "prefetch_greeting"):
+                    obj.prefetch_greeting(self, self.location)
 
 
     pass
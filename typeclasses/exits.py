@@ -7,9 +7,10 @@ for allowing Characters to traverse the exit to its destination.
 
 """
 from evennia.objects.objects import DefaultExit
+from world.perception import PerceptionMixin
 
 
-class Exit(DefaultExit):
+class Exit(PerceptionMixin, DefaultExit):
     """
     Exits are connectors between rooms. Exits are normal Objects except
     they defines the `destination` property. It also does work in the
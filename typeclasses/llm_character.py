@@ -1,9 +1,103 @@
+from collections import deque
+from django.conf import settings
+from twisted.internet import reactor
 from typeclasses.characters import Character
-from world import llm
+from world import history, llm
+from world.arbiter import arbiter_for, talked_with
+from world.behaviour import profile
+from world.llm_prompt import ago, build_system_prompt, build_turn, count_tokens
+from world.perception import digest_for
 from evennia.utils import logger
-from evennia import TICKER_HANDLER
+from evennia import GLOBAL_SCRIPTS
 import time
 
+_SUMMARY_SYSTEM_PROMPT = (
+    "You keep the memory of {name}, a character in a text-based fantasy world. "
+    "Write in the second person, as notes to {name}. Keep names, promises, debts, facts "
+    "learned and how {name} feels about people; drop small talk."
+)
+_SUMMARY_REQUEST = (
+    "Recent events so far:\n{summary}\n\nWhat happened since:\n{turns}\n\n"
+    "Rewrite the recent events to include what happened since, in at most 80 words."
+)
+_MERGE_REQUEST = (
+    "Long-term memory:\n{memory}\n\nRecent events:\n{summary}\n\n"
+    "Rewrite the long-term memory to include what matters from the recent events, "
+    "in at most 100 words."
+)
+# turns waiting for a summary kept at most, should summarizing keep failing
+_MAX_BACKLOG = 100
+
+
+class _StreamedReply:
+    """
+    Acts out an NPC reply line by line while it is still streaming in.
+
+    Speech is sent one sentence at a time. Emotes, whose later sentences
+    would not read as emotes on their own, and commands (for high-autonomy
+    NPCs) are only acted out once their whole line has arrived. Anything after an 'UPDATE_PROMPT:' marker is held back.
+    world.llm stops feeding it once the reply is no longer valid.
+    """
+
+    def __init__(self, npc):
+        self.npc = npc
+        self.deferred = None
+        self.cancelled = False
+        self.mode = None
+        self.pending = ""
+        self.held = False
+
+    def feed(self, text, new_line):
+        if self.cancelled or self.held:
+            return
+        if "UPDATE_PROMPT:" in text:
+            text = text.split("UPDATE_PROMPT:", 1)[0]
+            self.held = True
+        if new_line:
+            self._end_line()
+        text = text.strip()
+        if not text:
+            return
+
+        if self.mode is None:
+            lower = text.lower()
+            if text.upper() == "WAIT":
+                return
+            if lower.startswith("say "):
+                self.mode, text = "say", text[4:]
+            elif lower.startswith("emote "):
+                self.mode, text = "emote", text[6:]
+            elif text.startswith(":"):
+                self.mode, text = "emote", text[1:]
+            elif self.npc.db.llm_autonomy_level == "high":
+                self.mode = "command"
+            else:
+                self.mode = "say"
+
+        if self.mode == "say":
+            self.npc.execute_cmd(f"say {text}")
+        else:
+            self.pending = f"{self.pending} {text}"
+
+    def _end_line(self):
+        if self.mode == "emote" and self.pending.strip():
+            self.npc.execute_cmd(f"emote {self.pending.strip()}")
+        elif self.mode == "command" and self.pending.strip():
+            self.npc.execute_cmd(self.pending.strip())
+        self.mode = None
+        self.pending = ""
+
+    def close(self):
+        if self.cancelled:
+            return
+        self._end_line()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.deferred and not self.deferred.called:
+            self.deferred.cancel()
+
+
 class LLMCharacter(Character):
     """
     A Character that uses an LLM to generate responses to messages and act autonomously.
@@ -14,28 +108,46 @@ class LLMCharacter(Character):
         self.db.npc_prompt = "You are a generic NPC in a fantasy world. You are helpful and polite."
         self.db.llm_enabled = True
         self.db.llm_cooldown = 5 # seconds
-        self.db.chat_history = [] # List of {role, content}
+        self.db.chat_history = [] # List of {role, content}; saved copy of the in-memory history
         self.db.memory_size = 10
         self.db.auto_act_interval = 0 # 0 = disabled.
         self.db.llm_autonomy_level = "low" # "low", "high"
         self.db.personality_growth = False # boolean
+        self.db.llm_cache = True # False to always ask the LLM afresh
+        self.db.llm_token_budget = None # prompt size in tokens, None = LLM_PROMPT_TOKEN_BUDGET
+        self.db.llm_tier = None # LLM_TIERS entry to use, None = LLM_CLASS_TIERS
+        self.db.permanent_memory = "" # slow-changing summary of past events, part of the system prompt
+        self.db.memory_summary = "" # rolling summary of recent events, folded into permanent_memory
+        self.db.llm_prefetch = False # generate greetings for players in neighbouring rooms ahead of time
+        self.db.llm_priority = 0 # higher answers first when several NPCs hear the same thing
 
         # Initialize ticker if enabled
         if self.db.auto_act_interval > 0:
             self.start_ticker()
 
     def start_ticker(self):
+        """
+        Have the NPC brain call at_tick every auto_act_interval seconds. Call this again after
+        changing auto_act_interval.
+        """
         if self.db.auto_act_interval > 0:
-             TICKER_HANDLER.add(self.db.auto_act_interval, self.at_tick, idstring=f"llm_tick_{self.id}")
+            GLOBAL_SCRIPTS.npc_brain.add_npc(self, self.db.auto_act_interval)
 
     def stop_ticker(self):
-        TICKER_HANDLER.remove(idstring=f"llm_tick_{self.id}")
+        GLOBAL_SCRIPTS.npc_brain.remove_npc(self)
+
+    def at_object_delete(self):
+        self.stop_ticker()
+        if self.ndb.chatter_timer and self.ndb.chatter_timer.active():
+            self.ndb.chatter_timer.cancel()
+        history.discard(self)
+        return super().at_object_delete()
 
     def at_tick(self):
         """
-        Called by the ticker.
+        Called by the NPC brain (typeclasses.scripts.NPCBrain).
         """
-        if not self.db.llm_enabled:
+        if not profile(self).enabled:
             return
 
         if not self.location:
@@ -45,35 +157,97 @@ class LLMCharacter(Character):
         if time.time() - (self.ndb.last_response_time or 0) < self.db.auto_act_interval:
             return
 
-        # Prompt construction based on autonomy level
+        # Still busy with something
+        if self.ndb.llm_reply and not self.ndb.llm_reply.deferred.called:
+            return
+
+        # Prompt construction based on autonomy level. The instruction text never changes;
+        # the facts of the moment come after it, so the prompt prefix stays cacheable.
         if self.db.llm_autonomy_level == "high":
-            prompt = (
-                f"You are in {self.location.key}. "
-                f"You have full autonomy. "
-                f"Do you want to take an action? "
-                f"Reply with a command like 'look', 'get <item>', 'drop <item>', 'move <direction>', "
-                f"or 'say <text>', 'emote <text>'. "
-                f"Reply 'WAIT' to do nothing."
+            instruction = (
+                "You have full autonomy. "
+                "Do you want to take an action? "
+                "Reply with a command like 'look', 'get <item>', 'drop <item>', 'move <direction>', "
+                "or 'say <text>', 'emote <text>'. "
+                "Reply 'WAIT' to do nothing."
             )
         else:
-            prompt = f"You are in {self.location.key}. It is quiet. Do you want to do something? Reply with an emote or say, or 'WAIT' to do nothing."
+            instruction = "It is quiet. Do you want to do something? Reply with an emote or say, or 'WAIT' to do nothing."
+        facts = [("Location", self.location.key)] + digest_for(self.location).facts(self)
+        prompt = build_turn(instruction, facts)
 
-        d = llm.get_response(prompt, system_prompt=self._get_system_prompt(), history=self.db.chat_history)
-        d.addCallback(self._handle_llm_action)
-        d.addErrback(self._handle_llm_error)
+        location = self.location
+        turn = self._next_turn()
+        self._stream_llm_action(prompt, self._get_system_prompt(), llm.AMBIENT,
+                                lambda: self.location == location and self.ndb.llm_turn == turn)
 
     def _get_system_prompt(self):
-        base_prompt = self.db.npc_prompt
+        # persona, rules, then memory: ordered from least to most often changing
+        rules = list(getattr(settings, "LLM_WORLD_RULES", ()))
         if self.db.personality_growth:
-            base_prompt += (
-                "\n\n[System: You are currently 'Awakened'. You can evolve your personality. "
-                "If recent events change your outlook, append 'UPDATE_PROMPT: <new personality description>' to your response.]"
+            rules.append(
+                "You are currently 'Awakened'. You can evolve your personality. "
+                "If recent events change your outlook, append 'UPDATE_PROMPT: <new personality description>' to your response."
             )
-        return base_prompt
+        return build_system_prompt(self.db.npc_prompt, rules, self.db.permanent_memory, self.db.memory_summary)
+
+    def _next_turn(self):
+        """
+        Starts a new turn: whatever the LLM is still working on for us is stale now.
+        Returns the turn number.
+        """
+        self.ndb.llm_turn = (self.ndb.llm_turn or 0) + 1
+        if self.ndb.llm_reply:
+            self.ndb.llm_reply.cancel()
+            self.ndb.llm_reply = None
+        return self.ndb.llm_turn
+
+    def _stream_llm_action(self, prompt, system_prompt, request_class, is_valid, question=None, history=None,
+                           asker=None):
+        """
+        Asks the LLM and acts out the reply sentence by sentence as it streams in.
+        The request is dropped, or the stream stopped, once 'is_valid()' returns False.
+        'question' is what 'asker' (a player) asked, for the semantic cache. 'history' defaults
+        to our chat history.
+        """
+        reply = _StreamedReply(self)
+        if history is None:
+            history = self._history().messages()
+        d = llm.stream_response(prompt, reply.feed, system_prompt=system_prompt, history=history,
+                                request_class=request_class, use_cache=self.db.llm_cache is not False,
+                                token_budget=self.db.llm_token_budget, tier=self.db.llm_tier,
+                                source=self, question=question, asker=asker, is_valid=is_valid)
+        reply.deferred = d
+        self.ndb.llm_reply = reply
+        d.addCallback(self._handle_streamed_action, reply)
+        d.addErrback(self._handle_llm_error)
+
+    def start_reply(self):
+        """
+        Returns an object that acts out, as it streams in, a reply of ours generated along with
+        other NPCs' (world.arbiter.group_respond). Call its feed(text, new_line) and close().
+        """
+        return _StreamedReply(self)
+
+    def _handle_streamed_action(self, response, reply):
+        if reply.cancelled or not response:
+            return
+        # the text was already acted out while streaming; only record it
+        self._process_llm_text(response)
+        reply.close()
 
     def _handle_llm_action(self, response):
+        response = self._process_llm_text(response)
+        if response:
+            self._execute_llm_response(response)
+
+    def _process_llm_text(self, response):
+        """
+        Applies any personality update in the response and records it in the history.
+        Returns the text to act on, or None if there is nothing to do.
+        """
         if not response:
-             return
+             return None
 
         # Check for prompt update
         if "UPDATE_PROMPT:" in response:
@@ -85,16 +259,16 @@ class LLMCharacter(Character):
                 self.msg(f"(Internal: Personality Updated to: {new_prompt[:50]}...)")
 
             if not response_text:
-                return
+                return None
             response = response_text
 
         if response.strip().upper() == "WAIT":
-            return
+            return None
 
         # Append action to history
         self._append_to_history("assistant", response)
 
-        self._execute_llm_response(response)
+        return response
 
     def _execute_llm_response(self, response):
         """
@@ -132,57 +306,263 @@ class LLMCharacter(Character):
         """
         super().msg(text, from_obj=from_obj, session=session, **kwargs)
 
-        if not self.db.llm_enabled or not from_obj or from_obj == self:
+        if not from_obj or from_obj == self:
+            return
+
+        # Attributes come from the cached profiles (world.behaviour), not the Attribute handler
+        if not profile(self).enabled:
             return
 
         # Prevent bot-to-bot loops
-        if hasattr(from_obj, 'db') and from_obj.db.llm_enabled:
+        if hasattr(from_obj, 'ndb') and profile(from_obj).enabled:
              return
 
-        # Cooldown check
-        last_response = self.ndb.last_response_time or 0
-        if time.time() - last_response < (self.db.llm_cooldown or 5):
-            return
-
         msg_text = text
         if isinstance(text, tuple):
             msg_text = text[0]
 
         if hasattr(from_obj, 'location') and from_obj.location == self.location:
-             self.respond_to(msg_text, from_obj)
+             self.hear(msg_text, from_obj)
 
-    def respond_to(self, text, speaker):
+    def hear(self, text, speaker):
+        """
+        Collects what is said around us and answers it all in one turn once LLM_CHATTER_WINDOW
+        seconds have passed since the first line. With LLM_ROOM_ARBITER on, the room's arbiter
+        collects it instead and decides which of the NPCs here answer (world.arbiter).
+        """
         if not text:
             return
+        # read our long-term memories while the chatter window is open
+        llm.preload_memories(self)
+        arbiter = arbiter_for(self.location)
+        if arbiter:
+            arbiter.hear(self, speaker, text)
+        else:
+            self.answer_later([(speaker, text)], getattr(settings, "LLM_CHATTER_WINDOW", 0.75))
+
+    def answer_later(self, lines, window=0):
+        """
+        Answer the (speaker, text) 'lines', along with anything else we hear meanwhile, in
+        'window' seconds or once our cooldown is over. With LLM_CHATTER_MAX_LINES lines waiting
+        we answer right away if the cooldown allows; until then, new lines push out the oldest.
+        """
+        heard = self.ndb.heard
+        if heard is None:
+            heard = self.ndb.heard = deque(maxlen=getattr(settings, "LLM_CHATTER_MAX_LINES", 6))
+        heard.extend(lines)
+
+        cooldown = profile(self).cooldown - (time.time() - (self.ndb.last_response_time or 0))
+        timer = self.ndb.chatter_timer
+        if len(heard) == heard.maxlen and cooldown <= 0:
+            if timer and timer.active():
+                timer.cancel()
+            self._answer_heard()
+        elif not (timer and timer.active()):
+            wait = max(window, cooldown)
+            self.ndb.chatter_timer = reactor.callLater(wait, self._answer_heard)
+
+    def _answer_heard(self):
+        self.ndb.chatter_timer = None
+        heard, self.ndb.heard = self.ndb.heard, None
+        if not self.pk or not self.location or not profile(self).enabled:
+            return
+        lines = [(speaker, text) for speaker, text in heard or () if speaker.location == self.location]
+        if lines:
+            self._respond(lines)
 
+    def respond_to(self, text, speaker):
+        if text:
+            self._respond([(speaker, text)])
+
+    def overhear(self, lines):
+        """
+        Lines said in our room that another NPC answers. We only remember them.
+        """
+        self._append_to_history("user", "\n".join(f"{speaker.key} says: {text}" for speaker, text in lines))
+
+    def _respond(self, lines):
+        """
+        Answer 'lines', a list of (speaker, text) said to us, in one turn.
+        """
         self.ndb.last_response_time = time.time()
 
         # Update History
-        user_input = f"{speaker.key} says: {text}"
+        user_input = "\n".join(f"{speaker.key} says: {text}" for speaker, text in lines)
         self._append_to_history("user", user_input)
 
         system_prompt = self._get_system_prompt()
-        # Pass history to get_response
-        d = llm.get_response(user_input, system_prompt=system_prompt, history=self.db.chat_history)
-
-        d.addCallback(self._handle_llm_response)
-        d.addErrback(self._handle_llm_error)
-
-    def _handle_llm_response(self, response):
-        # Re-use the action handler which parses prompt updates and executes
-        if response:
-            self._handle_llm_action(response)
+        query = " ".join(text for _, text in lines)
+        prompt, history = self._with_memories(user_input, query, self._history().messages())
+        # Drop the reply if all speakers leave, we move or someone says something else first
+        location = self.location
+        speakers = [speaker for speaker, _ in lines]
+        talked_with(self, speakers)
+        turn = self._next_turn()
+        self._stream_llm_action(prompt, system_prompt, llm.REPLY,
+                                lambda: (self.location == location and self.ndb.llm_turn == turn
+                                         and any(speaker.location == location for speaker in speakers)),
+                                question=query if len(lines) == 1 else None, asker=speakers[0],
+                                history=history)
+
+    def _with_memories(self, user_input, query, history):
+        """
+        Returns the prompt and history to send for 'user_input', the last turn of 'history',
+        with the things we remember that are relevant to 'query' added to the prompt (but
+        not to the history).
+        """
+        memories = llm.recall(self, query)
+        if not memories:
+            return user_input, history
+        now = time.time()
+        facts = [("You remember", f"{text} ({ago(now - created)})") for created, text in memories]
+        return build_turn(user_input, facts), history[:-1]
+
+    def prefetch_greeting(self, player, source_location):
+        """
+        Called when 'player' enters 'source_location', next to our room. Starts generating
+        our reply to them walking in, so that it is ready if they do.
+        """
+        own = profile(self)
+        if not own.enabled or not own.prefetch or self.db.llm_cache is False:
+            return
+        if not self.location or profile(player).enabled:
+            return
+        text = player.arrival_message(source_location, self.location, self)
+        user_input = f"{player.key} says: {text}"
+        prompt, history = self._with_memories(user_input, text, self._history_with("user", user_input))
+        llm.prefetch(prompt, self._get_system_prompt(), history=history,
+                     request_class=llm.REPLY, token_budget=self.db.llm_token_budget, tier=self.db.llm_tier,
+                     source=self)
 
     def _handle_llm_error(self, failure):
         logger.log_trace(failure)
 
-    def _append_to_history(self, role, content):
-        if not self.db.chat_history:
-            self.db.chat_history = []
+    def _history(self):
+        """
+        Returns the in-memory ChatHistory, loading it from db.chat_history on first use.
+        """
+        # memory_size only bounds what is stored; how much of it goes into a
+        # prompt is decided by the token budget in world.llm
+        size = self.db.memory_size or 10
+        chat = self.ndb.chat_history
+        if chat is None:
+            chat = self.ndb.chat_history = history.ChatHistory(self.db.chat_history or [], size)
+        else:
+            chat.resize(size)
+        return chat
 
-        self.db.chat_history.append({"role": role, "content": content})
+    def _history_with(self, role, content):
+        """
+        Returns the chat history as it will be once 'content' is appended to it.
+        """
+        return self._history().messages((role, content))
 
-        # Trim
-        limit = self.db.memory_size or 10
-        if len(self.db.chat_history) > limit:
-            self.db.chat_history = self.db.chat_history[-limit:]
+    def _append_to_history(self, role, content):
+        # saved to db.chat_history with the next flush, not right away
+        dropped = self._history().append(role, content)
+        history.mark_dirty(self)
+        if dropped:
+            self._archive_turns([dropped])
+        self.summarize_memory()
+
+    def _archive_turns(self, turns, summarized=False):
+        """
+        Turns leaving the chat history: what players said goes into our episodic memory, and
+        all of it into the next summary unless 'summarized' already.
+        """
+        for role, content in turns:
+            if role == "user":
+                llm.remember(self, content)
+        if getattr(settings, "LLM_MEMORY", None) and not summarized:
+            backlog = (self.ndb.memory_backlog or []) + list(turns)
+            self.ndb.memory_backlog = backlog[-_MAX_BACKLOG:]
+
+    def summarize_memory(self):
+        """
+        Once the chat history, with the turns that already left it (pushed out by memory_size) and
+        are not summarized yet, is longer than LLM_MEMORY["history_tokens"], fold all but the
+        last LLM_MEMORY["keep_tokens"] of it into db.memory_summary. Once that is longer than
+        LLM_MEMORY["summary_tokens"], merge it into db.permanent_memory. Both run as low-priority
+        SUMMARY requests in the background. The turns being summarized stay in the chat history,
+        and so in our replies, until their summary is stored; if summarizing fails, they are
+        tried again after the next turn.
+        """
+        conf = getattr(settings, "LLM_MEMORY", None)
+        if not conf or self.ndb.summarizing:
+            return
+        chat = self._history()
+        backlog = list(self.ndb.memory_backlog or [])
+        tokens = sum(count_tokens(content) for _, content in chat.turns)
+        backlog_tokens = sum(count_tokens(content) for _, content in backlog)
+        if tokens + backlog_tokens <= conf["history_tokens"]:
+            # not worth a call yet; the backlog waits for more
+            return
+        leaving = []
+        for turn in chat.turns:
+            if len(chat) - len(leaving) <= 1 or tokens <= conf["keep_tokens"]:
+                break
+            leaving.append(turn)
+            tokens -= count_tokens(turn[1])
+        turns = backlog + leaving
+        if not turns:
+            return
+        self.ndb.summarizing = True
+        request = _SUMMARY_REQUEST.format(
+            summary=self.db.memory_summary or "(nothing yet)",
+            turns="\n".join(content if role == "user" else f"{self.key}: {content}" for role, content in turns))
+        d = self._ask_memory(request)
+        d.addCallbacks(self._store_summary, self._memory_failed, callbackArgs=(backlog, leaving, conf))
+
+    def _forget_summarized(self, backlog, leaving):
+        """
+        Drop the turns just summarized: the 'backlog' turns from the head of the backlog, and the
+        'leaving' turns from the head of the chat history, or from the backlog if they were pushed
+        out there meanwhile.
+        """
+        remaining = list(self.ndb.memory_backlog or [])
+        for turn in backlog:
+            # turns only join the backlog at its end, but the oldest may have been cut meanwhile
+            if remaining and remaining[0] is turn:
+                remaining.pop(0)
+        chat = self._history()
+        popped = []
+        for turn in leaving:
+            if remaining and remaining[0] is turn:
+                remaining.pop(0)
+            elif chat.turns and chat.turns[0] is turn:
+                popped.append(chat.pop_oldest())
+            else:
+                break
+        self.ndb.memory_backlog = remaining
+        if popped:
+            history.mark_dirty(self)
+            self._archive_turns(popped, summarized=True)
+
+    def _ask_memory(self, request):
+        return llm.get_response(request, system_prompt=_SUMMARY_SYSTEM_PROMPT.format(name=self.key),
+                                request_class=llm.SUMMARY, use_cache=False, source=self)
+
+    def _store_summary(self, summary, backlog, leaving, conf):
+        if not summary:
+            self._memory_failed(None)
+            return
+        self.db.memory_summary = summary
+        self._forget_summarized(backlog, leaving)
+        if count_tokens(summary) <= conf["summary_tokens"]:
+            self.ndb.summarizing = False
+            return
+        request = _MERGE_REQUEST.format(memory=self.db.permanent_memory or "(nothing yet)", summary=summary)
+        d = self._ask_memory(request)
+        d.addCallbacks(self._store_permanent_memory, self._memory_failed)
+
+    def _store_permanent_memory(self, memory):
+        if memory:
+            self.db.permanent_memory = memory
+            self.db.memory_summary = ""
+        self.ndb.summarizing = False
+
+    def _memory_failed(self, failure):
+        if failure is not None:
+            logger.log_trace(failure)
+        # nothing was dropped; try again after the next turn
+        self.ndb.summarizing = False
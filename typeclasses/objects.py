@@ -11,6 +11,7 @@ inheritance.
 
 """
 from evennia.objects.objects import DefaultObject
+from world.perception import PerceptionMixin
 from collections import defaultdict
 from django.utils.translation import gettext as _
 from evennia.utils.utils import (
@@ -23,7 +24,7 @@ from evennia.utils.utils import (
 )
 
 
-class Object(DefaultObject):
+class Object(PerceptionMixin, DefaultObject):
     """
     This is the root typeclass object, implementing an in-game Evennia
     game object, such as having a location, being able to be
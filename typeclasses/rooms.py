@@ -6,6 +6,7 @@ Rooms are simple containers that has no location of their own.
 """
 
 from evennia.objects.objects import DefaultRoom
+from world.perception import digest_for
 
 
 class Room(DefaultRoom):
@@ -19,4 +20,15 @@ class Room(DefaultRoom):
     properties and methods available on all Objects.
     """
 
-    pass
+    def at_object_receive(self, moved_obj, source_location, **kwargs):
+        super().at_object_receive(moved_obj, source_location, **kwargs)
+        # keep the NPCs' view of the room current (world.perception)
+        digest = digest_for(self, build=False)
+        if digest:
+            digest.add(moved_obj)
+
+    def at_object_leave(self, moved_obj, target_location, **kwargs):
+        super().at_object_leave(moved_obj, target_location, **kwargs)
+        digest = digest_for(self, build=False)
+        if digest:
+            digest.remove(moved_obj)
@@ -12,7 +12,15 @@ just overloads its hooks to have it perform its function.
 
 """
 
-from evennia import DefaultScript
+import time
+
+from django.conf import settings
+from evennia import DefaultScript, TICKER_HANDLER
+from evennia.objects.models import ObjectDB
+from evennia.utils import logger
+from world import history, llm
+from world.brain import WakeSchedule
+from world.presence import PRESENCE, rooms_within, zone_of
 
 
 class Script(DefaultScript):
@@ -90,3 +98,141 @@ class Script(DefaultScript):
     """
 
     pass
+
+
+class NPCBrain(Script):
+    """
+    Global script that wakes every NPC with an auto_act_interval (calls its
+    `at_tick`) from one heap of wake-up times. At most NPC_BRAIN_MAX_WAKES
+    NPCs are woken per second, and no more once NPC_BRAIN_TIME_BUDGET
+    seconds were spent; NPCs left over are woken on the next second.
+
+    An NPC with no player within NPC_INTEREST_RADIUS when it is due goes
+    dormant: it is taken off the heap until a player comes within range.
+
+    The NPCs and their intervals are kept in `db.members`; the heap itself
+    only lives in memory and is rebuilt when the script starts.
+    """
+
+    def at_script_creation(self):
+        self.key = "npc_brain"
+        self.desc = "Wakes NPCs that act on their own"
+        self.interval = 1
+        self.persistent = True
+        self.db.members = {}
+        # take over NPCs that were set up with a ticker each
+        from typeclasses.llm_character import LLMCharacter
+        for npc in LLMCharacter.objects.all_family():
+            if npc.db.auto_act_interval:
+                TICKER_HANDLER.remove(npc.db.auto_act_interval, npc.at_tick, idstring=f"llm_tick_{npc.id}")
+                self.add_npc(npc, npc.db.auto_act_interval)
+
+    def at_start(self, **kwargs):
+        members = dict(self.db.members or {})
+        self.ndb.schedule = WakeSchedule()
+        self.ndb.npcs = {}
+        self.ndb.dormant = {}
+        for npc in ObjectDB.objects.filter(id__in=list(members)):
+            self.ndb.npcs[npc.id] = npc
+            self.ndb.schedule.add(npc.id, members[npc.id])
+        for gone in set(members) - set(self.ndb.npcs):
+            del self.db.members[gone]
+
+    def _schedule(self):
+        if self.ndb.schedule is None:
+            self.at_start()
+        return self.ndb.schedule
+
+    def add_npc(self, npc, interval):
+        """
+        Wake `npc` every `interval` seconds from now on, replacing any
+        schedule it had.
+        """
+        self._schedule().add(npc.id, interval)
+        self.ndb.npcs[npc.id] = npc
+        self.ndb.dormant.pop(npc.id, None)
+        self.db.members[npc.id] = interval
+
+    def remove_npc(self, npc):
+        self._schedule().remove(npc.id)
+        self.ndb.npcs.pop(npc.id, None)
+        self.ndb.dormant.pop(npc.id, None)
+        if npc.id in (self.db.members or {}):
+            del self.db.members[npc.id]
+
+    def interval_of(self, npc):
+        """
+        Returns:
+            float or None: Seconds between `npc`'s wake-ups, None if it is not scheduled.
+        """
+        return self._schedule().interval(npc.id)
+
+    def wake_near(self, room):
+        """
+        A player arrived in `room`: wake the dormant NPCs it is in range of.
+        """
+        schedule = self._schedule()
+        if not self.ndb.dormant or room is None:
+            return
+        radius = getattr(settings, "NPC_INTEREST_RADIUS", 1)
+        zone = zone_of(room) if radius == "zone" else None
+        if zone:
+            in_range = lambda location: zone_of(location) == zone
+        else:
+            # a room without a zone only counts itself
+            rooms = rooms_within(room, 0 if radius == "zone" else radius)
+            in_range = lambda location: location in rooms
+        for npc_id, npc in list(self.ndb.dormant.items()):
+            if in_range(npc.location):
+                del self.ndb.dormant[npc_id]
+                schedule.add(npc_id, self.db.members.get(npc_id, npc.db.auto_act_interval))
+
+    def stats(self):
+        schedule = self._schedule()
+        return {
+            "awake": len(schedule),
+            "dormant": len(self.ndb.dormant),
+            "presence": PRESENCE.stats(),
+        }
+
+    def at_repeat(self, **kwargs):
+        max_wakes = getattr(settings, "NPC_BRAIN_MAX_WAKES", 20)
+        budget = getattr(settings, "NPC_BRAIN_TIME_BUDGET", 0.05)
+        radius = getattr(settings, "NPC_INTEREST_RADIUS", 1)
+        started = time.perf_counter()
+        woken = 0
+        for npc_id in self._schedule().pop_due():
+            npc = self.ndb.npcs.get(npc_id)
+            if npc is None or not npc.pk:
+                self.ndb.schedule.remove(npc_id)
+                continue
+            if radius is not None and not PRESENCE.observed(npc.location, radius):
+                # nobody around to see it; sleep until someone comes near
+                self.ndb.schedule.remove(npc_id)
+                self.ndb.dormant[npc_id] = npc
+                continue
+            try:
+                npc.at_tick()
+            except Exception:
+                logger.log_trace()
+            woken += 1
+            if woken >= max_wakes or time.perf_counter() - started > budget:
+                break
+
+
+class HistoryFlusher(Script):
+    """
+    Global script that writes changed NPC chat histories back to the
+    database, and changed episodic memories to their files, every
+    NPC_HISTORY_FLUSH_INTERVAL seconds.
+    """
+
+    def at_script_creation(self):
+        self.key = "history_flusher"
+        self.desc = "Saves NPC chat histories"
+        self.interval = getattr(settings, "NPC_HISTORY_FLUSH_INTERVAL", 30)
+        self.persistent = True
+
+    def at_repeat(self, **kwargs):
+        history.flush()
+        llm.flush_memories()
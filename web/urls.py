@@ -5,6 +5,7 @@ help.
 
 """
 from django.urls import re_path as url, include
+from web import views
 
 # default evennia patterns
 from evennia.web.urls import urlpatterns
@@ -12,6 +13,7 @@ from evennia.web.urls import urlpatterns
 # eventual custom patterns
 custom_patterns = [
     # url(r'/desired/url/', view, name='example'),
+    url(r"^llm/stats/$", views.llm_stats, name="llm_stats"),
 ]
 
 # this is required by Django.
@@ -0,0 +1,16 @@
+"""
+Custom views for the game website.
+
+"""
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from world import llm
+
+
+@staff_member_required
+def llm_stats(request):
+    """
+    LLM pipeline statistics (scheduler, cache, backends and call
+    telemetry) as JSON, the same data the `llmstatus` command shows.
+    """
+    return JsonResponse(llm.get_stats())
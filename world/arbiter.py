@@ -0,0 +1,248 @@
+"""
+Room conversation arbiter
+
+Every LLM NPC in a room hears every line said there. Left alone, each of
+them would answer, costing one LLM call per NPC and burying players in
+replies. Instead, NPCs hand what they hear to their room's arbiter, which
+collects the room's chatter for LLM_CHATTER_WINDOW seconds and then scores
+the NPCs that heard it:
+
+- being named (key or alias) in what was said: NAME_WEIGHT
+- having answered one of the speakers recently: up to RECENCY_WEIGHT,
+  halving every RECENCY_HALF_LIFE seconds
+- their llm_priority Attribute (an innkeeper answers before a guest)
+
+The best scoring NPC answers, and up to LLM_ROOM_ARBITER["max_speakers"]
+in all if they score at least "min_score"; the others just add what was
+said to their chat history. With "group_reply" set, several winners
+answer together from a single streamed LLM call.
+
+"""
+import re
+import time
+from collections import deque
+
+from django.conf import settings
+from evennia.utils import logger
+from twisted.internet import reactor
+from world import llm
+from world.behaviour import profile
+from world.llm_prompt import ago, build_system_prompt, build_turn
+
+NAME_WEIGHT = 10.0
+RECENCY_WEIGHT = 5.0
+RECENCY_HALF_LIFE = 120.0
+
+_GROUP_SYSTEM_PROMPT = (
+    "You voice several characters in a text-based fantasy world. Answer what was just said "
+    "as one or more of them, one line per character, as 'Name: say <words>' or "
+    "'Name: emote <action>'. Leave out characters who would have nothing to add."
+)
+
+_stats = {"rounds": 0, "replies": 0, "group_replies": 0, "overheard": 0}
+
+
+def talked_with(npc, speakers, now=None):
+    """
+    Note that `npc` just answered `speakers`, for the recency score.
+    """
+    now = time.time() if now is None else now
+    partners = npc.ndb.llm_partners or {}
+    for speaker in speakers:
+        partners[speaker.id] = now
+    npc.ndb.llm_partners = partners
+
+
+def score(npc, lines, now=None):
+    """
+    Returns:
+        float: How much the `(speaker, text)` lines are addressed to `npc`.
+    """
+    now = time.time() if now is None else now
+    text = " ".join(text for _, text in lines).lower()
+    names = [npc.key] + list(npc.aliases.all())
+    total = float(profile(npc).priority)
+    if any(re.search(rf"\b{re.escape(name.lower())}\b", text) for name in names if name):
+        total += NAME_WEIGHT
+    partners = npc.ndb.llm_partners or {}
+    last = max((partners.get(speaker.id, 0) for speaker, _ in lines), default=0)
+    if last:
+        total += RECENCY_WEIGHT * 2 ** (-(now - last) / RECENCY_HALF_LIFE)
+    return total
+
+
+class RoomArbiter:
+    """
+    Collects the chatter of one room and decides which NPCs answer it.
+    """
+
+    def __init__(self, room):
+        self.room = room
+        self.lines = deque(maxlen=getattr(settings, "LLM_CHATTER_MAX_LINES", 6))
+        self.listeners = {}  # NPC id -> NPC
+        self.timer = None
+        # the line being broadcast, and the ids of the NPCs that heard it so far
+        self._last = None
+        self._last_heard = set()
+
+    def hear(self, npc, speaker, text):
+        """
+        `npc` heard `speaker` say `text`. Every NPC in the room reports
+        the same broadcast line; it is only collected once.
+        """
+        self.listeners[npc.id] = npc
+        if self._last != (speaker.id, text) or npc.id in self._last_heard:
+            self.lines.append((speaker, text))
+            self._last = (speaker.id, text)
+            self._last_heard = set()
+        self._last_heard.add(npc.id)
+        if not (self.timer and self.timer.active()):
+            self.timer = reactor.callLater(getattr(settings, "LLM_CHATTER_WINDOW", 0.75), self.decide)
+
+    def decide(self):
+        self.timer = None
+        lines = [(speaker, text) for speaker, text in self.lines if speaker.location == self.room]
+        npcs = [npc for npc in self.listeners.values()
+                if npc.pk and npc.location == self.room and profile(npc).enabled]
+        self.lines.clear()
+        self.listeners = {}
+        self._last = None
+        if not lines or not npcs:
+            return
+        conf = getattr(settings, "LLM_ROOM_ARBITER", None) or {}
+        now = time.time()
+        ranked = sorted(npcs, key=lambda npc: score(npc, lines, now), reverse=True)
+        count = max(1, conf.get("max_speakers", 1))
+        # the best one always answers; the others only if the lines were meant for them too
+        min_score = conf.get("min_score", 3)
+        winners = ranked[:1] + [npc for npc in ranked[1:count] if score(npc, lines, now) >= min_score]
+        others = [npc for npc in ranked if npc not in winners]
+        _stats["rounds"] += 1
+        _stats["overheard"] += len(others)
+        for npc in others:
+            npc.overhear(lines)
+        if len(winners) > 1 and conf.get("group_reply"):
+            _stats["group_replies"] += 1
+            group_respond(winners, lines)
+        else:
+            _stats["replies"] += len(winners)
+            for npc in winners:
+                npc.answer_later(lines)
+
+
+def arbiter_for(room):
+    """
+    Returns:
+        RoomArbiter or None: The arbiter of `room`, None if LLM_ROOM_ARBITER
+            is off.
+    """
+    if room is None or not getattr(settings, "LLM_ROOM_ARBITER", None):
+        return None
+    arbiter = room.ndb.llm_arbiter
+    if arbiter is None:
+        arbiter = room.ndb.llm_arbiter = RoomArbiter(room)
+    return arbiter
+
+
+class _GroupReply:
+    """
+    Routes the lines of a streamed group reply ("Name: say ...") to the
+    NPCs they are for, each acting out its own lines as they arrive.
+    """
+
+    def __init__(self, npcs, is_current):
+        self.lead = npcs[0]
+        self.by_name = {npc.key.lower(): npc for npc in npcs}
+        self.is_current = is_current
+        self.replies = {}  # NPC id -> (NPC, its streamed reply, its lines)
+        self.current = None
+
+    def feed(self, text, new_line):
+        if new_line:
+            name, sep, rest = text.partition(":")
+            name = name.strip()
+            npc = self.by_name.get(name.lower()) if sep else None
+            self.current = None
+            if npc is not None:
+                text = rest
+            elif sep and len(name.split()) <= 3 and not name.lower().startswith(("say ", "emote ")):
+                # a line for someone who is not one of us
+                return
+            else:
+                # a line without a name (such as a fallback line): the first NPC says it
+                npc = self.lead
+            if not self.is_current(npc):
+                return
+            if npc.id not in self.replies:
+                self.replies[npc.id] = (npc, npc.start_reply(), [])
+            self.current = self.replies[npc.id]
+            text = text.strip()
+            if not (text.lower().startswith(("say ", "emote ")) or text.startswith(":") or text == "WAIT"):
+                text = f"say {text}"
+            self.current[2].append(text)
+        elif self.current is not None:
+            self.current[2][-1] += f" {text}"
+        if self.current is not None:
+            self.current[1].feed(text, new_line)
+
+    def close(self, response):
+        for npc, reply, lines in self.replies.values():
+            if response and self.is_current(npc):
+                reply.close()
+                # what each NPC said goes into its own history
+                npc._process_llm_text("\n".join(lines))
+
+
+def group_respond(npcs, lines):
+    """
+    Have `npcs` answer the `(speaker, text)` lines together, from one
+    streamed LLM call. The prompt has each NPC's persona and memories, the
+    first NPC's recent chat history and what each of them recalls about
+    the lines; each NPC acts out its own lines of the reply.
+    """
+    room = npcs[0].location
+    now = time.time()
+    user_input = "\n".join(f"{speaker.key} says: {text}" for speaker, text in lines)
+    query = " ".join(text for _, text in lines)
+    speakers = [speaker for speaker, _ in lines]
+    turns = {}
+    for npc in npcs:
+        npc.ndb.last_response_time = now
+        npc._append_to_history("user", user_input)
+        turns[npc.id] = npc._next_turn()
+        talked_with(npc, speakers, now)
+
+    characters = []
+    facts = []
+    for npc in npcs:
+        characters.append(f"{npc.key}: {(npc.db.npc_prompt or '').strip()}")
+        if npc.db.permanent_memory:
+            characters.append(f"{npc.key} remembers: {npc.db.permanent_memory.strip()}")
+        if npc.db.memory_summary:
+            characters.append(f"Lately, for {npc.key}: {npc.db.memory_summary.strip()}")
+        facts.extend((f"{npc.key} remembers", f"{text} ({ago(now - created)})")
+                     for created, text in llm.recall(npc, query))
+    system_prompt = build_system_prompt(f"{_GROUP_SYSTEM_PROMPT}\n\n" + "\n".join(characters),
+                                        getattr(settings, "LLM_WORLD_RULES", ()))
+    # the conversation as the first NPC heard it, with its own lines marked as such
+    lead = npcs[0]
+    history = [message if message["role"] == "user"
+               else {"role": "assistant", "content": f"{lead.key}: {message['content']}"}
+               for message in lead._history().messages()[:-1]]
+
+    def _current(npc):
+        return npc.location == room and npc.ndb.llm_turn == turns[npc.id]
+
+    reply = _GroupReply(npcs, _current)
+    d = llm.stream_response(build_turn(user_input, facts), reply.feed, system_prompt=system_prompt,
+                            history=history, request_class=llm.REPLY, token_budget=lead.db.llm_token_budget,
+                            tier=lead.db.llm_tier, source=lead,
+                            is_valid=lambda: (any(_current(npc) for npc in npcs)
+                                              and any(speaker.location == room for speaker in speakers)))
+    d.addCallback(reply.close)
+    d.addErrback(logger.log_trace)
+    return d
+
+
+def stats():
+    return dict(_stats)
@@ -0,0 +1,57 @@
+"""
+NPC behaviour profiles
+
+LLMCharacter.msg runs for every line an NPC hears: each emote, arrival
+and room broadcast. The Attributes it needs to decide whether to react at
+all are cached in a small profile in the object's ndb, so most lines are
+turned away without touching the Attribute handler.
+
+Profiles carry the generation they were built in. Saving or deleting one
+of the PROFILE_ATTRIBUTES, on any object, starts a new generation, and
+every profile is rebuilt the next time it is used. Those Attributes are
+only changed by builders, so this happens rarely.
+
+"""
+from django.db.models.signals import post_delete, post_save
+from evennia.typeclasses.attributes import Attribute
+
+PROFILE_ATTRIBUTES = ("llm_enabled", "llm_cooldown", "llm_prefetch", "llm_priority")
+
+_generation = 0
+
+
+class Profile:
+    """
+    What an object's Attributes say about how it reacts to what it hears.
+    """
+
+    __slots__ = ("enabled", "cooldown", "prefetch", "priority", "generation")
+
+    def __init__(self, obj, generation):
+        attributes = obj.attributes
+        self.enabled = bool(attributes.get("llm_enabled"))
+        self.cooldown = attributes.get("llm_cooldown") or 5
+        self.prefetch = bool(attributes.get("llm_prefetch"))
+        self.priority = attributes.get("llm_priority") or 0
+        self.generation = generation
+
+
+def profile(obj):
+    """
+    Returns:
+        Profile: The behaviour profile of `obj` (any typeclassed object).
+    """
+    cached = obj.ndb.llm_profile
+    if cached is None or cached.generation != _generation:
+        cached = obj.ndb.llm_profile = Profile(obj, _generation)
+    return cached
+
+
+def _invalidate(sender, instance, **kwargs):
+    global _generation
+    if instance.db_key in PROFILE_ATTRIBUTES:
+        _generation += 1
+
+
+post_save.connect(_invalidate, sender=Attribute, dispatch_uid="world.behaviour.save")
+post_delete.connect(_invalidate, sender=Attribute, dispatch_uid="world.behaviour.delete")
@@ -0,0 +1,86 @@
+"""
+NPC brain schedule
+
+A heap of next wake-up times for NPCs that act on their own every so many
+seconds. A single global script (typeclasses.scripts.NPCBrain) pops the
+NPCs that are due each second, instead of every NPC having its own ticker.
+Each NPC's wake-ups are offset by a fixed phase within its interval, so
+NPCs sharing an interval take turns instead of all waking in the same
+reactor tick.
+
+"""
+import heapq
+import itertools
+import time
+
+# multiplying ids by this (mod 1) spreads consecutive ids evenly
+_GOLDEN = 0.6180339887498949
+
+
+class WakeSchedule:
+    """
+    Next wake-up time per key. Changing a key's interval or removing it
+    leaves its old heap entry behind; stale entries are skipped when they
+    come up.
+    """
+
+    def __init__(self):
+        self._heap = []  # (wake time, seq, key)
+        self._intervals = {}  # key -> (interval, seq of its live heap entry)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __contains__(self, key):
+        return key in self._intervals
+
+    def interval(self, key):
+        entry = self._intervals.get(key)
+        return entry[0] if entry else None
+
+    def _push(self, key, interval, wake):
+        seq = next(self._counter)
+        self._intervals[key] = (interval, seq)
+        heapq.heappush(self._heap, (wake, seq, key))
+
+    def add(self, key, interval, now=None):
+        """
+        Wake `key` every `interval` seconds, replacing its current
+        schedule. The first wake-up is its phase into the interval.
+        """
+        now = time.time() if now is None else now
+        phase = (hash(key) * _GOLDEN) % 1.0
+        self._push(key, interval, now + phase * interval)
+
+    def remove(self, key):
+        self._intervals.pop(key, None)
+
+    def next_wake(self):
+        """
+        Returns:
+            float or None: When the next key is due, None if nothing is scheduled.
+        """
+        while self._heap:
+            wake, seq, key = self._heap[0]
+            if self._intervals.get(key, (None, None))[1] == seq:
+                return wake
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now=None):
+        """
+        Yields the keys that are due, earliest first, scheduling each one's
+        next wake-up as it goes. Keys not reached before the caller stops
+        iterating stay due.
+        """
+        now = time.time() if now is None else now
+        while True:
+            wake = self.next_wake()
+            if wake is None or wake > now:
+                return
+            _, _, key = heapq.heappop(self._heap)
+            interval = self._intervals[key][0]
+            # keep the phase, unless we fell a whole interval behind
+            self._push(key, interval, wake + interval if wake + interval > now else now + interval)
+            yield key
@@ -0,0 +1,99 @@
+"""
+NPC chat history
+
+LLM NPCs keep their recent conversation in memory, in a ring buffer that
+drops the oldest turn once it holds `memory_size` turns. Changed histories
+are only marked dirty; they are written back to the NPCs' `chat_history`
+Attributes in one transaction every NPC_HISTORY_FLUSH_INTERVAL seconds (by
+the typeclasses.scripts.HistoryFlusher global script) and when the server
+reloads or stops, rather than once per line spoken.
+
+"""
+from collections import deque
+
+from django.db import transaction
+from evennia.utils import logger
+
+# NPC id -> NPC whose history changed since the last flush
+_dirty = {}
+
+
+class ChatHistory:
+    """
+    The last `size` turns of a conversation, as (role, content) tuples.
+    """
+
+    __slots__ = ("turns",)
+
+    def __init__(self, messages=(), size=10):
+        self.turns = deque(((message["role"], message["content"]) for message in messages), maxlen=size)
+
+    def __len__(self):
+        return len(self.turns)
+
+    @property
+    def size(self):
+        return self.turns.maxlen
+
+    def resize(self, size):
+        if size != self.turns.maxlen:
+            self.turns = deque(self.turns, maxlen=size)
+
+    def pop_oldest(self):
+        return self.turns.popleft()
+
+    def append(self, role, content):
+        """
+        Returns:
+            tuple or None: The (role, content) turn that was pushed out to
+                make room, if any.
+        """
+        dropped = self.turns[0] if len(self.turns) == self.turns.maxlen else None
+        self.turns.append((role, content))
+        return dropped
+
+    def messages(self, extra=None):
+        """
+        Returns:
+            list: The turns as message dicts, oldest first, as they would be
+                with the (role, content) turn `extra` appended.
+        """
+        turns = list(self.turns)
+        if extra:
+            turns.append(extra)
+            turns = turns[-self.turns.maxlen:]
+        return [{"role": role, "content": content} for role, content in turns]
+
+
+def mark_dirty(npc):
+    _dirty[npc.id] = npc
+
+
+def discard(npc):
+    _dirty.pop(npc.id, None)
+
+
+def flush():
+    """
+    Write every changed history back to its NPC's `chat_history` Attribute.
+
+    Returns:
+        int: How many histories were written.
+    """
+    if not _dirty:
+        return 0
+    npcs = list(_dirty.values())
+    _dirty.clear()
+    try:
+        with transaction.atomic():
+            for npc in npcs:
+                history = npc.ndb.chat_history
+                if history is not None and npc.pk:
+                    npc.db.chat_history = history.messages()
+    except Exception:
+        logger.log_trace()
+        # keep them for the next flush
+        for npc in npcs:
+            _dirty.setdefault(npc.id, npc)
+        return 0
+    return len(npcs)
@@ -1,56 +1,198 @@
-import openai
+import random
+import time
 from django.conf import settings
+from twisted.internet import defer, threads
+from twisted.python.failure import Failure
 from evennia.utils import logger
-from evennia.utils.utils import run_async
+from evennia.utils.utils import class_from_module
+from world.llm_transport import HTTPTransport, LLMHTTPError
+from world.llm_mock import MockTransport
+from world.llm_scheduler import REPLY, SHARD, AMBIENT, PREFETCH, SUMMARY, DEFAULT_CLASSES, RequestScheduler
+from world.llm_cache import CacheStore, PrefetchStore, ResponseCache, request_digest
+from world.llm_singleflight import SingleFlight
+from world.llm_stream import SentenceChunker
+from world.llm_prompt import PromptStats, count_tokens, fit_messages
+from world.llm_ratelimit import RateLimiter
+from world.llm_semantic import SemanticCache, np
+from world.llm_episodic import MemoryBank
+from world.llm_resilience import CircuitBreaker, FallbackReply, LatencyTracker, hedge
+from world.llm_router import Backend, LLMRouter, NoBackendAvailable
+from world.llm_telemetry import CallRecord, Telemetry
+
+# completion length asked for in every request
+MAX_REPLY_TOKENS = 150
+
+class Completion(str):
+    """
+    Reply text from a backend, with the token 'usage' it reported (or None).
+    """
+    usage = None
+
+    def __new__(cls, text, usage=None):
+        completion = super().__new__(cls, text)
+        completion.usage = usage
+        return completion
 
 class LLMClient:
-    def __init__(self):
-        self.api_key = getattr(settings, "OPENAI_API_KEY", None)
-        self.model = getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
-        self.client = None
-        if self.api_key:
-            try:
-                self.client = openai.OpenAI(api_key=self.api_key)
-            except Exception as e:
-                logger.log_trace(e)
-                self.client = None
+    """
+    Talks to one OpenAI-compatible endpoint. Arguments left out are taken
+    from the OPENAI_* settings. With 'mock' (or LLM_BACKEND = "mock") the
+    offline mock backend is used instead.
+    """
+    def __init__(self, name="openai", model=None, api_base=None, api_key=None, mock=False,
+                 max_connections=None, idle_timeout=None):
+        self.name = name
+        self.api_key = api_key or getattr(settings, "OPENAI_API_KEY", None)
+        self.model = model or getattr(settings, "OPENAI_MODEL", "gpt-4o-mini")
+        api_base = api_base or getattr(settings, "OPENAI_API_BASE", "https://api.openai.com/v1")
+        self.transport = None
+        if mock or getattr(settings, "LLM_BACKEND", "openai") == "mock":
+            self.transport = MockTransport(**getattr(settings, "LLM_MOCK_OPTIONS", {}))
+        elif self.api_key or "api.openai.com" not in api_base:
+            # local servers such as llama.cpp do not need a key
+            self.transport = HTTPTransport(
+                api_base,
+                api_key=self.api_key,
+                max_connections=max_connections or getattr(settings, "LLM_MAX_CONNECTIONS", 8),
+                idle_timeout=idle_timeout or getattr(settings, "LLM_CONNECTION_IDLE_TIMEOUT", 60),
+            )
         else:
-            logger.log_warn("OPENAI_API_KEY not found in settings.")
+            logger.log_warn(f"OPENAI_API_KEY not found in settings; LLM backend '{name}' is disabled.")
 
-    def get_response_sync(self, messages, system_prompt):
+    def get_response(self, messages, system_prompt):
         """
-        Synchronous call to OpenAI.
+        Asynchronous call to OpenAI. Returns a Deferred that fires with the
+        reply text, or errbacks if the call failed.
         """
-        if not self.client:
-            return None
+        if not self.transport:
+            return defer.succeed(None)
+
+        d = self.transport.post_json("/chat/completions", self._payload(messages, system_prompt))
+        d.addCallback(self._parse_completion)
+        return d
 
+    def stream_response(self, messages, system_prompt, on_text):
+        """
+        Streaming call to OpenAI. 'on_text' is called with each fragment of
+        the reply as it arrives. Returns a Deferred that fires with the full
+        reply text, or errbacks if the call failed.
+        """
+        if not self.transport:
+            return defer.succeed(None)
+
+        payload = self._payload(messages, system_prompt)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        parts = []
+        usage = []
+
+        def _on_event(event):
+            if event.get("usage"):
+                usage.append(event["usage"])
+            choices = event.get("choices") or []
+            text = choices and (choices[0].get("delta") or {}).get("content")
+            if text:
+                parts.append(text)
+                on_text(text)
+
+        d = self.transport.stream_json("/chat/completions", payload, _on_event)
+        d.addCallback(lambda _: Completion("".join(parts).strip(), usage[-1] if usage else None))
+        return d
+
+    def _payload(self, messages, system_prompt):
         # Prepend system prompt to messages
         full_messages = [{"role": "system", "content": system_prompt}] + messages
+        return {
+            "model": self.model,
+            "messages": full_messages,
+            "max_tokens": MAX_REPLY_TOKENS,
+        }
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=full_messages,
-                max_tokens=150
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.log_trace(e)
-            return None
+    def _parse_completion(self, data):
+        return Completion(data["choices"][0]["message"]["content"].strip(), data.get("usage"))
 
-# Singleton instance
-_client = None
+    def close(self):
+        if self.transport:
+            return self.transport.close()
+        return defer.succeed(None)
 
-def get_response(prompt, system_prompt="You are a helpful assistant in a MUD game.", history=None):
-    """
-    Returns a Deferred that fires with the response.
-    If 'history' is provided, it is a list of dicts. 'prompt' is appended to it for the call (but not modified in place).
-    If 'history' is None, just uses prompt.
-    """
-    global _client
-    if not _client:
-        _client = LLMClient()
+# Singleton instances
+_router = None
+_scheduler = None
+_limiter = None
+_cache = None
+_semantic_cache = None
+_memory_bank = None
+_prefetch_store = None
+_singleflight = SingleFlight()
+_prompt_stats = PromptStats()
+_telemetry = Telemetry()
+_latency = {}  # (request class, streaming) -> LatencyTracker
+_resilience_stats = {"timeouts": 0, "failures": 0, "failovers": 0, "fallbacks": 0, "hedged": 0, "stale": 0}
+
+def _get_cache():
+    global _cache
+    if not _cache:
+        _cache = ResponseCache(
+            max_size=getattr(settings, "LLM_CACHE_SIZE", 512),
+            ttl=getattr(settings, "LLM_CACHE_TTL", 600),
+        )
+    return _cache
+
+def _get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        conf = dict(getattr(settings, "LLM_SEMANTIC_CACHE", None) or {})
+        _semantic_cache = False
+        if conf.pop("enabled", False):
+            if np is None:
+                logger.log_warn("LLM_SEMANTIC_CACHE is enabled but numpy is not installed.")
+            else:
+                _semantic_cache = SemanticCache(_make_embedder(conf), **conf)
+    return _semantic_cache
+
+def _get_memory_bank():
+    global _memory_bank
+    if _memory_bank is None:
+        conf = dict(getattr(settings, "LLM_EPISODIC_MEMORY", None) or {})
+        _memory_bank = False
+        if conf.pop("enabled", False):
+            if np is None:
+                logger.log_warn("LLM_EPISODIC_MEMORY is enabled but numpy is not installed.")
+            else:
+                _memory_bank = MemoryBank(_make_embedder(conf), **conf)
+    return _memory_bank
+
+def _make_embedder(conf):
+    # pops the embedder keys off a LLM_SEMANTIC_CACHE style dict
+    embedder = class_from_module(conf.pop("embedder", "world.llm_semantic.HashingEmbedder"))
+    return embedder(**conf.pop("embedder_options", {}))
+
+def _get_prefetch_store():
+    global _prefetch_store
+    if not _prefetch_store:
+        _prefetch_store = PrefetchStore(ttl=getattr(settings, "LLM_PREFETCH_TTL", 60))
+    return _prefetch_store
 
+def _get_limiter():
+    global _limiter
+    if not _limiter:
+        limits = getattr(settings, "LLM_RATE_LIMIT", None)
+        if limits:
+            _limiter = RateLimiter(**limits)
+    return _limiter
+
+def _get_scheduler():
+    global _scheduler
+    if not _scheduler:
+        _scheduler = RequestScheduler(
+            classes=getattr(settings, "LLM_REQUEST_CLASSES", DEFAULT_CLASSES),
+            max_concurrent=getattr(settings, "LLM_MAX_CONCURRENT", 8),
+            limiter=_get_limiter(),
+        )
+    return _scheduler
+
+def _build_messages(prompt, history):
     messages = []
     if history:
         messages.extend(history)
@@ -78,4 +220,548 @@ def get_response(prompt, system_prompt="You are a helpful assistant in a MUD gam
         if not msgs_to_send or msgs_to_send[-1]["content"] != prompt:
              msgs_to_send.append({"role": "user", "content": prompt})
 
-    return run_async(_client.get_response_sync, msgs_to_send, system_prompt)
+    return msgs_to_send
+
+def _fallback(request_class):
+    lines = getattr(settings, "LLM_FALLBACK_LINES", {}).get(request_class)
+    if not lines:
+        return None
+    _resilience_stats["fallbacks"] += 1
+    return FallbackReply(random.choice(lines))
+
+def _call_backend(request_class, tier, msgs_to_send, system_prompt, on_text=None, call=None):
+    """
+    Runs one request (when the scheduler dispatches it) on the best backend of 'tier', failing over
+    to the next one if a backend errors or times out before any text was streamed, and hedging it
+    if the class is configured for that. Failures are logged and answered with a fallback line for
+    the class, or None. What happened is noted on the CallRecord 'call'.
+    """
+    call = call or CallRecord(request_class)
+    started = call.dispatched = time.time()
+    router = _get_router()
+    if not router.configured(tier):
+        call.outcome = "disabled"
+        return None
+
+    streaming = on_text is not None
+    tracker = _latency.setdefault((request_class, streaming), LatencyTracker())
+    timeout = _get_scheduler().classes.get(request_class, {}).get("timeout")
+    streamed = []
+
+    def _on_text(text):
+        if not streamed:
+            call.first_text = time.time()
+            tracker.record(call.first_text - started)
+        streamed.append(text)
+        on_text(text)
+
+    def _start(text_callback):
+        tried = []
+        sent = []
+
+        def _text(text):
+            sent.append(text)
+            text_callback(text)
+
+        def _attempt(failure=None):
+            backend = router.select(tier, streaming, exclude=tried)
+            if backend is None:
+                # out of backends: report what went wrong with the last one, if any
+                return failure if failure is not None else defer.fail(NoBackendAvailable(tier))
+            if failure is not None:
+                _resilience_stats["failovers"] += 1
+            tried.append(backend)
+            call.backend = backend.name
+            d = backend.call(msgs_to_send, system_prompt, _text if streaming else None, timeout=timeout,
+                             prompt_tokens=call.prompt_tokens, max_tokens=MAX_REPLY_TOKENS)
+            d.addErrback(_failover, backend)
+            return d
+
+        def _failover(failure, backend):
+            if sent or failure.check(defer.CancelledError):
+                return failure
+            if failure.check(NoBackendAvailable):
+                # its breaker is open or the rate limit is used up; nothing to report
+                pass
+            elif failure.check(defer.TimeoutError):
+                logger.log_warn(f"LLM backend '{backend.name}' timed out after {timeout}s.")
+            elif failure.check(LLMHTTPError) and failure.value.code == 429:
+                logger.log_warn(f"LLM backend '{backend.name}' is rate limiting us; backing off.")
+                if backend.limiter:
+                    backend.limiter.backoff()
+            else:
+                logger.log_warn(f"LLM backend '{backend.name}' failed: {failure.getErrorMessage()}")
+            return _attempt(failure)
+
+        return _attempt()
+
+    delay = None
+    hedge_percentile = getattr(settings, "LLM_HEDGE", {}).get(request_class)
+    if hedge_percentile:
+        delay = tracker.percentile(hedge_percentile, min_samples=getattr(settings, "LLM_HEDGE_MIN_SAMPLES", 20))
+    def _count_hedge():
+        _resilience_stats["hedged"] += 1
+
+    if delay:
+        d = hedge(_start, delay, _on_text, on_hedge=_count_hedge)
+    else:
+        d = _start(_on_text)
+
+    def _success(response):
+        call.completed = time.time()
+        call.outcome = "ok"
+        if response and not streaming:
+            tracker.record(call.completed - started)
+        usage = getattr(response, "usage", None)
+        if usage:
+            call.prompt_tokens = usage.get("prompt_tokens", call.prompt_tokens)
+            call.cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            call.completion_tokens = usage.get("completion_tokens", 0)
+        elif response:
+            call.completion_tokens = count_tokens(response)
+        return response
+
+    def _failure(failure):
+        call.completed = time.time()
+        if failure.check(defer.CancelledError):
+            call.outcome = "cancelled"
+            return None
+        if failure.check(defer.TimeoutError):
+            call.outcome = "timeout"
+            _resilience_stats["timeouts"] += 1
+            logger.log_warn(f"LLM {request_class} request timed out after {timeout}s.")
+        elif failure.check(NoBackendAvailable):
+            call.outcome = "unavailable"
+        else:
+            call.outcome = "error"
+            _resilience_stats["failures"] += 1
+            logger.log_trace(failure)
+        if streamed:
+            # keep what the player already saw rather than switching to a canned line
+            return "".join(streamed).strip()
+        return _fallback(request_class)
+
+    d.addCallbacks(_success, _failure)
+    return d
+
+def _get_router():
+    global _router
+    if not _router:
+        configs = getattr(settings, "LLM_BACKENDS", None) or {"openai": {}}
+        breaker_defaults = getattr(settings, "LLM_CIRCUIT_BREAKER", {})
+        backends = {}
+        for name, conf in configs.items():
+            conf = dict(conf)
+            breaker = CircuitBreaker(**dict(breaker_defaults, **conf.pop("circuit_breaker", {})))
+            max_in_flight = conf.pop("max_in_flight", None) or getattr(settings, "LLM_MAX_CONNECTIONS", 8)
+            backends[name] = Backend(name, LLMClient(name, **conf), max_in_flight=max_in_flight,
+                                     breaker=breaker, limiter=_get_limiter())
+        _router = LLMRouter(
+            backends,
+            getattr(settings, "LLM_TIERS", None) or {"default": list(backends)},
+            getattr(settings, "LLM_CLASS_TIERS", {}),
+            latency_targets=getattr(settings, "LLM_TIER_LATENCY_TARGETS", {}),
+            error_threshold=getattr(settings, "LLM_BACKEND_ERROR_THRESHOLD", 0.5),
+        )
+    return _router
+
+def _request_key(tier, system_prompt, msgs_to_send):
+    models = ",".join(backend.client.model for backend in _get_router().tiers[tier])
+    return request_digest(models, system_prompt, msgs_to_send)
+
+def _prepare_messages(prompt, system_prompt, history, token_budget):
+    """
+    Builds the message list and fits it into the token budget.
+    """
+    budget = token_budget or getattr(settings, "LLM_PROMPT_TOKEN_BUDGET", 1200)
+    messages, tokens, dropped, compacted = fit_messages(
+        system_prompt, _build_messages(prompt, history), budget,
+        max_turn_tokens=getattr(settings, "LLM_MAX_TURN_TOKENS", 200))
+    _prompt_stats.record(tokens, dropped, compacted)
+    return messages, tokens
+
+def _record_call(result, call, is_valid=None):
+    """
+    Completes 'call' from the result the caller gets and adds it to the telemetry. 'is_valid' is
+    the request's validity check, to tell stale requests from ones past their deadline. It is
+    checked the way _drop_stale checks it, so results thrown away as stale are recorded as such.
+    """
+    if isinstance(result, Failure):
+        call.outcome = "cancelled" if result.check(defer.CancelledError) else "error"
+    elif call.cache in ("hit", "semantic", "prefetch"):
+        call.outcome = "ok"
+    elif call.dispatched is None:
+        if result is None:
+            # no longer wanted, or waited in the queue past its class deadline
+            call.outcome = "stale" if is_valid is not None and not is_valid() else "dropped"
+        else:
+            # answered by an identical request that was already in flight
+            call.cache = "coalesced"
+            call.outcome = "fallback" if isinstance(result, FallbackReply) else "ok"
+    if (is_valid is not None and result is not None and not is_valid()
+            and (not isinstance(result, Failure) or result.check(defer.CancelledError))):
+        # it came after the conversation moved on, or was stopped because of that
+        call.outcome = "stale"
+    _telemetry.record(call)
+    return result
+
+def get_response(prompt, system_prompt="You are a helpful assistant in a MUD game.", history=None,
+                 request_class=REPLY, use_cache=True, token_budget=None, tier=None, source=None,
+                 question=None, asker=None, is_valid=None):
+    """
+    Returns a Deferred that fires with the response.
+    If 'history' is provided, it is a list of dicts. 'prompt' is appended to it for the call (but not modified in place).
+    If 'history' is None, just uses prompt.
+    The request is fitted into 'token_budget' tokens (default LLM_PROMPT_TOKEN_BUDGET) by dropping or
+    compacting the oldest history first.
+    'request_class' decides the scheduling priority (REPLY, SHARD or AMBIENT). Requests in a class
+    with a deadline fire with None if they waited in the queue for too long.
+    The request goes to a backend of 'tier' (see LLM_TIERS), or of the tier LLM_CLASS_TIERS gives
+    for the request class if 'tier' is None or unknown.
+    Identical requests are answered from the response cache unless 'use_cache' is False, and
+    identical requests already in flight share a single API call.
+    'source' is the object the request is made for (an NPC, the shard), which the call telemetry
+    is broken down by.
+    'question' is what 'asker' (a player) asked 'source'. With LLM_SEMANTIC_CACHE enabled, the
+    answer to a similar enough question the same asker asked of the same source before is reused;
+    answers are not shared between askers, as they were written for one conversation.
+    'is_valid' is a callable telling if the response is still wanted (the player is still there,
+    nothing newer was said). It is checked before the request is dispatched and when the response
+    arrives; once it returns False the request is dropped and the Deferred fires with None.
+    """
+    msgs_to_send, tokens = _prepare_messages(prompt, system_prompt, history, token_budget)
+    tier = _get_router().tier_for(request_class, tier)
+    call = CallRecord(request_class, source, tokens)
+    question = _semantic_question(question, asker)
+    d = _get_response(msgs_to_send, system_prompt, request_class, use_cache, tier, call, question, is_valid)
+    return _drop_stale(d, is_valid)
+
+
+def _submit(request_class, tier, msgs_to_send, system_prompt, call, is_valid=None, on_text=None):
+    """
+    Queues a request with the scheduler. The single-flight front end of every call.
+    """
+    return _get_scheduler().submit(request_class, _call_backend, request_class, tier, msgs_to_send,
+                                   system_prompt, on_text, call, tokens=call.prompt_tokens + MAX_REPLY_TOKENS,
+                                   is_valid=is_valid)
+
+
+def _drop_stale(d, is_valid):
+    """
+    Makes 'd' fire with None instead of its result if 'is_valid()' is False by then, and also
+    when it was cancelled because of that.
+    """
+    if is_valid is None:
+        return d
+
+    def _check(result):
+        if isinstance(result, Failure) and not result.check(defer.CancelledError):
+            return result
+        if result is None or is_valid():
+            return result
+        _resilience_stats["stale"] += 1
+        return None
+
+    return d.addBoth(_check)
+
+
+def _semantic_question(question, asker):
+    """
+    Returns the (asker, question) the semantic cache is keyed by, or None without a question.
+    """
+    if not question:
+        return None
+    return (f"#{asker.id}" if asker is not None else None, question)
+
+
+def _lookup_cache(key, call, question):
+    """
+    Returns a cached response for the request or None, noting on 'call' which cache answered.
+    """
+    cached = _get_cache().get(key)
+    if cached is not None:
+        call.cache = "hit"
+        return cached
+    semantic = _get_semantic_cache()
+    if semantic and question and call.source:
+        asker, text = question
+        cached = semantic.get((call.source, asker), text)
+        if cached is not None:
+            call.cache = "semantic"
+            return cached
+    call.cache = "miss"
+    return None
+
+
+def _get_response(msgs_to_send, system_prompt, request_class, use_cache, tier, call, question=None,
+                  is_valid=None):
+    key = _request_key(tier, system_prompt, msgs_to_send)
+    if use_cache:
+        cached = _lookup_cache(key, call, question)
+        if cached is not None:
+            return defer.succeed(_record_call(cached, call, is_valid))
+    else:
+        call.cache = "off"
+
+    def _run():
+        d = _singleflight.run((request_class, key), _submit, request_class, tier, msgs_to_send,
+                              system_prompt, call, is_valid=is_valid)
+        d.addBoth(_record_call, call, is_valid)
+        if use_cache:
+            d.addCallback(_store_response, key, call, question)
+        return d
+
+    prefetched = _take_prefetched(key, call) if use_cache else None
+    if prefetched is None:
+        return _run()
+    return prefetched.addCallback(
+        lambda response: _serve_prefetched(response, key, call, question, is_valid) or _run())
+
+
+def stream_response(prompt, on_chunk, system_prompt="You are a helpful assistant in a MUD game.", history=None,
+                    request_class=REPLY, use_cache=True, token_budget=None, tier=None, source=None,
+                    question=None, asker=None, is_valid=None):
+    """
+    Like get_response, but calls 'on_chunk(text, new_line)' with sentence-sized pieces of the reply
+    as soon as they arrive. 'new_line' is True when the piece starts a new line of the reply.
+    Returns a Deferred that fires with the full response once it is complete. Cancelling the
+    Deferred stops the stream. If LLM_STREAMING is off, the pieces are delivered when the full
+    response arrives. 'is_valid' is also checked before each piece; once it returns False the
+    stream is stopped and the Deferred fires with None.
+    """
+    msgs_to_send, tokens = _prepare_messages(prompt, system_prompt, history, token_budget)
+    tier = _get_router().tier_for(request_class, tier)
+    call = CallRecord(request_class, source, tokens)
+    question = _semantic_question(question, asker)
+    chunker = SentenceChunker()
+    returned = []  # the Deferred handed back, to stop the stream with
+    streamed = []  # set once any text came in as a stream
+
+    def _deliver(pieces):
+        for text, new_line in pieces:
+            if is_valid is not None and not is_valid():
+                if returned and not returned[0].called:
+                    returned[0].cancel()
+                return
+            on_chunk(text, new_line)
+
+    def _on_text(text):
+        streamed.append(True)
+        _deliver(chunker.feed(text))
+
+    def _finish(response):
+        if response and not streamed:
+            # a fallback line, or the result of a shared call that was not streamed
+            return _deliver_all(response)
+        if response:
+            _deliver(chunker.flush())
+        return response
+
+    def _deliver_all(response):
+        if response:
+            streamed.append(True)
+            _deliver(chunker.feed(response))
+        return _finish(response)
+
+    if not getattr(settings, "LLM_STREAMING", True):
+        d = _get_response(msgs_to_send, system_prompt, request_class, use_cache, tier, call, question,
+                          is_valid)
+        d.addCallback(_deliver_all)
+        return _drop_stale(d, is_valid)
+
+    key = _request_key(tier, system_prompt, msgs_to_send)
+    if use_cache:
+        cached = _lookup_cache(key, call, question)
+        if cached is not None:
+            return _drop_stale(defer.succeed(_record_call(_deliver_all(cached), call, is_valid)), is_valid)
+    else:
+        call.cache = "off"
+
+    def _run():
+        # identical requests, streamed or not, share one call; each streaming caller gets the text
+        d = _singleflight.run((request_class, key), _submit, request_class, tier, msgs_to_send,
+                              system_prompt, call, is_valid=is_valid,
+                              on_text=_on_text)
+        d.addBoth(_record_call, call, is_valid)
+        d.addCallback(_finish)
+        if use_cache:
+            d.addCallback(_store_response, key, call, question)
+        return d
+
+    prefetched = _take_prefetched(key, call) if use_cache else None
+    if prefetched is None:
+        d = _run()
+    else:
+        d = prefetched.addCallback(
+            lambda response: _deliver_all(_serve_prefetched(response, key, call, question, is_valid)) or _run())
+    returned.append(d)
+    return _drop_stale(d, is_valid)
+
+
+def _take_prefetched(key, call):
+    """
+    Returns a Deferred for the response prefetched for the request, or None if there is none.
+    """
+    prefetched = _get_prefetch_store().take(key)
+    if prefetched is not None:
+        call.cache = "prefetch"
+    return prefetched
+
+
+def _serve_prefetched(response, key, call, question, is_valid=None):
+    """
+    Completes the request with a prefetched response. Returns None if prefetching failed, in
+    which case the caller makes the request after all.
+    """
+    if not response:
+        call.cache = "miss"
+        return None
+    _record_call(response, call, is_valid)
+    return _store_response(response, key, call, question)
+
+
+def prefetch(prompt, system_prompt="You are a helpful assistant in a MUD game.", history=None,
+             request_class=REPLY, token_budget=None, tier=None, source=None, ttl=None):
+    """
+    Generate the response to a request that is likely to be made soon, at PREFETCH priority. If
+    the same request (same arguments as for get_response or stream_response) comes in within
+    'ttl' seconds (default LLM_PREFETCH_TTL), it is answered with the prefetched response, or
+    waits for it if it is still being generated. Unused responses are thrown away.
+    Returns True if a prefetch was started; nothing is done if the response is already cached
+    or being prefetched, or if the PREFETCH class is not configured in LLM_REQUEST_CLASSES.
+    """
+    if PREFETCH not in _get_scheduler().classes:
+        return False
+    msgs_to_send, tokens = _prepare_messages(prompt, system_prompt, history, token_budget)
+    tier = _get_router().tier_for(request_class, tier)
+    key = _request_key(tier, system_prompt, msgs_to_send)
+    store = _get_prefetch_store()
+    if key in store or key in _get_cache():
+        return False
+    call = CallRecord(PREFETCH, source, tokens)
+    call.cache = "miss"
+    d = _get_scheduler().submit(PREFETCH, _call_backend, PREFETCH, tier, msgs_to_send, system_prompt,
+                                None, call, tokens=tokens + MAX_REPLY_TOKENS)
+    d.addBoth(_record_call, call)
+    # a canned line is no better than asking again
+    d.addCallback(lambda response: None if isinstance(response, FallbackReply) else response)
+    store.add(key, d, ttl)
+    return True
+
+
+def _store_response(response, key, call, question):
+    if response and not isinstance(response, FallbackReply):
+        _get_cache().set(key, response)
+        semantic = _get_semantic_cache()
+        if semantic and question and call.source:
+            asker, text = question
+            semantic.set((call.source, asker), text, response)
+    return response
+
+
+def remember(source, text):
+    """
+    Store 'text' in the long-term episodic memory of 'source' (an NPC), if LLM_EPISODIC_MEMORY is
+    enabled.
+    """
+    bank = _get_memory_bank()
+    if bank:
+        bank.remember(source.id, text)
+
+
+def preload_memories(source):
+    """
+    Start reading the episodic memory of 'source' (an NPC) from its file, if LLM_EPISODIC_MEMORY is
+    enabled, so it can recall them once it answers.
+    """
+    bank = _get_memory_bank()
+    if bank:
+        bank.load(source.id)
+
+
+def recall(source, query, k=None):
+    """
+    Returns up to 'k' (default LLM_EPISODIC_MEMORY["top_k"]) of the things 'source' remembers that
+    are most relevant to 'query', best first, as (time stored, text) tuples. Empty if
+    LLM_EPISODIC_MEMORY is off. Memories still being read from disk are not recalled yet.
+    """
+    bank = _get_memory_bank()
+    return bank.recall(source.id, query, k) if bank else []
+
+
+def flush_memories(block=False):
+    """
+    Save changed episodic memories to their files, in a thread unless 'block' is set.
+    Returns a Deferred.
+    """
+    bank = _get_memory_bank()
+    if not bank:
+        return defer.succeed(None)
+    if block:
+        return defer.maybeDeferred(bank.write_snapshots, bank.snapshots()).addErrback(logger.log_trace)
+    return bank.flush()
+
+
+def headroom():
+    """
+    Returns the share of the LLM rate limit budget (LLM_RATE_LIMIT) that is currently unused, from 0
+    to 1; 1 if there is no limit.
+    """
+    limiter = _get_limiter()
+    return limiter.headroom() if limiter else 1.0
+
+
+def get_stats():
+    """
+    Returns a dict of runtime statistics for the LLM pipeline.
+    """
+    return {
+        "scheduler": _get_scheduler().stats(),
+        "cache": _get_cache().stats(),
+        "semantic_cache": _get_semantic_cache().stats() if _get_semantic_cache() else None,
+        "episodic_memory": _get_memory_bank().stats() if _get_memory_bank() else None,
+        "prefetch": _get_prefetch_store().stats(),
+        "coalesce": _singleflight.stats(),
+        "prompt": _prompt_stats.as_dict(),
+        "resilience": dict(_resilience_stats),
+        "rate_limit": _get_limiter().stats() if _get_limiter() else None,
+        "backends": _get_router().stats(),
+        "telemetry": _telemetry.stats(),
+    }
+
+
+def load_cache():
+    """
+    Fill the response cache from LLM_CACHE_PATH, reading the file in a thread. Requests made
+    before it is done are served as usual; their entries win over the saved ones.
+    Called when the server starts.
+    """
+    path = getattr(settings, "LLM_CACHE_PATH", None)
+    if not path:
+        return defer.succeed(0)
+    cache = _get_cache()
+    d = threads.deferToThread(CacheStore(path).read, cache.max_size)
+    d.addCallback(cache.restore)
+    d.addErrback(logger.log_trace)
+    return d
+
+
+def flush_cache():
+    """
+    Save the response cache to LLM_CACHE_PATH. Called before the server reloads or shuts down.
+    """
+    path = getattr(settings, "LLM_CACHE_PATH", None)
+    if not path or not _cache:
+        return
+    try:
+        CacheStore(path).write(_cache.items(), _cache.max_size, ttl=_cache.ttl)
+    except Exception:
+        logger.log_trace()
+
+
+def close():
+    """
+    Release pooled connections. Called when the server shuts down.
+    """
+    if _router:
+        return defer.DeferredList([backend.client.close() for backend in _router.backends.values()])
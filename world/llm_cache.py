@@ -0,0 +1,301 @@
+"""
+LLM response cache
+
+An in-memory LRU cache for LLM replies, keyed on a digest of the request
+(model, system prompt and message history). Entries are evicted when the
+cache is full (least recently used first) or when they are older than the
+configured time-to-live. A CacheStore keeps the entries in a small SQLite
+file across server reloads. A PrefetchStore holds speculatively generated
+responses until the request they were made for comes in.
+
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+from twisted.internet import defer
+
+_RE_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text):
+    return _RE_WHITESPACE.sub(" ", text or "").strip()
+
+
+def request_digest(model, system_prompt, messages):
+    """
+    Build a stable key for an LLM request. Whitespace differences in the
+    prompt or history do not change the key.
+
+    Args:
+        model (str): Model name.
+        system_prompt (str): The system prompt.
+        messages (list): List of {"role", "content"} dicts.
+
+    Returns:
+        str: Hex digest identifying the request.
+    """
+    normalized = [
+        model,
+        _normalize(system_prompt),
+        [[msg.get("role"), _normalize(msg.get("content"))] for msg in messages],
+    ]
+    blob = json.dumps(normalized, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Size- and age-bounded LRU cache.
+
+    Args:
+        max_size (int): Maximum number of entries kept.
+        ttl (int or None): Seconds an entry stays valid, or None to only
+            evict by size.
+    """
+
+    def __init__(self, max_size=512, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.restored = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        # like get, but without touching the LRU order or the hit counters
+        entry = self._entries.get(key)
+        return entry is not None and (self.ttl is None or time.time() - entry[0] <= self.ttl)
+
+    def get(self, key):
+        """
+        Returns:
+            str or None: The cached response, or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, value = entry
+        if self.ttl is not None and time.time() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def items(self):
+        """
+        Returns:
+            list: `(key, stored_at, value)` for every entry, oldest first.
+        """
+        return [(key, stored_at, value) for key, (stored_at, value) in self._entries.items()]
+
+    def restore(self, rows):
+        """
+        Add entries saved earlier. Entries already in the cache are newer
+        and win; expired rows and rows beyond `max_size` are left out.
+
+        Args:
+            rows (list): `(key, stored_at, value)` tuples, oldest first.
+
+        Returns:
+            int: How many entries were added.
+        """
+        now = time.time()
+        rows = [(key, stored_at, value) for key, stored_at, value in rows
+                if key not in self._entries and (self.ttl is None or now - stored_at <= self.ttl)]
+        room = max(0, self.max_size - len(self._entries))
+        rows = rows[len(rows) - min(room, len(rows)):]
+        entries = OrderedDict((key, (stored_at, value)) for key, stored_at, value in rows)
+        entries.update(self._entries)
+        self._entries = entries
+        self.restored += len(rows)
+        return len(rows)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "restored": self.restored,
+        }
+
+
+class CacheStore:
+    """
+    SQLite file holding cache entries between server runs. Keys are stored
+    as raw digest bytes in a table without rowids, so the key index is
+    the table itself.
+
+    Args:
+        path (str): Database file; created if missing.
+    """
+
+    _SCHEMA = ("CREATE TABLE IF NOT EXISTS responses "
+               "(key BLOB PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL) WITHOUT ROWID")
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(self._SCHEMA)
+        return conn
+
+    def read(self, limit):
+        """
+        Returns:
+            list: The newest `limit` entries as `(key, stored_at, value)`,
+                oldest first.
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT key, stored_at, value FROM responses ORDER BY stored_at DESC LIMIT ?",
+                (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [(bytes(key).hex(), stored_at, value) for key, stored_at, value in reversed(rows)]
+
+    def write(self, entries, max_size, ttl=None):
+        """
+        Save `entries` (as returned by `ResponseCache.items`), then drop
+        expired rows and all but the newest `max_size`.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO responses (key, stored_at, value) VALUES (?, ?, ?)",
+                    [(bytes.fromhex(key), stored_at, value) for key, stored_at, value in entries])
+                if ttl is not None:
+                    conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - ttl,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)", (max_size,))
+        finally:
+            conn.close()
+
+
+class _Prefetch:
+    __slots__ = ("deferred", "expires", "done", "result", "waiters")
+
+    def __init__(self, deferred, expires):
+        self.deferred = deferred
+        self.expires = expires
+        self.done = False
+        self.result = None
+        self.waiters = []
+
+
+class PrefetchStore:
+    """
+    Responses generated ahead of time, keyed like the ResponseCache. Each
+    one can be taken once, by the request it was made for, within `ttl`
+    seconds; after that it is discarded (and cancelled if it is still
+    being generated).
+
+    Args:
+        ttl (int): Seconds a prefetched response is kept.
+        max_size (int): Prefetches kept at once; the oldest go first.
+    """
+
+    def __init__(self, ttl=60, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+
+    def __contains__(self, key):
+        self._purge()
+        return key in self._entries
+
+    def _discard(self, entry):
+        self.discarded += 1
+        if not entry.done:
+            entry.deferred.cancel()
+
+    def _purge(self):
+        now = time.time()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires > now and len(self._entries) <= self.max_size:
+                break
+            del self._entries[key]
+            self._discard(entry)
+
+    def add(self, key, deferred, ttl=None):
+        """
+        Keep the response `deferred` will fire with for `key`.
+        """
+        entry = _Prefetch(deferred, time.time() + (ttl or self.ttl))
+        self._entries[key] = entry
+        self.started += 1
+        deferred.addBoth(self._done, key, entry)
+        self._purge()
+
+    def _done(self, result, key, entry):
+        entry.done = True
+        entry.result = result if isinstance(result, str) and result else None
+        if entry.result is None and self._entries.get(key) is entry:
+            # nothing worth serving
+            del self._entries[key]
+        for waiter in entry.waiters:
+            if not waiter.called:
+                waiter.callback(entry.result)
+        return None
+
+    def take(self, key):
+        """
+        Returns:
+            Deferred or None: Fires with the prefetched response (None if
+                generating it failed), or None if nothing was prefetched
+                for `key`.
+        """
+        self._purge()
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.used += 1
+        if entry.done:
+            return defer.succeed(entry.result)
+        waiter = defer.Deferred()
+        entry.waiters.append(waiter)
+        return waiter
+
+    def stats(self):
+        self._purge()
+        return {
+            "pending": len(self._entries),
+            "started": self.started,
+            "used": self.used,
+            "discarded": self.discarded,
+        }
@@ -0,0 +1,306 @@
+"""
+LLM episodic memory
+
+Long-term memory of what NPCs were told, so that an NPC can recall what a
+player said last week without its whole history going into every prompt.
+Each NPC has an EpisodicMemory: a matrix of embeddings of the things it
+remembers, with their text and timestamps in arrays next to it. Looking
+up the memories most relevant to what was just said is one matrix-vector
+product and a partial sort.
+
+Memories fade: a memory's strength halves every `half_life` seconds since
+it was last recalled. When an NPC's store is full, its weakest memory makes
+room for the new one. Stores are saved to one .npz file per NPC, read and
+written in threads; until an NPC's file has been read, it only recalls what
+it was told since.
+
+Embeddings come from the same kind of embedder as the semantic cache
+(world.llm_semantic). Requires numpy; without it NPCs remember nothing.
+
+"""
+import os
+import time
+from collections import OrderedDict
+
+from evennia.utils import logger
+from twisted.internet import defer, threads
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class EpisodicMemory:
+    """
+    Up to `max_entries` memories of one NPC.
+
+    Args:
+        dim (int): Embedding size.
+        max_entries (int): Memories kept; the weakest go first.
+        half_life (float): Seconds after which an unrecalled memory has
+            half its strength left.
+    """
+
+    def __init__(self, dim, max_entries=256, half_life=14 * 86400):
+        self.max_entries = max_entries
+        self.half_life = half_life
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.created = np.zeros(max_entries)
+        self.recalled = np.zeros(max_entries)
+        self.texts = [None] * max_entries
+        self.size = 0
+        self.dirty = False
+
+    def strength(self, now=None):
+        """
+        Returns:
+            ndarray: The strength of each memory, 1 when just recalled.
+        """
+        now = time.time() if now is None else now
+        return np.exp2((self.recalled[:self.size] - now) / self.half_life)
+
+    def add(self, vector, text, now=None):
+        now = time.time() if now is None else now
+        if self.size < self.max_entries:
+            index = self.size
+            self.size += 1
+        else:
+            index = int(np.argmin(self.strength(now)))
+        self.vectors[index] = vector
+        self.created[index] = now
+        self.recalled[index] = now
+        self.texts[index] = text
+        self.dirty = True
+
+    def search(self, vector, k=3, min_similarity=0.3, now=None):
+        """
+        Returns:
+            list: `(created, text)` of up to `k` memories at least
+                `min_similarity` similar to `vector`, best first. Recalling
+                them refreshes their strength.
+        """
+        if not self.size:
+            return []
+        now = time.time() if now is None else now
+        scores = self.vectors[:self.size] @ vector
+        if self.size > k:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(self.size)
+        top = top[np.argsort(scores[top])[::-1]]
+        top = top[scores[top] >= min_similarity]
+        if len(top):
+            self.recalled[top] = now
+            self.dirty = True
+        return [(float(self.created[index]), self.texts[index]) for index in top]
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Copies of the memories' arrays, for `write_snapshot`. The
+                store counts as saved from now on.
+        """
+        size = self.size
+        self.dirty = False
+        return {
+            "vectors": self.vectors[:size].copy(),
+            "created": self.created[:size].copy(),
+            "recalled": self.recalled[:size].copy(),
+            "texts": np.array(self.texts[:size], dtype=str),
+        }
+
+    def restore(self, snapshot):
+        """
+        Add memories saved earlier (as read by `read_snapshot`) in front of
+        the ones made since. If they do not all fit, the oldest saved ones
+        are left out.
+        """
+        size = self.size
+        count = min(len(snapshot["texts"]), self.max_entries - size)
+        if count <= 0:
+            return
+        for name in ("vectors", "created", "recalled"):
+            array = getattr(self, name)
+            array[count:count + size] = array[:size].copy()
+            array[:count] = snapshot[name][-count:]
+        self.texts[count:count + size] = self.texts[:size]
+        self.texts[:count] = [str(text) for text in snapshot["texts"][-count:]]
+        self.size = count + size
+
+
+def read_snapshot(path, dim):
+    """
+    Read a snapshot written by `write_snapshot`. Safe to run in a thread.
+
+    Returns:
+        dict or None: The snapshot, or None if there is no file or it was
+            made with an embedder of another size.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        if data["vectors"].ndim != 2 or data["vectors"].shape[1] != dim:
+            # made with another embedder; the vectors mean nothing to this one
+            return None
+        return {name: data[name] for name in ("vectors", "created", "recalled", "texts")}
+
+
+def write_snapshot(path, snapshot):
+    """
+    Write an EpisodicMemory snapshot to `path` (an .npz file), replacing it
+    atomically. Safe to run in a thread.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **snapshot)
+    os.replace(tmp, path)
+
+
+class MemoryBank:
+    """
+    The EpisodicMemory of every NPC, loaded from `path` (a directory) in
+    a thread on first use. At most `max_loaded` stores are kept in memory;
+    the least recently used are saved, also in a thread, and unloaded.
+
+    Args:
+        embedder: Object with `dim` and `embed(text)`.
+        path (str): Directory the .npz files live in.
+        max_entries (int): Memories per NPC.
+        half_life (float): See EpisodicMemory.
+        max_loaded (int): NPC stores kept in memory.
+        top_k (int): Memories recalled at most.
+        min_similarity (float): Cosine similarity a memory needs to the
+            query to be recalled.
+    """
+
+    def __init__(self, embedder, path, max_entries=256, half_life=14 * 86400, max_loaded=200,
+                 top_k=3, min_similarity=0.3):
+        self.embedder = embedder
+        self.path = path
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.max_entries = max_entries
+        self.half_life = half_life
+        self.max_loaded = max_loaded
+        self._stores = OrderedDict()
+        self._loading = {}  # scope -> Deferred reading its file
+        self._saving = {}  # path -> Deferred writing it
+        self.recalls = 0
+        self.recalled = 0
+
+    def _file(self, scope):
+        return os.path.join(self.path, f"{scope}.npz")
+
+    def _store(self, scope):
+        store = self._stores.get(scope)
+        if store is None:
+            store = self._stores[scope] = EpisodicMemory(self.embedder.dim, self.max_entries, self.half_life)
+            self._load(scope, store)
+            self._unload()
+        self._stores.move_to_end(scope)
+        return store
+
+    def _after_save(self, path):
+        # a Deferred firing once the file at `path` is no longer being written
+        saving = self._saving.get(path)
+        if saving is None:
+            return defer.succeed(None)
+        waiter = defer.Deferred()
+        saving.addBoth(lambda result: waiter.callback(None) or result)
+        return waiter
+
+    def _load(self, scope, store):
+        path = self._file(scope)
+
+        def _loaded(snapshot):
+            del self._loading[scope]
+            if snapshot is not None:
+                store.restore(snapshot)
+
+        d = self._after_save(path)
+        d.addCallback(lambda _: threads.deferToThread(read_snapshot, path, self.embedder.dim))
+        self._loading[scope] = d
+        d.addCallback(_loaded)
+        d.addErrback(logger.log_trace)
+
+    def _unload(self):
+        for scope in list(self._stores):
+            if len(self._stores) <= self.max_loaded:
+                break
+            if scope in self._loading:
+                # saving it now would overwrite the memories still being read
+                continue
+            store = self._stores.pop(scope)
+            if store.dirty:
+                self._save(self._file(scope), store.snapshot())
+
+    def _save(self, path, snapshot):
+        d = self._after_save(path)
+        d.addCallback(lambda _: threads.deferToThread(write_snapshot, path, snapshot))
+
+        def _saved(result):
+            if self._saving.get(path) is d:
+                del self._saving[path]
+            return result
+
+        self._saving[path] = d
+        d.addBoth(_saved)
+        d.addErrback(logger.log_trace)
+        return d
+
+    def load(self, scope):
+        """
+        Start reading the memories of `scope` (an NPC id), if they are not
+        loaded yet, so they are there by the time they are recalled.
+        """
+        self._store(scope)
+
+    def remember(self, scope, text):
+        """
+        Store `text` in the memory of `scope` (an NPC id).
+        """
+        self._store(scope).add(self.embedder.embed(text), text)
+
+    def recall(self, scope, query, k=None):
+        """
+        Returns:
+            list: `(created, text)` of up to `k` (default `top_k`) memories
+                of `scope` most relevant to `query`, best first.
+        """
+        self.recalls += 1
+        found = self._store(scope).search(self.embedder.embed(query), k or self.top_k, self.min_similarity)
+        self.recalled += len(found)
+        return found
+
+    def snapshots(self):
+        """
+        Returns:
+            list: `(path, snapshot)` for every loaded store with unsaved
+                changes, to be written with `write_snapshots`.
+        """
+        return [(self._file(scope), store.snapshot()) for scope, store in self._stores.items()
+                if store.dirty and scope not in self._loading]
+
+    def flush(self):
+        """
+        Save every loaded store with unsaved changes, in threads.
+
+        Returns:
+            Deferred: Fires once they are written.
+        """
+        return defer.gatherResults([self._save(path, snapshot) for path, snapshot in self.snapshots()])
+
+    @staticmethod
+    def write_snapshots(snapshots):
+        for path, snapshot in snapshots:
+            write_snapshot(path, snapshot)
+
+    def stats(self):
+        return {
+            "loaded": len(self._stores),
+            "loading": len(self._loading),
+            "memories": sum(store.size for store in self._stores.values()),
+            "recalls": self.recalls,
+            "recalled": self.recalled,
+        }
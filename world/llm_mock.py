@@ -0,0 +1,276 @@
+"""
+Mock LLM backend
+
+An offline stand-in for the OpenAI endpoint, for load tests and local
+development. MockTransport has the same interface as
+world.llm_transport.HTTPTransport and answers in the same JSON shape, so
+everything above the transport runs unchanged. Enable it with
+
+    LLM_BACKEND = "mock"
+    LLM_MOCK_OPTIONS = {"latency": ("lognormal", 0.8, 0.5), "tokens_per_second": 40}
+
+The same fake can also be served over HTTP, to include the real network
+transport in a test. Run
+
+    python -m world.llm_mock --port 8900
+
+and point OPENAI_API_BASE at http://localhost:8900/v1.
+
+Like the real providers, the mock keeps a prompt prefix cache and reports
+how many prompt tokens were served from it (whole messages only) in
+usage.prompt_tokens_details.cached_tokens.
+
+Latency distributions are tuples:
+    ("fixed", seconds)
+    ("uniform", low, high)
+    ("normal", mean, stddev)
+    ("lognormal", median, sigma)
+
+"""
+import hashlib
+import json
+import math
+import random
+from collections import OrderedDict
+
+from twisted.internet import defer, reactor
+from world.llm_transport import LLMHTTPError
+
+_REPLIES = [
+    "say Welcome, traveler. The road has been long for you, I can tell.",
+    "say Aye, I've heard the rumours too. Best keep your voice down in here.",
+    "emote looks up from what they are doing and nods slowly.",
+    "say Strange lights were seen over the old watchtower last night.",
+    "emote hums a tune under their breath.",
+    "say If you want my advice, stay out of the woods after dark.",
+    "WAIT",
+]
+
+
+def sample_latency(dist, rng=random):
+    """
+    Draw one latency in seconds from a distribution tuple.
+    """
+    kind, *params = dist
+    if kind == "fixed":
+        value = params[0]
+    elif kind == "uniform":
+        value = rng.uniform(*params)
+    elif kind == "normal":
+        value = rng.gauss(*params)
+    elif kind == "lognormal":
+        median, sigma = params
+        value = rng.lognormvariate(math.log(median), sigma)
+    else:
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    return max(0.0, value)
+
+
+def _count_tokens(text):
+    # rough: OpenAI tokenizers average about four characters per token
+    return max(1, len(text) // 4)
+
+
+class MockTransport:
+    """
+    In-process fake of an OpenAI-compatible chat completions endpoint.
+
+    Args:
+        latency (tuple): Distribution of the time to the first token.
+        tokens_per_second (float): Generation speed after the first token.
+            Streamed replies arrive at this rate; whole replies arrive once
+            the last token would have been generated.
+        failure_rate (float): Fraction of requests that fail with HTTP 500.
+        rate_limit_rate (float): Fraction of requests that fail with HTTP 429.
+        hang_rate (float): Fraction of requests that never answer (until
+            cancelled), to simulate a degraded provider.
+        replies (list): Reply texts to pick from.
+        seed (int): Seed for reproducible runs.
+    """
+
+    def __init__(self, latency=("lognormal", 0.8, 0.5), tokens_per_second=40.0, failure_rate=0.0,
+                 rate_limit_rate=0.0, hang_rate=0.0, replies=None, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.replies = replies or _REPLIES
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.requests = 0
+        self._prefixes = OrderedDict()  # digest of a message prefix -> None, as an LRU
+
+    def _pick_fault(self):
+        roll = self.rng.random()
+        if roll < self.hang_rate:
+            return "hang"
+        roll -= self.hang_rate
+        if roll < self.failure_rate:
+            return LLMHTTPError(500, b'{"error": "mock failure"}')
+        roll -= self.failure_rate
+        if roll < self.rate_limit_rate:
+            return LLMHTTPError(429, b'{"error": "mock rate limit"}')
+        return None
+
+    def _usage(self, payload, reply):
+        prompt = cached = 0
+        digest = hashlib.sha256()
+        hit = True
+        for msg in payload.get("messages", []):
+            digest.update(json.dumps(msg, sort_keys=True).encode("utf-8"))
+            key = digest.hexdigest()
+            tokens = _count_tokens(msg.get("content") or "")
+            prompt += tokens
+            hit = hit and key in self._prefixes
+            if hit:
+                cached += tokens
+            self._prefixes[key] = None
+            self._prefixes.move_to_end(key)
+        while len(self._prefixes) > 4096:
+            self._prefixes.popitem(last=False)
+        completion = _count_tokens(reply)
+        return {"prompt_tokens": prompt, "completion_tokens": completion,
+                "total_tokens": prompt + completion,
+                "prompt_tokens_details": {"cached_tokens": cached}}
+
+    def _start(self):
+        self.requests += 1
+        self.in_flight += 1
+        calls = []
+
+        def _cancel(_):
+            for call in calls:
+                if call.active():
+                    call.cancel()
+
+        d = defer.Deferred(_cancel)
+
+        def _done(result):
+            self.in_flight -= 1
+            return result
+
+        d.addBoth(_done)
+        return d, calls
+
+    def post_json(self, path, payload):
+        d, calls = self._start()
+        fault = self._pick_fault()
+        if fault == "hang":
+            return d
+        reply = self.rng.choice(self.replies)
+        delay = sample_latency(self.latency, self.rng)
+        if fault:
+            calls.append(reactor.callLater(delay, d.errback, fault))
+            return d
+        delay += _count_tokens(reply) / self.tokens_per_second
+        response = {
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(payload, reply),
+        }
+        calls.append(reactor.callLater(delay, d.callback, response))
+        return d
+
+    def stream_json(self, path, payload, on_event):
+        d, calls = self._start()
+        fault = self._pick_fault()
+        if fault == "hang":
+            return d
+        delay = sample_latency(self.latency, self.rng)
+        if fault:
+            calls.append(reactor.callLater(delay, d.errback, fault))
+            return d
+        reply = self.rng.choice(self.replies)
+        # split into roughly token-sized pieces, keeping the whitespace
+        tokens = [reply[i:i + 4] for i in range(0, len(reply), 4)]
+        step = 1.0 / self.tokens_per_second
+
+        def _emit(index):
+            if d.called:
+                return
+            if index == len(tokens):
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    on_event({"object": "chat.completion.chunk", "choices": [],
+                              "usage": self._usage(payload, reply)})
+                d.callback(None)
+                return
+            try:
+                on_event({"object": "chat.completion.chunk",
+                          "choices": [{"index": 0, "delta": {"content": tokens[index]}}]})
+            except Exception as err:
+                d.errback(err)
+                return
+            calls.append(reactor.callLater(step, _emit, index + 1))
+
+        calls.append(reactor.callLater(delay, _emit, 0))
+        return d
+
+    def close(self):
+        return defer.succeed(None)
+
+
+def _serve(port, options):
+    from twisted.web import resource, server
+
+    transport = MockTransport(**options)
+
+    class ChatCompletions(resource.Resource):
+        isLeaf = True
+
+        def render_POST(self, request):
+            payload = json.loads(request.content.read() or b"{}")
+
+            def _fail(failure):
+                if failure.check(defer.CancelledError):
+                    # the client went away
+                    return
+                err = failure.value
+                request.setResponseCode(getattr(err, "code", 500))
+                request.write(getattr(err, "body", b"{}"))
+                request.finish()
+
+            if payload.get("stream"):
+                request.setHeader(b"content-type", b"text/event-stream")
+                d = transport.stream_json(
+                    "/chat/completions", payload,
+                    lambda event: request.write(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n"))
+                d.addCallback(lambda _: (request.write(b"data: [DONE]\n\n"), request.finish()))
+            else:
+                request.setHeader(b"content-type", b"application/json")
+                d = transport.post_json("/chat/completions", payload)
+                d.addCallback(lambda data: (request.write(json.dumps(data).encode("utf-8")),
+                                            request.finish()))
+            d.addErrback(_fail)
+            request.notifyFinish().addErrback(lambda _: d.cancel())
+            return server.NOT_DONE_YET
+
+    reactor.listenTCP(port, server.Site(ChatCompletions()))
+    print(f"Mock LLM server listening on http://localhost:{port}/v1")
+    reactor.run()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the mock LLM backend over HTTP.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="lognormal,0.8,0.5",
+                        help="distribution,param[,param], e.g. uniform,0.2,1.5")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    kind, *params = args.latency.split(",")
+    _serve(args.port, {
+        "latency": (kind, *(float(param) for param in params)),
+        "tokens_per_second": args.tokens_per_second,
+        "failure_rate": args.failure_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "hang_rate": args.hang_rate,
+        "seed": args.seed,
+    })
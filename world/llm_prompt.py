@@ -0,0 +1,227 @@
+"""
+LLM prompt assembly
+
+Lays out system prompts in stable segments and fits the system prompt,
+the current turn and as much chat history as possible into a token
+budget. Tokens are counted locally, with tiktoken if it is installed and
+a close estimate otherwise, so the size of every request is known before
+it is sent.
+
+Providers (and local servers such as llama.cpp) cache the longest prompt
+prefix they have seen recently and process it much faster and cheaper.
+To make the most of that, requests are ordered from the content that
+changes least often to the content that changes most often: persona,
+world rules, the slow-changing summary of what the NPC remembers, the
+rolling summary of recent events, the chat history, and last the current
+turn with its volatile facts.
+
+"""
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_RE_WORD = re.compile(r"\w+|[^\w\s]")
+
+# tokens the chat format adds around every message, and to prime the reply
+_MESSAGE_OVERHEAD = 4
+_REPLY_OVERHEAD = 3
+# a history turn is only compacted to fit if at least this much room is left
+_MIN_COMPACT_TOKENS = 16
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Count the tokens in `text`.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    # roughly one token per short word or punctuation mark, more for long words
+    return sum(1 + (len(word) - 1) // 6 for word in _RE_WORD.findall(text))
+
+
+def message_tokens(message):
+    return count_tokens(message.get("content")) + _MESSAGE_OVERHEAD
+
+
+def truncate_tokens(text, max_tokens):
+    """
+    Cut `text` down to about `max_tokens` tokens, marking the cut with an ellipsis.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text)[:max_tokens - 1]).rstrip() + " \u2026"
+    used = 0
+    for match in _RE_WORD.finditer(text):
+        used += 1 + (len(match.group()) - 1) // 6
+        if used > max_tokens - 1:
+            return text[:match.start()].rstrip() + " \u2026"
+    return text
+
+
+def build_system_prompt(persona, rules=(), summary=None, recent=None):
+    """
+    Build a system prompt from its segments, always in the same order and
+    layout so that it only changes when one of the segments does.
+
+    Args:
+        persona (str): Who the NPC is.
+        rules (iterable): World and per-NPC rules, in a fixed order.
+        summary (str, optional): What the NPC remembers of earlier events.
+        recent (str, optional): Summary of recent events, which changes more
+            often than `summary`.
+
+    Returns:
+        str: The system prompt.
+    """
+    segments = [(persona or "").strip()]
+    rules = [rule.strip() for rule in rules if rule and rule.strip()]
+    if rules:
+        segments.append("Rules:\n" + "\n".join(f"- {rule}" for rule in rules))
+    if summary and summary.strip():
+        segments.append("What you remember:\n" + summary.strip())
+    if recent and recent.strip():
+        segments.append("Lately:\n" + recent.strip())
+    return "\n\n".join(segments)
+
+
+def build_turn(instruction, facts=None):
+    """
+    Build a user turn from a fixed instruction followed by the volatile
+    facts of the moment, one per line, in the order given.
+
+    Args:
+        instruction (str): Text that is the same every time.
+        facts (list, optional): `(label, value)` pairs.
+
+    Returns:
+        str: The turn.
+    """
+    lines = [instruction.strip()]
+    lines.extend(f"{label}: {value}" for label, value in facts or ())
+    return "\n".join(lines)
+
+
+def ago(seconds):
+    """
+    Returns:
+        str: How long ago something `seconds` old happened, e.g. "3 days ago".
+    """
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count > 1 else ''} ago"
+    return "just now"
+
+
+def _compact(message, max_tokens):
+    return {"role": message["role"], "content": truncate_tokens(message["content"], max_tokens)}
+
+
+def fit_messages(system_prompt, messages, budget, max_turn_tokens=None):
+    """
+    Fit a request into `budget` tokens.
+
+    The system prompt and the last message (the current turn) are always
+    kept. History is then added from the newest turn backwards until the
+    budget is used up; the turn that no longer fits is compacted if there
+    is room left for a useful part of it, and everything older is dropped.
+
+    Args:
+        system_prompt (str): The system prompt.
+        messages (list): History ending with the current turn.
+        budget (int): Token budget for the whole request.
+        max_turn_tokens (int, optional): Single turns longer than this are
+            compacted before fitting, so one long monologue cannot crowd
+            out the rest of the history.
+
+    Returns:
+        tuple: `(messages, tokens, dropped, compacted)` - the messages to
+            send, their estimated prompt token count including the system
+            prompt, and how many history turns were dropped or compacted.
+    """
+    tokens = count_tokens(system_prompt) + _MESSAGE_OVERHEAD + _REPLY_OVERHEAD
+    if not messages:
+        return [], tokens, 0, 0
+
+    compacted = 0
+    current = messages[-1]
+    if max_turn_tokens and count_tokens(current["content"]) > max_turn_tokens:
+        current = _compact(current, max_turn_tokens)
+        compacted += 1
+    tokens += message_tokens(current)
+
+    kept = []
+    dropped = 0
+    history = messages[:-1]
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        if max_turn_tokens and count_tokens(message["content"]) > max_turn_tokens:
+            message = _compact(message, max_turn_tokens)
+            compacted += 1
+        cost = message_tokens(message)
+        if tokens + cost <= budget:
+            kept.append(message)
+            tokens += cost
+            continue
+        room = budget - tokens - _MESSAGE_OVERHEAD
+        if room >= _MIN_COMPACT_TOKENS:
+            message = _compact(message, room)
+            kept.append(message)
+            tokens += message_tokens(message)
+            compacted += 1
+            index -= 1
+        dropped = index + 1
+        break
+
+    kept.reverse()
+    kept.append(current)
+    return kept, tokens, dropped, compacted
+
+
+class PromptStats:
+    """
+    Running totals of prompt sizes.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens_total = 0
+        self.tokens_max = 0
+        self.tokens_last = 0
+        self.dropped = 0
+        self.compacted = 0
+
+    def record(self, tokens, dropped, compacted):
+        self.requests += 1
+        self.tokens_total += tokens
+        self.tokens_max = max(self.tokens_max, tokens)
+        self.tokens_last = tokens
+        self.dropped += dropped
+        self.compacted += compacted
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "tokens_avg": self.tokens_total / self.requests if self.requests else 0.0,
+            "tokens_max": self.tokens_max,
+            "tokens_last": self.tokens_last,
+            "dropped_turns": self.dropped,
+            "compacted_turns": self.compacted,
+        }
@@ -0,0 +1,149 @@
+"""
+LLM rate limiting
+
+A process-wide limiter for the provider's requests-per-minute and
+tokens-per-minute limits. The RequestScheduler asks it before dispatching
+each request; a request that would overdraw either budget is held in the
+queue until enough has refilled. The budget itself is taken by every call
+a backend sends (world.llm_router.Backend.call), so hedged and failed-over
+attempts are paid for too, and handed back when a call is cancelled or
+fails without using it. Low-priority request classes can be made
+to leave some headroom unused, so that ambient NPC chatter waits (and is
+eventually dropped at its deadline) before replies to players do.
+
+"""
+import time
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` units a minute up to `burst_seconds` worth of
+    refill. It may go into debt when a request turns out to cost more
+    than was reserved for it.
+    """
+
+    def __init__(self, per_minute, burst_seconds=10):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def headroom(self):
+        """
+        Returns:
+            float: The share of the bucket that is available, 0 to 1.
+        """
+        self._refill()
+        return max(0.0, self.level / self.capacity)
+
+    def wait_time(self, amount, keep=0.0):
+        """
+        Returns:
+            float: Seconds until `amount` can be taken while leaving a
+                `keep` share of the bucket, 0 if it can be taken now.
+        """
+        self._refill()
+        needed = min(amount + keep * self.capacity, self.capacity) - self.level
+        return max(0.0, needed / self.rate) if self.rate else 0.0
+
+    def take(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+    def drain(self):
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class RateLimiter:
+    """
+    Request and token budgets shared by all LLM calls.
+
+    Args:
+        requests_per_minute (int, optional): Request limit, None for none.
+        tokens_per_minute (int, optional): Token limit, None for none.
+        burst_seconds (float): How many seconds of budget may be spent at
+            once after a quiet spell.
+        backoff (float): Seconds nothing is sent after the provider
+            answered with HTTP 429.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, burst_seconds=10, backoff=10):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.backoff_seconds = backoff
+        self.blocked_until = 0
+        self.backoffs = 0
+
+    def wait_time(self, tokens, min_headroom=0.0):
+        """
+        Returns:
+            float: Seconds until one request and `tokens` tokens can be taken
+                while leaving `min_headroom` of each budget unused, 0 if
+                they can be taken now.
+        """
+        wait = self.blocked_until - time.time()
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, min_headroom))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, min_headroom))
+        return max(0.0, wait)
+
+    def acquire(self, tokens, min_headroom=0.0):
+        """
+        Take one request and `tokens` tokens from the budgets if both
+        allow it while leaving `min_headroom` of each unused.
+
+        Returns:
+            float: 0 if the budget was taken, else the seconds to wait
+                before asking again.
+        """
+        wait = self.wait_time(tokens, min_headroom)
+        if wait:
+            return wait
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        return 0.0
+
+    def settle(self, reserved, used):
+        """
+        Correct the token budget once a request's real token usage is known,
+        or hand back what it did not use when it failed or was cancelled.
+        """
+        if self.tokens:
+            self.tokens.take(used - reserved)
+
+    def backoff(self):
+        """
+        The provider said we are over its limit: empty the budgets and
+        send nothing for a while.
+        """
+        self.backoffs += 1
+        self.blocked_until = time.time() + self.backoff_seconds
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.drain()
+
+    def headroom(self):
+        """
+        Returns:
+            float: The share of the tighter budget that is available, 0 to 1.
+        """
+        if time.time() < self.blocked_until:
+            return 0.0
+        return min([bucket.headroom() for bucket in (self.requests, self.tokens) if bucket] or [1.0])
+
+    def stats(self):
+        return {
+            "headroom": self.headroom(),
+            "requests_headroom": self.requests.headroom() if self.requests else 1.0,
+            "tokens_headroom": self.tokens.headroom() if self.tokens else 1.0,
+            "backoffs": self.backoffs,
+        }
@@ -0,0 +1,201 @@
+"""
+LLM resilience
+
+Building blocks that keep NPCs responsive when the LLM backend degrades:
+a circuit breaker that stops dispatching while the backend keeps failing,
+rolling latency tracking, and hedged requests that race a second copy of
+a slow request against the first.
+
+"""
+import time
+from collections import deque
+
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
+
+
+class FallbackReply(str):
+    """
+    A canned line served instead of an LLM reply. It is never cached.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, no
+    requests are let through; after `reset_timeout` seconds a single trial
+    request is allowed (half-open), and its outcome closes or re-opens the
+    breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+
+    def is_available(self):
+        """
+        Returns:
+            bool: If `allow` would let a request through, without reserving
+                the half-open trial.
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.time() - self.opened_at >= self.reset_timeout
+        return not self.trial_in_flight
+
+    def allow(self):
+        """
+        Returns:
+            bool: If a request may be dispatched now.
+        """
+        if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def release(self):
+        """
+        The request let through by `allow` ended without an outcome
+        (it was cancelled), so it neither closes nor re-opens the breaker.
+        """
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.time()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """
+    Keeps the last `window` latency samples.
+    """
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct, min_samples=20):
+        """
+        Returns:
+            float or None: The `pct` percentile in seconds, or None if there
+                are fewer than `min_samples` samples to go on.
+        """
+        if len(self.samples) < min_samples:
+            return None
+        values = sorted(self.samples)
+        return values[min(len(values) - 1, int(pct / 100.0 * len(values)))]
+
+
+def hedge(start, delay, on_text=None, on_hedge=None):
+    """
+    Race a backup request against a slow one.
+
+    `start(on_text)` begins one attempt and returns a Deferred. If the
+    first attempt has not produced anything after `delay` seconds, a second
+    one is started. For streamed attempts, the first to deliver text wins
+    and only its text is passed on to `on_text`; otherwise the first to
+    succeed wins. The loser is cancelled.
+
+    Args:
+        start (callable): Starts an attempt, called with a text callback.
+        delay (float): Seconds to wait before hedging.
+        on_text (callable, optional): Receives streamed text of the winner.
+        on_hedge (callable, optional): Called when the backup is started.
+
+    Returns:
+        Deferred: Fires with the winner's result. Cancelling it cancels
+            every attempt.
+    """
+    attempts = []
+    state = {"winner": None, "timer": None}
+
+    def _cancel_others(keep):
+        for index, attempt in enumerate(attempts):
+            if index != keep and not attempt.called:
+                attempt.cancel()
+
+    def _cancel(_):
+        if state["timer"] and state["timer"].active():
+            state["timer"].cancel()
+        _cancel_others(None)
+
+    result = defer.Deferred(_cancel)
+
+    def _launch():
+        index = len(attempts)
+
+        def _on_text(text):
+            if state["winner"] is None:
+                state["winner"] = index
+                _cancel_others(index)
+            if state["winner"] == index and on_text:
+                on_text(text)
+
+        attempt = start(_on_text)
+        attempts.append(attempt)
+        attempt.addBoth(_done, index)
+
+    def _done(outcome, index):
+        if result.called or state["winner"] not in (None, index):
+            return None
+        failed = isinstance(outcome, Failure)
+        if failed and state["winner"] is None and any(not a.called for a in attempts):
+            # let the other attempt finish
+            return None
+        if state["timer"] and state["timer"].active():
+            state["timer"].cancel()
+        # settle the race first, so the loser being cancelled is not taken as its outcome
+        state["winner"] = index
+        _cancel_others(index)
+        if failed:
+            result.errback(outcome)
+        else:
+            result.callback(outcome)
+        return None
+
+    def _maybe_hedge():
+        if not result.called and state["winner"] is None:
+            if on_hedge:
+                on_hedge()
+            _launch()
+
+    _launch()
+    if not result.called:
+        state["timer"] = reactor.callLater(delay, _maybe_hedge)
+    return result
@@ -0,0 +1,216 @@
+"""
+LLM router
+
+Routes each request to one of several LLM backends. Backends are grouped
+into tiers (for example cheap and fast models for ambient NPC chatter,
+better ones for conversations with players), and every request class uses
+a tier unless the caller pins another one. Within a tier the backends are
+tried in order of preference, skipping any that are failing, saturated or
+slower than the tier's latency target, so traffic fails over to the next
+backend (such as a local llama.cpp server) automatically.
+
+"""
+import time
+from collections import deque
+
+from twisted.internet import defer, reactor
+from world.llm_prompt import count_tokens
+from world.llm_resilience import CircuitBreaker, LatencyTracker
+
+
+class NoBackendAvailable(Exception):
+    """
+    Raised when every backend of a tier is down or saturated.
+    """
+
+
+class Backend:
+    """
+    One LLM endpoint with its own circuit breaker and rolling health data.
+
+    Args:
+        name (str): Backend name from LLM_BACKENDS.
+        client (LLMClient): Client talking to the endpoint.
+        max_in_flight (int): Requests this backend takes before the router
+            overflows to the next backend in the tier.
+        breaker (CircuitBreaker): Breaker for this backend.
+        window (int): How many recent outcomes the error rate is based on.
+        limiter (RateLimiter, optional): Request and token budget every
+            call to this backend is taken from.
+    """
+
+    def __init__(self, name, client, max_in_flight=8, breaker=None, window=50, limiter=None):
+        self.name = name
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter
+        # time to first text for streamed requests, full time otherwise
+        self.latency = {True: LatencyTracker(), False: LatencyTracker()}
+        self.outcomes = deque(maxlen=window)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    @property
+    def configured(self):
+        return self.client.transport is not None
+
+    def available(self):
+        return self.configured and self.breaker.is_available() and self.in_flight < self.max_in_flight
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def call(self, messages, system_prompt, on_text=None, timeout=None, prompt_tokens=0, max_tokens=0):
+        """
+        Send one request to this backend, streamed if `on_text` is given.
+        A request that takes longer than `timeout` seconds is cancelled and
+        counts as a failure of this backend.
+
+        The request and `prompt_tokens` plus `max_tokens` tokens are taken
+        from the rate limiter; the request is not sent if they cannot be.
+        Once it ends, the limiter is settled with what it used: the reported
+        usage, or the prompt and the text received so far, or nothing if it
+        failed before any text arrived.
+
+        Returns:
+            Deferred: Fires with the reply text.
+        """
+        if not self.breaker.allow():
+            return defer.fail(NoBackendAvailable(self.name))
+        reserved = prompt_tokens + max_tokens
+        if self.limiter and self.limiter.acquire(reserved):
+            # out of budget; only hedges and failovers get here, the scheduler waits for the first try
+            self.breaker.release()
+            self.throttled += 1
+            return defer.fail(NoBackendAvailable(self.name))
+        self.requests += 1
+        self.in_flight += 1
+        streaming = on_text is not None
+        started = time.time()
+        first = []
+        received = []
+
+        def _on_text(text):
+            if not first:
+                first.append(time.time() - started)
+            received.append(text)
+            on_text(text)
+
+        def _settle(used):
+            if self.limiter:
+                self.limiter.settle(reserved, used)
+
+        if streaming:
+            d = self.client.stream_response(messages, system_prompt, _on_text)
+        else:
+            d = self.client.get_response(messages, system_prompt)
+        if timeout:
+            d.addTimeout(timeout, reactor)
+
+        def _success(response):
+            self.in_flight -= 1
+            self.breaker.record_success()
+            self.outcomes.append(True)
+            self.latency[streaming].record(first[0] if first else time.time() - started)
+            usage = getattr(response, "usage", None)
+            if usage:
+                _settle(usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+            else:
+                _settle(prompt_tokens + count_tokens(response or ""))
+            return response
+
+        def _failure(failure):
+            self.in_flight -= 1
+            _settle(prompt_tokens + count_tokens("".join(received)) if received else 0)
+            if failure.check(defer.CancelledError):
+                self.breaker.release()
+                return failure
+            self.errors += 1
+            self.breaker.record_failure()
+            self.outcomes.append(False)
+            return failure
+
+        d.addCallbacks(_success, _failure)
+        return d
+
+    def stats(self):
+        return {
+            "model": self.client.model,
+            "state": self.breaker.state if self.configured else "unconfigured",
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "error_rate": self.error_rate(),
+            "latency_p50": self.latency[True].percentile(50, min_samples=1)
+            or self.latency[False].percentile(50, min_samples=1) or 0.0,
+            "latency_p95": self.latency[True].percentile(95, min_samples=1)
+            or self.latency[False].percentile(95, min_samples=1) or 0.0,
+        }
+
+
+class LLMRouter:
+    """
+    Picks a backend for each request.
+
+    Args:
+        backends (dict): Backend name -> Backend.
+        tiers (dict): Tier name -> list of backend names, most preferred first.
+        class_tiers (dict): Request class -> tier used when the caller does
+            not pin one.
+        latency_targets (dict, optional): Tier -> median latency in seconds
+            above which a backend counts as slow and the next one is preferred.
+        error_threshold (float): Recent error rate above which a backend is
+            only used if nothing better is available.
+    """
+
+    def __init__(self, backends, tiers, class_tiers, latency_targets=None, error_threshold=0.5):
+        self.backends = backends
+        self.tiers = {name: [self.backends[backend] for backend in members]
+                      for name, members in tiers.items()}
+        self.class_tiers = class_tiers
+        self.latency_targets = latency_targets or {}
+        self.error_threshold = error_threshold
+
+    def tier_for(self, request_class, tier=None):
+        """
+        The tier to use: the pinned one if it exists, else the class default.
+        """
+        if tier in self.tiers:
+            return tier
+        tier = self.class_tiers.get(request_class)
+        if tier in self.tiers:
+            return tier
+        return next(iter(self.tiers))
+
+    def configured(self, tier):
+        return any(backend.configured for backend in self.tiers[tier])
+
+    def select(self, tier, streaming=False, exclude=()):
+        """
+        Returns:
+            Backend or None: The first healthy, fast enough backend of the
+                tier; failing that the least bad one that can take a request;
+                None if no backend can.
+        """
+        target = self.latency_targets.get(tier)
+        degraded = []
+        for backend in self.tiers[tier]:
+            if backend in exclude or not backend.available():
+                continue
+            latency = backend.latency[streaming].percentile(50, min_samples=5)
+            if backend.error_rate() > self.error_threshold or (target and latency and latency > target):
+                degraded.append((backend.error_rate(), latency or 0.0, backend))
+                continue
+            return backend
+        if degraded:
+            return min(degraded, key=lambda entry: entry[:2])[2]
+        return None
+
+    def stats(self):
+        return {name: backend.stats() for name, backend in self.backends.items()}
@@ -0,0 +1,234 @@
+"""
+LLM request scheduler
+
+Every LLM call goes through a single RequestScheduler. Requests are tagged
+with a request class (a player waiting on an NPC reply, a shard whisper,
+ambient NPC chatter) and dispatched in priority order with a cap on how
+many are in flight at once. Classes with a deadline give up on requests
+that waited in the queue for longer than that, so stale ambient ticks do
+not pile up behind conversations. Requests can carry a validity check
+(is the player still there?); one that fails it by the time the request
+would be dispatched is dropped without being sent. With a RateLimiter, requests are also
+held back while the provider's request or token budget is spent.
+
+"""
+import heapq
+import itertools
+import time
+
+from twisted.internet import defer, reactor
+
+# Request classes used by the game code.
+REPLY = "reply"  # an NPC answering a player who is waiting for it
+SHARD = "shard"  # the Memetic Shard whispering to its holder
+AMBIENT = "ambient"  # NPC ticks nobody asked for
+PREFETCH = "prefetch"  # replies generated before anyone asked, in case they do
+SUMMARY = "summary"  # NPCs condensing their memories in the background
+
+DEFAULT_CLASSES = {
+    REPLY: {"priority": 0, "deadline": None, "timeout": 15, "min_headroom": 0.0},
+    SHARD: {"priority": 1, "deadline": None, "timeout": 15, "min_headroom": 0.1},
+    AMBIENT: {"priority": 2, "deadline": 15, "timeout": 20, "min_headroom": 0.3},
+    PREFETCH: {"priority": 3, "deadline": 10, "timeout": 20, "min_headroom": 0.5},
+    SUMMARY: {"priority": 4, "deadline": None, "timeout": 30, "min_headroom": 0.5},
+}
+
+
+class ClassStats:
+    """
+    Counters for a single request class.
+    """
+
+    def __init__(self):
+        self.queued = 0
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.stale = 0
+        self.cancelled = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, wait):
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def as_dict(self):
+        dispatched = self.completed + self.in_flight
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "cancelled": self.cancelled,
+            "throttled": self.throttled,
+            "wait_avg": self.wait_total / dispatched if dispatched else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+class _Job:
+    __slots__ = ("request_class", "func", "args", "kwargs", "tokens", "is_valid", "deferred",
+                 "submitted", "inner", "cancelled", "throttled")
+
+    def __init__(self, request_class, func, args, kwargs, tokens=0, is_valid=None):
+        self.request_class = request_class
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.tokens = tokens
+        self.is_valid = is_valid
+        self.deferred = None
+        self.submitted = time.time()
+        self.inner = None
+        self.cancelled = False
+        self.throttled = False
+
+
+class RequestScheduler:
+    """
+    Priority queue with a concurrency limit in front of the LLM client.
+
+    Args:
+        classes (dict): Maps request class name to a dict with `priority`
+            (lower runs first) and `deadline` (seconds a request may wait
+            in the queue before it is dropped, or None to never drop) and
+            optionally `min_headroom` (share of the rate limit budget the
+            class must leave unused). Other keys, such as the `timeout`
+            for the call once it is dispatched, are left for the caller.
+        max_concurrent (int): How many requests may be in flight at once.
+        limiter (RateLimiter, optional): Request and token budget every
+            dispatch waits for.
+    """
+
+    def __init__(self, classes=None, max_concurrent=8, limiter=None):
+        self.classes = dict(classes or DEFAULT_CLASSES)
+        self.max_concurrent = max_concurrent
+        self.limiter = limiter
+        self.active = 0
+        self._queue = []
+        self._counter = itertools.count()
+        self._stats = {name: ClassStats() for name in self.classes}
+        self._wakeup = None
+        self._pumping = False
+
+    def _class_conf(self, request_class):
+        if request_class not in self.classes:
+            raise ValueError(f"Unknown LLM request class: {request_class}")
+        return self.classes[request_class]
+
+    def submit(self, request_class, func, *args, tokens=0, is_valid=None, **kwargs):
+        """
+        Queue `func(*args, **kwargs)` to run when a slot is free and the
+        rate limiter has budget for a request of about `tokens` tokens.
+        If `is_valid` is given, it is called just before dispatch and the
+        request is dropped if it returns False.
+
+        Returns:
+            Deferred: Fires with the result of `func`, or with None if the
+                request was dropped for waiting past its class deadline
+                or for no longer being valid.
+                Cancelling it removes a queued request from the queue or
+                cancels a running one.
+        """
+        conf = self._class_conf(request_class)
+        job = _Job(request_class, func, args, kwargs, tokens, is_valid)
+        job.deferred = defer.Deferred(lambda _: self._cancel(job))
+        stats = self._stats[request_class]
+        stats.submitted += 1
+        stats.queued += 1
+        heapq.heappush(self._queue, (conf["priority"], next(self._counter), job))
+        self._pump()
+        return job.deferred
+
+    def _cancel(self, job):
+        stats = self._stats[job.request_class]
+        stats.cancelled += 1
+        if job.inner is not None:
+            job.inner.cancel()
+        elif not job.cancelled:
+            # still queued; it is skipped when it reaches the head of the queue
+            job.cancelled = True
+            stats.queued -= 1
+
+    def _pump(self):
+        if self._pumping:
+            # a job finished while being dispatched; the loop below picks up the freed slot
+            return
+        self._pumping = True
+        try:
+            self._drain()
+        finally:
+            self._pumping = False
+
+    def _drain(self):
+        while self._queue and self.active < self.max_concurrent:
+            _, _, job = self._queue[0]
+            if job.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            stats = self._stats[job.request_class]
+            conf = self.classes[job.request_class]
+            wait = time.time() - job.submitted
+            if conf["deadline"] is not None and wait > conf["deadline"]:
+                heapq.heappop(self._queue)
+                stats.queued -= 1
+                stats.dropped += 1
+                job.deferred.callback(None)
+                continue
+            if job.is_valid is not None and not job.is_valid():
+                # nobody wants the answer any more
+                heapq.heappop(self._queue)
+                stats.queued -= 1
+                stats.stale += 1
+                job.deferred.callback(None)
+                continue
+            if self.limiter:
+                # only checked here; the backend call takes the budget when it is sent
+                delay = self.limiter.wait_time(job.tokens, conf.get("min_headroom", 0.0))
+                if delay:
+                    # the head of the queue waits for budget, and so does everything behind it
+                    if not job.throttled:
+                        job.throttled = True
+                        stats.throttled += 1
+                    self._wake_in(delay)
+                    return
+            heapq.heappop(self._queue)
+            stats.queued -= 1
+            stats.record_wait(wait)
+            self._dispatch(job)
+
+    def _wake_in(self, delay):
+        if self._wakeup and self._wakeup.active():
+            if self._wakeup.getTime() <= time.time() + delay:
+                return
+            self._wakeup.cancel()
+        self._wakeup = reactor.callLater(delay, self._pump)
+
+    def _dispatch(self, job):
+        stats = self._stats[job.request_class]
+        self.active += 1
+        stats.in_flight += 1
+        job.inner = defer.maybeDeferred(job.func, *job.args, **job.kwargs)
+
+        def _finish(result):
+            self.active -= 1
+            stats.in_flight -= 1
+            stats.completed += 1
+            self._pump()
+            return result
+
+        job.inner.addBoth(_finish)
+        job.inner.chainDeferred(job.deferred)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per-class queue depth, in-flight count, counters and
+                queue wait times in seconds.
+        """
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
@@ -0,0 +1,185 @@
+"""
+LLM semantic cache
+
+Players ask the same NPC the same thing in different words ("where is the
+blacksmith?", "where's the smithy?"). The semantic cache keeps, per NPC,
+the embeddings of recently asked questions next to the answers they got,
+and answers a new question from there if it is close enough (by cosine
+similarity) to one of them.
+
+Embeddings come from a local embedder, so no API call is needed to look a
+question up. The default HashingEmbedder hashes words and character
+trigrams into a fixed-size vector; it catches rewordings and typos but
+not synonyms. Any class with `dim` and `embed(text)` (returning a unit
+length float32 vector) can be plugged in instead, e.g. one wrapping a
+small sentence-transformers model.
+
+Requires numpy; without it the cache is disabled.
+
+"""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_RE_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Feature-hashing embedder: word unigrams and character trigrams of the
+    lowercased text, hashed into `dim` buckets with a sign bit.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _features(self, text):
+        words = _RE_WORD.findall(text.lower())
+        for word in words:
+            yield "w:" + word
+            padded = f" {word} "
+            for index in range(len(padded) - 2):
+                yield "c:" + padded[index:index + 3]
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticStore:
+    """
+    Question embeddings and their answers for one NPC, in a preallocated
+    matrix of `max_entries` rows. When it is full, the least recently
+    used entry is replaced.
+    """
+
+    def __init__(self, dim, max_entries=64, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.answers = [None] * max_entries
+        self.stored_at = np.zeros(max_entries)
+        self.used_at = np.zeros(max_entries)
+        self.size = 0
+
+    def nearest(self, vector):
+        """
+        Returns:
+            tuple: `(index, similarity)` of the closest stored question,
+                `(None, 0.0)` if the store is empty.
+        """
+        if not self.size:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, vector, threshold):
+        """
+        Returns:
+            str or None: The answer to the closest stored question if it is
+                at least `threshold` similar and has not expired.
+        """
+        index, score = self.nearest(vector)
+        if index is None or score < threshold:
+            return None
+        now = time.time()
+        if self.ttl is not None and now - self.stored_at[index] > self.ttl:
+            return None
+        self.used_at[index] = now
+        return self.answers[index]
+
+    def add(self, vector, answer, index=None):
+        """
+        Store an answer, at `index` to replace that entry, else in a free
+        row or the least recently used one.
+        """
+        if index is None:
+            if self.size < self.max_entries:
+                index = self.size
+                self.size += 1
+            else:
+                index = int(np.argmin(self.used_at))
+        now = time.time()
+        self.vectors[index] = vector
+        self.answers[index] = answer
+        self.stored_at[index] = now
+        self.used_at[index] = now
+
+
+class SemanticCache:
+    """
+    One SemanticStore per scope (an NPC and the player asking it), created
+    on first use. Stores that have not been used for a while are dropped
+    once there are more than `max_npcs`.
+
+    Args:
+        embedder: Object with `dim` and `embed(text)`.
+        threshold (float): Minimum cosine similarity for a hit.
+        max_entries (int): Questions remembered per NPC.
+        max_npcs (int): Stores kept at once.
+        ttl (int or None): Seconds an answer may be reused.
+    """
+
+    def __init__(self, embedder, threshold=0.9, max_entries=64, max_npcs=500, ttl=1800):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_npcs = max_npcs
+        self.ttl = ttl
+        self._stores = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, scope, create=False):
+        store = self._stores.get(scope)
+        if store is None and create:
+            store = self._stores[scope] = SemanticStore(self.embedder.dim, self.max_entries, self.ttl)
+            while len(self._stores) > self.max_npcs:
+                self._stores.popitem(last=False)
+        if store is not None:
+            self._stores.move_to_end(scope)
+        return store
+
+    def get(self, scope, question):
+        """
+        Returns:
+            str or None: A stored answer to a question like `question`
+                asked in `scope` (an NPC id and who asked it), or None.
+        """
+        store = self._store(scope)
+        answer = None
+        if store is not None:
+            answer = store.lookup(self.embedder.embed(question), self.threshold)
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def set(self, scope, question, answer):
+        store = self._store(scope, create=True)
+        vector = self.embedder.embed(question)
+        # a close enough question already stored gets the new answer instead of a second row
+        index, score = store.nearest(vector)
+        store.add(vector, answer, index if score >= self.threshold else None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "npcs": len(self._stores),
+            "entries": sum(store.size for store in self._stores.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,118 @@
+"""
+LLM single-flight
+
+Coalesces identical LLM requests that are in flight at the same time. The
+first caller for a key starts the real call; later callers with the same
+key get a Deferred that fires with the same result instead of starting a
+duplicate call. The shared call stays valid as long as any of its callers
+still wants the result. Text streamed by the shared call is fanned out to
+every caller that asked for it, including what was streamed before a
+caller attached.
+
+"""
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+
+class SingleFlight:
+    """
+    Tracks pending calls by key and fans their results out to every caller.
+    """
+
+    def __init__(self):
+        self._pending = {}  # key -> (shared Deferred, [(caller Deferred, is_valid, on_text)], [text so far])
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def run(self, key, func, *args, is_valid=None, on_text=None, **kwargs):
+        """
+        Call `func(*args, **kwargs)` unless a call for `key` is already
+        pending, in which case attach to that one.
+
+        `is_valid`, if given, tells if this caller still wants the result.
+        `func` is then passed an `is_valid` keyword of its own, which is
+        True while any of the callers attached to the call does.
+
+        `on_text`, if given, is called with each piece of text the call
+        streams. The first caller's `on_text` makes `func` get an `on_text`
+        keyword of its own that feeds every attached caller; callers that
+        attach to a call started without one only get the result.
+
+        Returns:
+            Deferred: Fires with the shared result. Cancelling it detaches
+                this caller; the shared call is only cancelled once every
+                caller has detached.
+        """
+        if key in self._pending:
+            self.coalesced += 1
+            shared, waiters, texts = self._pending[key]
+            if on_text is not None:
+                # catch up on what the others already got
+                for text in texts:
+                    on_text(text)
+        else:
+            self.calls += 1
+            waiters = []
+            texts = []
+            if is_valid is not None:
+                kwargs["is_valid"] = lambda: self._any_valid(waiters, is_valid)
+            if on_text is not None:
+                kwargs["on_text"] = lambda text: self._stream(waiters, texts, on_text, text)
+            shared = defer.maybeDeferred(func, *args, **kwargs)
+            if shared.called:
+                # finished synchronously; nobody else can attach to it
+                return shared
+            self._pending[key] = (shared, waiters, texts)
+            shared.addBoth(self._fan_out, key)
+
+        d = defer.Deferred(lambda d: self._detach(key, d))
+        waiters.append((d, is_valid, on_text))
+        return d
+
+    @staticmethod
+    def _any_valid(waiters, first):
+        if not waiters:
+            # not attached yet, so the first caller is the only one
+            return first()
+        return any(is_valid is None or is_valid() for _, is_valid, _ in waiters)
+
+    @staticmethod
+    def _stream(waiters, texts, first, text):
+        texts.append(text)
+        if not waiters:
+            first(text)
+        for _, _, on_text in list(waiters):
+            if on_text is not None:
+                on_text(text)
+
+    def _detach(self, key, d):
+        pending = self._pending.get(key)
+        if not pending:
+            return
+        shared, waiters, _ = pending
+        waiters[:] = [waiter for waiter in waiters if waiter[0] is not d]
+        if not waiters:
+            del self._pending[key]
+            shared.cancel()
+
+    def _fan_out(self, result, key):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            # every caller detached and the shared call was cancelled
+            return None
+        for d, _, _ in pending[1]:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+        return None
+
+    def stats(self):
+        return {
+            "in_flight": len(self._pending),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,64 @@
+"""
+LLM streaming helpers
+
+Streamed replies arrive a few characters at a time. SentenceChunker
+buffers them and hands out sentence-sized pieces that are worth sending
+to a player on their own.
+
+"""
+import re
+
+# a newline, or sentence-ending punctuation (plus closing quotes/brackets)
+# followed by whitespace
+_RE_BOUNDARY = re.compile(r"\n|[.!?]+[\"')\]]*(?=\s)")
+
+
+class SentenceChunker:
+    """
+    Splits streamed text into sentences.
+
+    `feed` and `flush` return lists of `(text, new_line)` tuples, where
+    `new_line` is True if the piece starts a new line of the reply. Sentence
+    breaks shorter than `min_chars` are merged with the following sentence
+    so abbreviations like "Mr." do not produce tiny fragments.
+    """
+
+    def __init__(self, min_chars=12):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._new_line = True
+
+    def feed(self, text):
+        self._buffer += text
+        pieces = []
+        pos = 0
+        while True:
+            match = _RE_BOUNDARY.search(self._buffer, pos)
+            if not match:
+                break
+            if match.group() == "\n":
+                self._emit(pieces, self._buffer[:match.start()])
+                self._new_line = True
+            elif len(self._buffer[:match.end()].strip()) < self.min_chars:
+                pos = match.end()
+                continue
+            else:
+                self._emit(pieces, self._buffer[:match.end()])
+            self._buffer = self._buffer[match.end():]
+            pos = 0
+        return pieces
+
+    def flush(self):
+        """
+        Return whatever is left in the buffer once the stream has ended.
+        """
+        pieces = []
+        self._emit(pieces, self._buffer)
+        self._buffer = ""
+        return pieces
+
+    def _emit(self, pieces, text):
+        text = text.strip()
+        if text:
+            pieces.append((text, self._new_line))
+            self._new_line = False
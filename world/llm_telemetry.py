@@ -0,0 +1,182 @@
+"""
+LLM telemetry
+
+Every LLM request made through world.llm is described by a CallRecord:
+who asked (request class and the NPC or object it was for), how long it
+waited in the queue, how long the backend took, token counts (including
+prompt tokens served from the provider's prefix cache), whether it
+was answered from the cache and how it ended. Records are folded into
+in-memory histograms per request class and per source object, so the
+NPCs and prompts behind the slowest calls can be found.
+
+"""
+import time
+from collections import Counter
+
+# histogram bucket upper bounds, in seconds
+LATENCY_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+
+class CallRecord:
+    """
+    What happened to a single request. Times are `time.time()` values,
+    left as None for steps the request never reached.
+    """
+
+    __slots__ = ("request_class", "source", "source_key", "submitted", "dispatched", "first_text",
+                 "completed", "prompt_tokens", "cached_tokens", "completion_tokens", "cache",
+                 "outcome", "backend")
+
+    def __init__(self, request_class, source=None, prompt_tokens=0):
+        self.request_class = request_class
+        self.source = f"#{source.id}" if source is not None else None
+        self.source_key = source.key if source is not None else None
+        self.submitted = time.time()
+        self.dispatched = None
+        self.first_text = None
+        self.completed = None
+        self.prompt_tokens = prompt_tokens  # estimate until the backend reports usage
+        self.cached_tokens = 0  # prompt tokens the backend served from its prefix cache
+        self.completion_tokens = 0
+        self.cache = None  # "hit", "semantic", "miss", "coalesced" or "off"
+        self.outcome = None  # "ok", "fallback", "timeout", "error", "unavailable", "dropped", "stale", ...
+        self.backend = None
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Percentiles are estimated as the upper bound
+    of the bucket they fall in.
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if index == len(self.bounds):
+                    return self.max
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    def as_dict(self):
+        buckets = {f"<={bound}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": buckets,
+        }
+
+
+class CallSeries:
+    """
+    Aggregate of many CallRecords.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.queue_wait = Histogram()
+        self.first_text = Histogram()  # streamed calls only
+        self.latency = Histogram()  # dispatch to last byte
+        self.total = Histogram()  # submit to result, as seen by the caller
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cache = Counter()
+        self.outcomes = Counter()
+
+    def record(self, call, finished):
+        self.calls += 1
+        if call.dispatched is not None:
+            self.queue_wait.record(call.dispatched - call.submitted)
+            if call.first_text is not None:
+                self.first_text.record(call.first_text - call.dispatched)
+            if call.completed is not None:
+                self.latency.record(call.completed - call.dispatched)
+        self.total.record(finished - call.submitted)
+        self.prompt_tokens += call.prompt_tokens or 0
+        self.cached_tokens += call.cached_tokens or 0
+        self.completion_tokens += call.completion_tokens or 0
+        self.cache[call.cache or "off"] += 1
+        self.outcomes[call.outcome or "ok"] += 1
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "queue_wait": self.queue_wait.as_dict(),
+            "first_text": self.first_text.as_dict(),
+            "latency": self.latency.as_dict(),
+            "total": self.total.as_dict(),
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache": dict(self.cache),
+            "outcomes": dict(self.outcomes),
+        }
+
+
+class Telemetry:
+    """
+    Call statistics per request class and per source object.
+
+    Args:
+        max_sources (int): Sources tracked individually; calls from further
+            sources are only counted in their request class.
+    """
+
+    def __init__(self, max_sources=1000):
+        self.max_sources = max_sources
+        self.classes = {}
+        self.sources = {}
+        self.source_keys = {}
+
+    def record(self, call):
+        finished = time.time()
+        self.classes.setdefault(call.request_class, CallSeries()).record(call, finished)
+        if call.source is None:
+            return
+        if call.source not in self.sources and len(self.sources) >= self.max_sources:
+            return
+        self.sources.setdefault(call.source, CallSeries()).record(call, finished)
+        self.source_keys[call.source] = call.source_key
+
+    def top_sources(self, count=10, pct=99):
+        """
+        Returns:
+            list: `(source, key, series)` for the `count` sources with the
+                highest `pct` percentile of total call time, slowest first.
+        """
+        ranked = sorted(self.sources.items(), key=lambda item: item[1].total.percentile(pct),
+                        reverse=True)
+        return [(source, self.source_keys.get(source), series) for source, series in ranked[:count]]
+
+    def stats(self):
+        return {
+            "classes": {name: series.as_dict() for name, series in self.classes.items()},
+            "sources": {source: dict(series.as_dict(), key=self.source_keys.get(source))
+                        for source, series in self.sources.items()},
+        }
@@ -0,0 +1,180 @@
+"""
+LLM transport
+
+Non-blocking HTTP transport for OpenAI-compatible chat endpoints. Requests
+are issued from the Twisted reactor through a shared pool of keep-alive
+connections, so an in-flight LLM call costs a socket rather than a thread
+from the reactor thread pool.
+
+"""
+import json
+from io import BytesIO
+
+from twisted.internet import defer, protocol, reactor
+from twisted.python.failure import Failure
+from twisted.web.client import (
+    Agent, FileBodyProducer, HTTPConnectionPool, PotentialDataLoss, ResponseDone, readBody)
+from twisted.web.http_headers import Headers
+
+
+class LLMHTTPError(Exception):
+    """
+    Raised when the endpoint answers with a non-2xx status code.
+    """
+
+    def __init__(self, code, body):
+        self.code = code
+        self.body = body
+        super().__init__(f"LLM endpoint returned HTTP {code}: {body[:200]!r}")
+
+
+class _EventStream(protocol.Protocol):
+    """
+    Reads a `text/event-stream` response body and hands every decoded
+    `data:` event to `on_event` as soon as its line is complete.
+
+    `finished` fires with None when the body ends. Cancelling it aborts
+    the request, or the body download if the response already arrived.
+    """
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.finished = defer.Deferred(self._cancel)
+        self.request = None
+        self._buffer = b""
+        self._stopped = False
+
+    def _cancel(self, _):
+        self._stopped = True
+        if self.transport:
+            self.transport.stopProducing()
+        elif self.request:
+            self.request.cancel()
+
+    def _fail(self, failure):
+        if not self.finished.called:
+            self.finished.errback(failure)
+
+    def got_response(self, response):
+        if self._stopped:
+            return
+        if not 200 <= response.code < 300:
+            d = readBody(response)
+            d.addCallback(lambda body: self._fail(Failure(LLMHTTPError(response.code, body))))
+            d.addErrback(self._fail)
+            return
+        response.deliverBody(self)
+
+    def dataReceived(self, data):
+        self._buffer += data
+        while not self._stopped and b"\n" in self._buffer:
+            line, self._buffer = self._buffer.split(b"\n", 1)
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            event = line[5:].strip()
+            if event == b"[DONE]":
+                continue
+            try:
+                self.on_event(json.loads(event))
+            except Exception:
+                self._stopped = True
+                self.transport.stopProducing()
+                self._fail(Failure())
+
+    def connectionLost(self, reason):
+        if self.finished.called or self._stopped:
+            return
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.callback(None)
+        else:
+            self.finished.errback(reason)
+
+
+class HTTPTransport:
+    """
+    Posts JSON payloads to an OpenAI-compatible endpoint.
+
+    At most `max_connections` requests are on the wire at once; further
+    requests wait on a DeferredSemaphore instead of opening more sockets.
+    Finished connections are parked in the pool and reused by the next
+    request to the same host until they have been idle for `idle_timeout`
+    seconds.
+    """
+
+    def __init__(self, base_url, api_key=None, max_connections=8, idle_timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = max_connections
+        self.pool.cachedConnectionTimeout = idle_timeout
+        self.agent = Agent(reactor, pool=self.pool)
+        self.semaphore = defer.DeferredSemaphore(max_connections)
+
+    @property
+    def in_flight(self):
+        return self.max_connections - self.semaphore.tokens
+
+    @property
+    def waiting(self):
+        return len(self.semaphore.waiting)
+
+    def _headers(self):
+        headers = Headers({b"Content-Type": [b"application/json"]})
+        if self.api_key:
+            headers.addRawHeader(b"Authorization", f"Bearer {self.api_key}".encode("utf-8"))
+        return headers
+
+    def post_json(self, path, payload):
+        """
+        POST `payload` to `path` (relative to `base_url`).
+
+        Returns:
+            Deferred: Fires with the decoded JSON response, or errbacks
+                with LLMHTTPError on a non-2xx status.
+        """
+        return self.semaphore.run(self._post_json, path, payload)
+
+    def _post_json(self, path, payload):
+        url = f"{self.base_url}/{path.lstrip('/')}".encode("utf-8")
+        body = FileBodyProducer(BytesIO(json.dumps(payload).encode("utf-8")))
+        d = self.agent.request(b"POST", url, self._headers(), body)
+        d.addCallback(self._read_json)
+        return d
+
+    def _read_json(self, response):
+        d = readBody(response)
+
+        def _decode(data):
+            if not 200 <= response.code < 300:
+                raise LLMHTTPError(response.code, data)
+            return json.loads(data)
+
+        d.addCallback(_decode)
+        return d
+
+    def stream_json(self, path, payload, on_event):
+        """
+        POST `payload` to `path` and read the response as a server-sent
+        event stream, calling `on_event(event)` with each decoded event.
+
+        Returns:
+            Deferred: Fires with None once the stream ends. Cancelling it
+                closes the stream.
+        """
+        return self.semaphore.run(self._stream_json, path, payload, on_event)
+
+    def _stream_json(self, path, payload, on_event):
+        url = f"{self.base_url}/{path.lstrip('/')}".encode("utf-8")
+        body = FileBodyProducer(BytesIO(json.dumps(payload).encode("utf-8")))
+        stream = _EventStream(on_event)
+        stream.request = self.agent.request(b"POST", url, self._headers(), body)
+        stream.request.addCallbacks(stream.got_response, stream._fail)
+        return stream.finished
+
+    def close(self):
+        """
+        Drop all idle keep-alive connections.
+        """
+        return self.pool.closeCachedConnections()
@@ -0,0 +1,123 @@
+"""
+Room perception
+
+What an NPC sees around it, for its prompts: the characters, objects and
+exits in its room. Each room keeps one RoomDigest in its ndb, shared by
+all NPCs there. It is built from the room's contents once, then updated
+as things enter and leave (typeclasses.rooms.Room.at_object_receive and
+at_object_leave), and by `enter` and `leave` for the ways off and onto the
+grid that skip those hooks: characters logging out and in, and objects
+being deleted (PerceptionMixin). Its prompt text is rendered at most once per change
+for each NPC looking, instead of walking the contents and asking every
+object its display name on every tick.
+
+Objects renamed in place keep their old name here until they move.
+
+"""
+from evennia.objects.objects import DefaultCharacter
+from evennia.utils.utils import inherits_from
+
+
+def _kind(obj):
+    if obj.destination:
+        return "exit"
+    if inherits_from(obj, DefaultCharacter):
+        return "character"
+    return "object"
+
+
+def _name(obj):
+    # some typeclasses hide their display name from a None looker
+    return obj.get_display_name(None) or obj.key
+
+
+class RoomDigest:
+    """
+    The names of everything in a room, by kind.
+    """
+
+    def __init__(self, room):
+        self.room = room
+        self.entries = {}  # object id -> (kind, name)
+        self.version = 0
+        self._rendered = {}  # viewer id -> facts, for the current version
+        for obj in room.contents:
+            self.entries[obj.id] = (_kind(obj), _name(obj))
+
+    def add(self, obj):
+        entry = (_kind(obj), _name(obj))
+        if self.entries.get(obj.id) != entry:
+            self.entries[obj.id] = entry
+            self._changed()
+
+    def remove(self, obj):
+        if self.entries.pop(obj.id, None):
+            self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._rendered = {}
+
+    def facts(self, viewer):
+        """
+        Returns:
+            list: `(label, value)` pairs of what `viewer` sees here, for
+                world.llm_prompt.build_turn. Empty lists are left out.
+        """
+        facts = self._rendered.get(viewer.id)
+        if facts is None:
+            names = {"character": [], "object": [], "exit": []}
+            for obj_id, (kind, name) in self.entries.items():
+                if obj_id != viewer.id:
+                    names[kind].append(name)
+            facts = [(label, ", ".join(sorted(names[kind])))
+                     for label, kind in (("Characters here", "character"), ("You see", "object"),
+                                         ("Exits", "exit"))
+                     if names[kind]]
+            self._rendered[viewer.id] = facts
+        return facts
+
+
+class PerceptionMixin:
+    """
+    Typeclass mixin that takes a deleted object out of its room's digest.
+    Deleting moves it off the grid without the room's at_object_leave.
+    """
+
+    def at_object_delete(self):
+        if not super().at_object_delete():
+            return False
+        leave(self, self.location)
+        return True
+
+
+def enter(obj, room):
+    """
+    Note that `obj` is in `room` now, having got there without the room's
+    at_object_receive hook being called.
+    """
+    digest = digest_for(room, build=False) if room else None
+    if digest:
+        digest.add(obj)
+
+
+def leave(obj, room):
+    """
+    Note that `obj` is gone from `room`, without the room's at_object_leave
+    hook being called.
+    """
+    digest = digest_for(room, build=False) if room else None
+    if digest:
+        digest.remove(obj)
+
+
+def digest_for(room, build=True):
+    """
+    Returns:
+        RoomDigest or None: The digest of `room`; None if it has none yet
+            and `build` is False.
+    """
+    digest = room.ndb.perception
+    if digest is None and build:
+        digest = room.ndb.perception = RoomDigest(room)
+    return digest
@@ -0,0 +1,128 @@
+"""
+Presence
+
+A live count of puppeted characters (players) per room and per zone, kept
+up to date as they move, log in and log out. It tells the NPC brain if
+anyone is near enough to an NPC to see what it does; NPCs nobody could
+observe are left dormant instead of spending LLM calls on an empty room.
+
+A room's zone is its tag in the "zone" category, if it has one.
+
+"""
+from collections import Counter
+
+
+def zone_of(room):
+    """
+    Returns:
+        str or None: The zone tag of `room`.
+    """
+    zones = room.tags.get(category="zone", return_list=True) if room else None
+    return zones[0] if zones else None
+
+
+def rooms_within(room, radius):
+    """
+    Returns:
+        set: `room` and the rooms at most `radius` exits away from it.
+    """
+    found = {room}
+    edge = [room]
+    for _ in range(radius):
+        edge = [exit.destination for here in edge for exit in here.exits
+                if exit.destination and exit.destination not in found]
+        found.update(edge)
+    return found
+
+
+class PresenceIndex:
+    """
+    Which room each player is in, with counts per room id and per zone.
+    Filled from the connected sessions the first time it is used, since it
+    does not survive a reload.
+    """
+
+    def __init__(self):
+        self._where = {}  # player id -> (room id, zone)
+        self.rooms = Counter()
+        self.zones = Counter()
+        self._built = False
+
+    def _build(self):
+        if self._built:
+            return
+        from evennia import SESSION_HANDLER
+
+        self._built = True
+        for session in SESSION_HANDLER.get_sessions():
+            puppet = session.get_puppet()
+            if puppet and puppet.location:
+                self._place(puppet.id, puppet.location)
+
+    def _place(self, player_id, room):
+        self._remove(player_id)
+        zone = zone_of(room)
+        self._where[player_id] = (room.id, zone)
+        self.rooms[room.id] += 1
+        if zone:
+            self.zones[zone] += 1
+
+    def _remove(self, player_id):
+        where = self._where.pop(player_id, None)
+        if where is None:
+            return
+        room_id, zone = where
+        self.rooms[room_id] -= 1
+        if not self.rooms[room_id]:
+            del self.rooms[room_id]
+        if zone:
+            self.zones[zone] -= 1
+            if not self.zones[zone]:
+                del self.zones[zone]
+
+    def place(self, player, room):
+        """
+        Note that `player` is now in `room` (None when it left the grid).
+        """
+        self._build()
+        if room is None:
+            self._remove(player.id)
+        else:
+            self._place(player.id, room)
+
+    def remove(self, player):
+        self._build()
+        self._remove(player.id)
+
+    def count(self, room):
+        self._build()
+        return self.rooms.get(room.id, 0)
+
+    def zone_count(self, zone):
+        self._build()
+        return self.zones.get(zone, 0)
+
+    def observed(self, room, radius):
+        """
+        Returns:
+            bool: If a player is within `radius` exits of `room`, or in its
+                zone if `radius` is "zone" (just in the room if it has none).
+        """
+        self._build()
+        if not self._where or room is None:
+            return False
+        if radius == "zone":
+            zone = zone_of(room)
+            return self.zone_count(zone) > 0 if zone else self.count(room) > 0
+        return any(self.rooms.get(near.id) for near in rooms_within(room, radius))
+
+    def stats(self):
+        self._build()
+        return {
+            "players": len(self._where),
+            "rooms": len(self.rooms),
+            "zones": dict(self.zones),
+        }
+
+
+PRESENCE = PresenceIndex()
@@ -96,6 +96,9 @@ LLM_NPC = {
     "llm_enabled": True,
     "llm_cooldown": 5,
     "memory_size": 20,
+    "llm_tier": None,  # LLM_TIERS entry, e.g. "quality"; None picks one per request class
+    "llm_prefetch": False,  # prepare greetings for players in neighbouring rooms
+    "llm_priority": 0,  # who answers first when several NPCs hear the same thing
     "auto_act_interval": 60  # Default to acting every minute if in room
 }
 
@@ -109,6 +112,8 @@ BARNABY = {
         "You know everyone's business but are harmless. "
         "You speak in a warm, rustic tone."
     ),
+    "llm_prefetch": True,  # greets everyone who walks into the inn
+    "llm_priority": 2,  # the host speaks up before his guests
     "auto_act_interval": 45
 }
 
@@ -135,6 +140,7 @@ ELARA = {
         "You warn travelers of the darkness rising in the old Watchtower."
     ),
     "llm_autonomy_level": "high",
+    "llm_tier": "quality",  # her riddles need the better model, even when idle
     "personality_growth": True,
     "auto_act_interval": 30
 }
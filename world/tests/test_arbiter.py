@@ -0,0 +1,149 @@
+"""
+Tests for world.arbiter.
+
+"""
+from unittest import mock
+
+from django.test import override_settings
+from evennia.utils import create
+from evennia.utils.test_resources import EvenniaTest
+from twisted.internet import task
+
+from world import arbiter
+from world.arbiter import NAME_WEIGHT, RECENCY_WEIGHT, RoomArbiter, score, talked_with
+
+
+class _ArbiterTest(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.barnaby = create.create_object("typeclasses.llm_character.LLMCharacter", key="Barnaby",
+                                            location=self.room1, aliases=["barkeep"])
+        self.elara = create.create_object("typeclasses.llm_character.LLMCharacter", key="Elara",
+                                          location=self.room1)
+
+
+class TestScore(_ArbiterTest):
+    def test_named(self):
+        lines = [(self.char1, "Barnaby, a pint please")]
+        self.assertEqual(score(self.barnaby, lines), NAME_WEIGHT)
+        self.assertEqual(score(self.elara, lines), 0)
+        self.assertEqual(score(self.barnaby, [(self.char1, "Hey barkeep!")]), NAME_WEIGHT)
+        # names are matched as whole words
+        self.assertEqual(score(self.elara, [(self.char1, "Elaras are birds")]), 0)
+
+    def test_recency(self):
+        talked_with(self.elara, [self.char1], now=100)
+        lines = [(self.char1, "And then?")]
+        self.assertEqual(score(self.elara, lines, now=100), RECENCY_WEIGHT)
+        self.assertAlmostEqual(score(self.elara, lines, now=100 + arbiter.RECENCY_HALF_LIFE), RECENCY_WEIGHT / 2)
+        self.assertEqual(score(self.elara, [(self.char2, "And then?")], now=100), 0)
+
+    def test_priority(self):
+        self.barnaby.db.llm_priority = 2
+        self.assertEqual(score(self.barnaby, [(self.char1, "Hello")]), 2)
+
+
+@override_settings(LLM_ROOM_ARBITER={"max_speakers": 2, "min_score": 3, "group_reply": False},
+                   LLM_CHATTER_WINDOW=1)
+class TestDecide(_ArbiterTest):
+    def setUp(self):
+        super().setUp()
+        self.clock = task.Clock()
+        patcher = mock.patch.object(arbiter, "reactor", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for npc in (self.barnaby, self.elara):
+            for method in ("answer_later", "overhear"):
+                patcher = mock.patch.object(npc, method)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+        self.arbiter = RoomArbiter(self.room1)
+
+    def _say(self, speaker, text):
+        # every NPC in the room hears the same line
+        for npc in (self.barnaby, self.elara):
+            self.arbiter.hear(npc, speaker, text)
+
+    def test_one_answers(self):
+        self._say(self.char1, "Hello everyone")
+        self._say(self.char1, "Nice place")
+        self.clock.advance(1)
+        lines = [(self.char1, "Hello everyone"), (self.char1, "Nice place")]
+        # nobody was addressed: only the best (here the first) answers
+        answered = [npc for npc in (self.barnaby, self.elara) if npc.answer_later.called]
+        self.assertEqual(len(answered), 1)
+        answered[0].answer_later.assert_called_once_with(lines)
+        other = self.elara if answered[0] is self.barnaby else self.barnaby
+        other.overhear.assert_called_once_with(lines)
+
+    def test_addressed_answer(self):
+        self._say(self.char1, "Barnaby, Elara, what do you think?")
+        self.clock.advance(1)
+        self.assertTrue(self.barnaby.answer_later.called and self.elara.answer_later.called)
+
+    def test_named_wins(self):
+        self._say(self.char1, "Elara, have you seen my dog?")
+        self.clock.advance(1)
+        self.elara.answer_later.assert_called_once()
+        self.barnaby.answer_later.assert_not_called()
+        self.barnaby.overhear.assert_called_once()
+
+    def test_repeated_line(self):
+        self._say(self.char1, "Hello")
+        self._say(self.char1, "Hello")
+        self.clock.advance(1)
+        answered = self.barnaby if self.barnaby.answer_later.called else self.elara
+        self.assertEqual(answered.answer_later.call_args.args[0], [(self.char1, "Hello"), (self.char1, "Hello")])
+
+    def test_speaker_left(self):
+        self._say(self.char1, "Barnaby?")
+        self.char1.location = self.room2
+        self.clock.advance(1)
+        self.barnaby.answer_later.assert_not_called()
+        self.elara.answer_later.assert_not_called()
+
+    def test_disabled_npc(self):
+        self.barnaby.db.llm_enabled = False
+        self._say(self.char1, "Barnaby?")
+        self.clock.advance(1)
+        self.barnaby.answer_later.assert_not_called()
+        self.elara.answer_later.assert_called_once()
+
+    @override_settings(LLM_ROOM_ARBITER={"max_speakers": 2, "min_score": 3, "group_reply": True})
+    def test_group_reply(self):
+        with mock.patch.object(arbiter, "group_respond") as group_respond:
+            self._say(self.char1, "Barnaby, Elara, what do you think?")
+            self.clock.advance(1)
+        group_respond.assert_called_once()
+        self.assertEqual(set(group_respond.call_args.args[0]), {self.barnaby, self.elara})
+
+
+class TestGroupReply(_ArbiterTest):
+    def setUp(self):
+        super().setUp()
+        for npc in (self.barnaby, self.elara):
+            for method in ("execute_cmd", "_process_llm_text"):
+                patcher = mock.patch.object(npc, method)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+        self.reply = arbiter._GroupReply([self.barnaby, self.elara], lambda npc: True)
+
+    def _commands(self, npc):
+        return [call.args[0] for call in npc.execute_cmd.call_args_list]
+
+    def test_routing(self):
+        for text, new_line in (("Barnaby: say Welcome, friend.", True), ("Pull up a chair.", False),
+                               ("Elara: emote smiles.", True), ("Gerald: say Who, me?", True),
+                               ("Elara: Nice to meet you.", True)):
+            self.reply.feed(text, new_line)
+        self.reply.close("the reply")
+        self.assertEqual(self._commands(self.barnaby), ["say Welcome, friend.", "say Pull up a chair."])
+        self.assertEqual(self._commands(self.elara), ["emote smiles.", "say Nice to meet you."])
+        self.elara._process_llm_text.assert_called_once_with("emote smiles.\nsay Nice to meet you.")
+
+    def test_unnamed_line(self):
+        # such as a fallback line
+        self.reply.feed("emote scratches their head.", True)
+        self.reply.close("emote scratches their head.")
+        self.assertEqual(self._commands(self.barnaby), ["emote scratches their head."])
+        self.elara.execute_cmd.assert_not_called()
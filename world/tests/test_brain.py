@@ -0,0 +1,56 @@
+"""
+Tests for world.brain.
+
+"""
+from unittest import TestCase
+
+from world.brain import WakeSchedule
+
+
+class TestWakeSchedule(TestCase):
+    def setUp(self):
+        self.schedule = WakeSchedule()
+
+    def test_phase(self):
+        for key in range(10):
+            self.schedule.add(key, 10, now=0)
+        wakes = sorted(wake for wake, _, _ in self.schedule._heap)
+        # spread over the interval rather than all at once
+        self.assertTrue(all(0 <= wake < 10 for wake in wakes))
+        self.assertGreater(min(later - earlier for earlier, later in zip(wakes, wakes[1:])), 0.5)
+
+    def test_pop_due(self):
+        # NPC 0 has no phase; NPC 1 wakes 0.618 of its interval in
+        self.schedule.add(0, 10, now=0)
+        self.schedule.add(1, 30, now=0)
+        self.assertEqual(self.schedule.next_wake(), 0)
+        due = []
+        for now in range(0, 61):
+            due.extend((now, key) for key in self.schedule.pop_due(now=now))
+        self.assertEqual(due, [(0, 0), (10, 0), (19, 1), (20, 0), (30, 0), (40, 0), (49, 1), (50, 0), (60, 0)])
+
+    def test_stop_early(self):
+        for key in range(3):
+            self.schedule.add(key, 10, now=0)
+        due = self.schedule.pop_due(now=10)
+        next(due)
+        due.close()
+        # the ones not reached stay due
+        self.assertEqual(len(list(self.schedule.pop_due(now=10))), 2)
+
+    def test_remove_and_change(self):
+        self.schedule.add(0, 10, now=0)
+        self.schedule.add(1, 10, now=0)
+        self.schedule.remove(0)
+        self.schedule.add(1, 100, now=0)
+        self.assertEqual((len(self.schedule), 0 in self.schedule, self.schedule.interval(1)), (1, False, 100))
+        self.assertEqual(list(self.schedule.pop_due(now=50)), [])
+        self.assertEqual(list(self.schedule.pop_due(now=62)), [1])
+        self.schedule.remove(1)
+        self.assertIsNone(self.schedule.next_wake())
+
+    def test_fallen_behind(self):
+        self.schedule.add(0, 10, now=0)
+        self.assertEqual(list(self.schedule.pop_due(now=100)), [0])
+        # one wake-up after a long stall, then back on a regular interval
+        self.assertEqual(self.schedule.next_wake(), 110)
@@ -0,0 +1,61 @@
+"""
+Tests for world.llm.
+
+"""
+from unittest import TestCase, mock
+
+from twisted.internet import defer
+
+from world import llm
+from world.llm_telemetry import Telemetry
+
+
+class TestStaleTelemetry(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.wanted = [True]
+        for patcher in (mock.patch.object(llm, "_submit", self._submit),
+                        mock.patch.object(llm, "_telemetry", Telemetry()),
+                        mock.patch.dict(llm._resilience_stats, stale=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _submit(self, request_class, tier, msgs_to_send, system_prompt, call, **kwargs):
+        # what the scheduler would do for a request it dispatches right away
+        call.dispatched = call.submitted
+        d = defer.Deferred()
+        self.calls.append(d)
+        return d
+
+    def _outcomes(self):
+        return llm._telemetry.stats()["classes"][llm.REPLY]["outcomes"]
+
+    def _ask(self, prompt="Hello"):
+        results = []
+        llm.get_response(prompt, use_cache=False, is_valid=lambda: self.wanted[0]).addBoth(results.append)
+        return results
+
+    def test_ok(self):
+        results = self._ask()
+        self.calls[0].callback("Hi.")
+        self.assertEqual(results, ["Hi."])
+        self.assertEqual(self._outcomes(), {"ok": 1})
+
+    def test_stale_result(self):
+        results = self._ask()
+        self.wanted[0] = False
+        self.calls[0].callback("Hi.")
+        # thrown away, and recorded as such
+        self.assertEqual(results, [None])
+        self.assertEqual(self._outcomes(), {"stale": 1})
+        self.assertEqual(llm._resilience_stats["stale"], 1)
+
+    def test_stale_coalesced(self):
+        first = self._ask()
+        second = self._ask()
+        self.assertEqual(len(self.calls), 1)
+        self.wanted[0] = False
+        self.calls[0].callback("Hi.")
+        self.assertEqual((first, second), ([None], [None]))
+        self.assertEqual(self._outcomes(), {"stale": 2})
+        self.assertEqual(llm._telemetry.stats()["classes"][llm.REPLY]["cache"], {"off": 1, "coalesced": 1})
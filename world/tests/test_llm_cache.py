@@ -0,0 +1,104 @@
+"""
+Tests for world.llm_cache.
+
+"""
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from twisted.internet import task
+
+from world import llm_cache
+from world.llm_cache import CacheStore, ResponseCache, request_digest
+
+
+class TestRequestDigest(TestCase):
+    def test_whitespace(self):
+        messages = [{"role": "user", "content": "Hello   there\n"}]
+        self.assertEqual(request_digest("model", "You are  a test.", messages),
+                         request_digest("model", "You are a test.", [{"role": "user", "content": "Hello there"}]))
+
+    def test_different_requests(self):
+        messages = [{"role": "user", "content": "Hello"}]
+        digest = request_digest("model", "You are a test.", messages)
+        self.assertNotEqual(digest, request_digest("other", "You are a test.", messages))
+        self.assertNotEqual(digest, request_digest("model", "You are a test.",
+                                                   [{"role": "assistant", "content": "Hello"}]))
+
+
+class TestResponseCache(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        patcher = mock.patch.object(llm_cache, "time", SimpleNamespace(time=self.clock.seconds))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ResponseCache(max_size=2, ttl=60)
+
+    def test_hit_and_miss(self):
+        self.cache.set("a", "reply")
+        self.assertEqual(self.cache.get("a"), "reply")
+        self.assertIsNone(self.cache.get("b"))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_lru_eviction(self):
+        self.cache.set("a", "first")
+        self.cache.set("b", "second")
+        self.cache.get("a")
+        self.cache.set("c", "third")
+        self.assertNotIn("b", self.cache)
+        self.assertEqual([key for key, _, _ in self.cache.items()], ["a", "c"])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        self.cache.set("a", "reply")
+        self.clock.advance(61)
+        self.assertNotIn("a", self.cache)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["expirations"], 1)
+
+    def test_restore(self):
+        self.cache.set("new", "newer reply")
+        self.clock.advance(30)
+        rows = [("old", -10.0, "expired"), ("kept", 1.0, "saved reply"), ("new", 2.0, "older reply")]
+        self.assertEqual(self.cache.restore(rows), 1)
+        # entries already in the cache win, expired rows are left out
+        self.assertEqual(self.cache.get("new"), "newer reply")
+        self.assertEqual(self.cache.get("kept"), "saved reply")
+        self.assertNotIn("old", self.cache)
+        self.assertEqual(self.cache.stats()["restored"], 1)
+
+    def test_restore_full(self):
+        self.cache.set("a", "reply")
+        self.assertEqual(self.cache.restore([("b", 0.0, "older"), ("c", 0.0, "newer")]), 1)
+        self.assertEqual([key for key, _, _ in self.cache.items()], ["c", "a"])
+
+
+class TestCacheStore(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = CacheStore(os.path.join(directory.name, "cache.db"))
+
+    def test_round_trip(self):
+        now = time.time()
+        cache = ResponseCache(max_size=10, ttl=600)
+        for index in range(3):
+            cache.set(request_digest("model", "prompt", [{"role": "user", "content": str(index)}]),
+                      f"reply {index}")
+        self.store.write(cache.items(), max_size=10, ttl=600)
+        restored = ResponseCache(max_size=10, ttl=600)
+        self.assertEqual(restored.restore(self.store.read(10)), 3)
+        self.assertEqual(restored.items(), cache.items())
+        self.assertTrue(all(stored_at >= now for _, stored_at, _ in restored.items()))
+
+    def test_write_trims(self):
+        now = time.time()
+        keys = [request_digest("model", "prompt", [{"role": "user", "content": str(index)}])
+                for index in range(4)]
+        self.store.write([(keys[0], now - 1000, "expired")]
+                         + [(key, now + index, f"reply {index}") for index, key in enumerate(keys[1:])],
+                         max_size=2, ttl=600)
+        self.assertEqual(self.store.read(10), [(keys[2], now + 1, "reply 1"), (keys[3], now + 2, "reply 2")])
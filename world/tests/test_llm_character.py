@@ -0,0 +1,79 @@
+"""
+Tests for typeclasses.llm_character.
+
+"""
+from unittest import mock
+
+from django.test import override_settings
+from evennia.utils import create
+from evennia.utils.test_resources import EvenniaTest
+from twisted.internet import defer
+
+
+def _turn(index):
+    return f"Turn {index}: " + " ".join(["word"] * 28)
+
+
+@override_settings(LLM_MEMORY={"history_tokens": 100, "keep_tokens": 40, "summary_tokens": 1000})
+class TestSummarizeMemory(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.npc = create.create_object("typeclasses.llm_character.LLMCharacter", key="Barnaby",
+                                        location=self.room1)
+        self.npc.db.memory_size = 4
+        self.requests = []
+        for patcher in (mock.patch.object(self.npc, "_ask_memory", self._ask_memory),
+                        mock.patch("world.llm.remember")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _ask_memory(self, request):
+        d = defer.Deferred()
+        self.requests.append((request, d))
+        return d
+
+    def _say(self, *indices):
+        for index in indices:
+            self.npc._append_to_history("user", _turn(index))
+
+    def _history(self):
+        return [content for _, content in self.npc._history().turns]
+
+    def test_kept_until_stored(self):
+        self._say(0, 1, 2, 3)
+        self.assertEqual(len(self.requests), 1)
+        self.assertIn(_turn(0), self.requests[0][0])
+        # the turns being summarized are still there for replies
+        self.assertEqual(self._history(), [_turn(index) for index in range(4)])
+        self.requests[0][1].callback("You met a traveller.")
+        self.assertEqual(self.npc.db.memory_summary, "You met a traveller.")
+        self.assertEqual(self._history(), [_turn(3)])
+        self.assertFalse(self.npc.ndb.memory_backlog)
+        self.assertFalse(self.npc.ndb.summarizing)
+
+    def test_failed(self):
+        self._say(0, 1, 2, 3)
+        self.requests[0][1].errback(RuntimeError("boom"))
+        # nothing is lost; the next turn tries again, with the turns pushed out meanwhile
+        self.assertEqual(self._history(), [_turn(index) for index in range(4)])
+        self._say(4)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.npc.ndb.memory_backlog, [("user", _turn(0))])
+        self.assertIn(_turn(0), self.requests[1][0])
+        self.requests[1][1].callback("You met a traveller.")
+        self.assertEqual(self._history(), [_turn(4)])
+        self.assertFalse(self.npc.ndb.memory_backlog)
+
+    def test_pushed_out_meanwhile(self):
+        self._say(0, 1, 2, 3)
+        self._say(4, 5)
+        # turns 0 and 1 left the history while being summarized
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual([content for _, content in self.npc.ndb.memory_backlog], [_turn(0), _turn(1)])
+        self.requests[0][1].callback("You met a traveller.")
+        self.assertEqual(self._history(), [_turn(3), _turn(4), _turn(5)])
+        self.assertEqual(self.npc.ndb.memory_backlog, [])
+
+    def test_not_worth_a_call(self):
+        self._say(0, 1)
+        self.assertEqual(self.requests, [])
@@ -0,0 +1,117 @@
+"""
+Tests for world.llm_episodic.
+
+"""
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from twisted.internet import defer
+
+from world import llm_episodic
+from world.llm_episodic import EpisodicMemory, MemoryBank, read_snapshot, write_snapshot
+from world.llm_semantic import HashingEmbedder
+
+
+class TestEpisodicMemory(TestCase):
+    def setUp(self):
+        self.embedder = HashingEmbedder(dim=128)
+        self.memory = EpisodicMemory(128, max_entries=3, half_life=100)
+
+    def _add(self, text, now):
+        self.memory.add(self.embedder.embed(text), text, now=now)
+
+    def test_search(self):
+        self._add("Elara owes me ten gold coins", 0)
+        self._add("The bridge to the north is broken", 0)
+        found = self.memory.search(self.embedder.embed("how much gold does Elara owe"), k=1, now=50)
+        self.assertEqual(found, [(0.0, "Elara owes me ten gold coins")])
+        # recalling it refreshed it
+        self.assertEqual(list(self.memory.recalled[:2]), [50, 0])
+        self.assertEqual(self.memory.search(self.embedder.embed("dragons"), now=50), [])
+
+    def test_strength(self):
+        self._add("Elara owes me ten gold coins", 0)
+        self.assertAlmostEqual(float(self.memory.strength(now=100)[0]), 0.5)
+
+    def test_weakest_replaced(self):
+        for index, text in enumerate(("first memory", "second memory", "third memory")):
+            self._add(text, index * 10)
+        self.memory.search(self.embedder.embed("first memory"), k=1, now=30)
+        self._add("fourth memory", 40)
+        self.assertEqual(self.memory.texts, ["first memory", "fourth memory", "third memory"])
+
+    def test_restore(self):
+        saved = EpisodicMemory(128, max_entries=3)
+        for text in ("old one", "old two"):
+            saved.add(self.embedder.embed(text), text, now=0)
+        self._add("new one", 10)
+        self._add("new two", 10)
+        self.memory.restore(saved.snapshot())
+        # what was said since loading started wins over the oldest saved memories
+        self.assertEqual(self.memory.texts, ["old two", "new one", "new two"])
+        self.assertEqual(list(self.memory.created), [0, 10, 10])
+        self.assertEqual(self.memory.search(self.embedder.embed("old two"), k=1, now=20)[0][1], "old two")
+
+
+class TestMemoryBank(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        # file reads and writes run when the test lets them, instead of in threads
+        self.pending = []
+        patcher = mock.patch.object(llm_episodic.threads, "deferToThread", self._defer_to_thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bank = MemoryBank(HashingEmbedder(dim=128), self.path, max_loaded=1, min_similarity=0.2)
+
+    def _defer_to_thread(self, func, *args):
+        d = defer.Deferred()
+        self.pending.append((d, func, args))
+        return d
+
+    def _run_threads(self):
+        while self.pending:
+            d, func, args = self.pending.pop(0)
+            d.callback(func(*args))
+
+    def test_load_in_background(self):
+        snapshot = EpisodicMemory(128)
+        snapshot.add(self.bank.embedder.embed("Elara owes me ten gold coins"), "Elara owes me ten gold coins")
+        write_snapshot(os.path.join(self.path, "1.npz"), snapshot.snapshot())
+        self.bank.load(1)
+        self.assertEqual(self.bank.stats()["loading"], 1)
+        self.assertEqual(self.bank.recall(1, "Elara gold"), [])
+        self._run_threads()
+        self.assertEqual([text for _, text in self.bank.recall(1, "Elara gold")], ["Elara owes me ten gold coins"])
+
+    def test_unload_saves(self):
+        self.bank.remember(1, "Elara owes me ten gold coins")
+        self._run_threads()
+        self.bank.remember(2, "The bridge is broken")
+        # the first NPC's memories are saved in a thread and read back after that
+        self.assertEqual(self.bank.stats()["loaded"], 1)
+        self.bank.load(1)
+        self._run_threads()
+        self.assertEqual([text for _, text in self.bank.recall(1, "Elara gold")], ["Elara owes me ten gold coins"])
+
+    def test_loading_not_saved(self):
+        self.bank.remember(1, "Elara owes me ten gold coins")
+        self.assertEqual(self.bank.snapshots(), [])
+        self.bank.remember(2, "The bridge is broken")
+        # still being read, so it is kept rather than saved over its file
+        self.assertEqual(self.bank.stats()["loaded"], 2)
+        self._run_threads()
+        self.assertEqual(len(self.bank.snapshots()), 2)
+
+    def test_flush(self):
+        self.bank.remember(1, "Elara owes me ten gold coins")
+        self._run_threads()
+        d = self.bank.flush()
+        self._run_threads()
+        self.assertTrue(d.called)
+        snapshot = read_snapshot(os.path.join(self.path, "1.npz"), 128)
+        self.assertEqual(list(snapshot["texts"]), ["Elara owes me ten gold coins"])
+        self.assertIsNone(read_snapshot(os.path.join(self.path, "1.npz"), 64))
+        self.assertIsNone(read_snapshot(os.path.join(self.path, "2.npz"), 128))
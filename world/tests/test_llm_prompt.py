@@ -0,0 +1,62 @@
+"""
+Tests for world.llm_prompt.
+
+"""
+from unittest import TestCase
+
+from world.llm_prompt import count_tokens, fit_messages
+
+
+def _turns(count, words=20):
+    return [{"role": "user" if index % 2 == 0 else "assistant",
+             "content": " ".join(f"turn{index}word{word}" for word in range(words))}
+            for index in range(count)]
+
+
+class TestFitMessages(TestCase):
+    def test_everything_fits(self):
+        messages = _turns(5)
+        kept, tokens, dropped, compacted = fit_messages("You are a test.", messages, 10000)
+        self.assertEqual(kept, messages)
+        self.assertEqual((dropped, compacted), (0, 0))
+        self.assertLessEqual(tokens, 10000)
+
+    def test_no_messages(self):
+        kept, tokens, dropped, compacted = fit_messages("You are a test.", [], 100)
+        self.assertEqual((kept, dropped, compacted), ([], 0, 0))
+        self.assertGreater(tokens, count_tokens("You are a test."))
+
+    def test_oldest_dropped(self):
+        messages = _turns(10)
+        _, full, _, _ = fit_messages("You are a test.", messages, 10000)
+        budget = full // 2
+        kept, tokens, dropped, compacted = fit_messages("You are a test.", messages, budget)
+        self.assertLessEqual(tokens, budget)
+        self.assertGreater(dropped, 0)
+        # the newest turns are kept, the current one always
+        self.assertEqual(kept[-1], messages[-1])
+        self.assertEqual(kept[-2], messages[-2])
+        self.assertEqual(len(kept), len(messages) - dropped)
+        self.assertEqual(kept[compacted:], messages[dropped + compacted:])
+
+    def test_partial_turn_compacted(self):
+        messages = _turns(3, words=100)
+        _, last_two, _, _ = fit_messages("You are a test.", messages[1:], 10000)
+        budget = last_two + 40
+        kept, tokens, dropped, compacted = fit_messages("You are a test.", messages, budget)
+        self.assertLessEqual(tokens, budget)
+        self.assertEqual((len(kept), dropped, compacted), (3, 0, 1))
+        self.assertLess(count_tokens(kept[0]["content"]), count_tokens(messages[0]["content"]))
+
+    def test_current_turn_always_kept(self):
+        messages = _turns(3, words=200)
+        kept, _, dropped, _ = fit_messages("You are a test.", messages, 10)
+        self.assertEqual(kept, messages[-1:])
+        self.assertEqual(dropped, 2)
+
+    def test_max_turn_tokens(self):
+        messages = _turns(3, words=200)
+        kept, _, dropped, compacted = fit_messages("You are a test.", messages, 10000, max_turn_tokens=50)
+        self.assertEqual((len(kept), dropped, compacted), (3, 0, 3))
+        for message in kept:
+            self.assertLessEqual(count_tokens(message["content"]), 50)
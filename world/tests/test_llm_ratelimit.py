@@ -0,0 +1,89 @@
+"""
+Tests for world.llm_ratelimit.
+
+"""
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from twisted.internet import task
+
+from world import llm_ratelimit
+from world.llm_ratelimit import RateLimiter, TokenBucket
+
+
+class _ClockTestCase(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        patcher = mock.patch.object(llm_ratelimit, "time", SimpleNamespace(time=self.clock.seconds))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestTokenBucket(_ClockTestCase):
+    def test_refill(self):
+        bucket = TokenBucket(60, burst_seconds=10)
+        self.assertEqual(bucket.capacity, 10)
+        bucket.take(10)
+        self.assertEqual(bucket.wait_time(2), 2)
+        self.clock.advance(2)
+        self.assertEqual(bucket.wait_time(2), 0)
+        self.clock.advance(100)
+        self.assertEqual(bucket.headroom(), 1.0)
+
+    def test_keep(self):
+        bucket = TokenBucket(60, burst_seconds=10)
+        bucket.take(5)
+        # taking 1 would leave less than half the bucket
+        self.assertEqual(bucket.wait_time(1, keep=0.5), 1)
+        self.assertEqual(bucket.wait_time(1), 0)
+
+    def test_debt(self):
+        bucket = TokenBucket(60, burst_seconds=10)
+        bucket.take(15)
+        self.assertEqual(bucket.headroom(), 0.0)
+        self.assertEqual(bucket.wait_time(1), 6)
+
+
+class TestRateLimiter(_ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600, burst_seconds=10, backoff=5)
+
+    def test_acquire(self):
+        self.assertEqual(self.limiter.acquire(60), 0)
+        self.assertEqual(self.limiter.tokens.level, 40)
+        self.assertEqual(self.limiter.requests.level, 9)
+        # not enough tokens left: nothing is taken
+        self.assertEqual(self.limiter.acquire(50), 1)
+        self.assertEqual((self.limiter.tokens.level, self.limiter.requests.level), (40, 9))
+
+    def test_requests(self):
+        for _ in range(10):
+            self.assertEqual(self.limiter.acquire(1), 0)
+        self.assertEqual(self.limiter.acquire(1), 1)
+
+    def test_min_headroom(self):
+        self.limiter.acquire(50)
+        # ambient chatter leaves half the budget to replies
+        self.assertEqual(self.limiter.acquire(10, min_headroom=0.5), 1)
+        self.assertEqual(self.limiter.acquire(10), 0)
+
+    def test_settle(self):
+        self.limiter.acquire(50)
+        self.limiter.settle(50, 20)
+        self.assertEqual(self.limiter.tokens.level, 80)
+        self.limiter.settle(20, 100)
+        self.assertEqual(self.limiter.tokens.level, 0)
+
+    def test_backoff(self):
+        self.limiter.backoff()
+        self.assertEqual(self.limiter.headroom(), 0.0)
+        self.assertEqual(self.limiter.acquire(1), 5)
+        self.clock.advance(5)
+        self.assertEqual(self.limiter.acquire(1), 0)
+        self.assertEqual(self.limiter.stats()["backoffs"], 1)
+
+    def test_no_limits(self):
+        limiter = RateLimiter()
+        self.assertEqual(limiter.acquire(10 ** 6), 0)
+        self.assertEqual(limiter.headroom(), 1.0)
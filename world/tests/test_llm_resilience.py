@@ -0,0 +1,129 @@
+"""
+Tests for world.llm_resilience.
+
+"""
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from twisted.internet import defer, task
+
+from world import llm_resilience
+from world.llm_resilience import CircuitBreaker, hedge
+
+
+class TestHedge(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        patcher = mock.patch.object(llm_resilience, "reactor", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.attempts = []
+        self.hedged = []
+        self.cancelled = []
+
+    def _start(self, on_text):
+        index = len(self.attempts)
+        d = defer.Deferred(lambda _: self.cancelled.append(index))
+        self.attempts.append((d, on_text))
+        return d
+
+    def _hedge(self, on_text=None):
+        results = []
+        d = hedge(self._start, 1.0, on_text=on_text, on_hedge=lambda: self.hedged.append(True))
+        d.addBoth(results.append)
+        return d, results
+
+    def test_fast_attempt(self):
+        _, results = self._hedge()
+        self.attempts[0][0].callback("first")
+        self.clock.advance(2)
+        self.assertEqual(results, ["first"])
+        self.assertEqual((len(self.attempts), self.hedged), (1, []))
+
+    def test_backup_wins(self):
+        _, results = self._hedge()
+        self.clock.advance(1)
+        self.assertEqual((len(self.attempts), self.hedged), (2, [True]))
+        self.attempts[1][0].callback("backup")
+        self.assertEqual(results, ["backup"])
+        # the loser is cancelled
+        self.assertEqual(self.cancelled, [0])
+
+    def test_first_wins(self):
+        _, results = self._hedge()
+        self.clock.advance(1)
+        self.attempts[0][0].callback("first")
+        self.assertEqual(results, ["first"])
+        self.assertEqual(self.cancelled, [1])
+
+    def test_failure_waits_for_other(self):
+        _, results = self._hedge()
+        self.clock.advance(1)
+        self.attempts[0][0].errback(RuntimeError("boom"))
+        self.assertEqual(results, [])
+        self.attempts[1][0].callback("backup")
+        self.assertEqual(results, ["backup"])
+
+    def test_all_failed(self):
+        _, results = self._hedge()
+        self.clock.advance(1)
+        self.attempts[0][0].errback(RuntimeError("boom"))
+        self.attempts[1][0].errback(RuntimeError("boom again"))
+        self.assertEqual(str(results[0].value), "boom again")
+
+    def test_stream_winner(self):
+        texts = []
+        _, results = self._hedge(on_text=texts.append)
+        self.clock.advance(1)
+        self.attempts[1][1]("backup")
+        # the first to stream wins; the other is cancelled and its text ignored
+        self.assertTrue(self.attempts[0][0].called)
+        self.attempts[0][1]("first")
+        self.attempts[1][0].callback("backup")
+        self.assertEqual(texts, ["backup"])
+        self.assertEqual(results, ["backup"])
+
+    def test_no_hedge_after_text(self):
+        self._hedge(on_text=lambda text: None)
+        self.attempts[0][1]("first")
+        self.clock.advance(2)
+        self.assertEqual((len(self.attempts), self.hedged), (1, []))
+
+    def test_cancel(self):
+        d, results = self._hedge()
+        self.clock.advance(1)
+        d.cancel()
+        self.assertIsInstance(results[0].value, defer.CancelledError)
+        self.assertTrue(all(attempt.called for attempt, _ in self.attempts))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        patcher = mock.patch.object(llm_resilience, "time", SimpleNamespace(time=self.clock.seconds))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    def test_trip_and_recover(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+        self.clock.advance(10)
+        # one trial request is let through
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.is_available())
+        self.assertEqual(self.breaker.stats()["trips"], 2)
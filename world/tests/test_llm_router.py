@@ -0,0 +1,104 @@
+"""
+Tests for world.llm_router.
+
+"""
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from twisted.internet import defer, task
+
+from world import llm_ratelimit, llm_resilience
+from world.llm_ratelimit import RateLimiter
+from world.llm_resilience import CircuitBreaker, hedge
+from world.llm_router import Backend, NoBackendAvailable
+
+
+class _Client:
+    model = "test-model"
+    transport = object()
+
+    def __init__(self):
+        self.calls = []
+
+    def get_response(self, messages, system_prompt):
+        d = defer.Deferred()
+        self.calls.append((d, None))
+        return d
+
+    def stream_response(self, messages, system_prompt, on_text):
+        d = defer.Deferred()
+        self.calls.append((d, on_text))
+        return d
+
+
+class _Completion(str):
+    usage = None
+
+
+class TestBackendRateLimit(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        for patcher in (mock.patch.object(llm_ratelimit, "time", SimpleNamespace(time=self.clock.seconds)),
+                        mock.patch.object(llm_resilience, "reactor", self.clock)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, burst_seconds=10)
+        self.client = _Client()
+        self.backend = Backend("test", self.client, limiter=self.limiter)
+
+    def _call(self, on_text=None):
+        d = self.backend.call([{"role": "user", "content": "Hello"}], "You are a test.", on_text,
+                              prompt_tokens=100, max_tokens=150)
+        results = []
+        d.addBoth(results.append)
+        return d, results
+
+    def test_usage_settled(self):
+        self._call()
+        self.assertEqual(self.limiter.tokens.level, 750)
+        response = _Completion("Hi.")
+        response.usage = {"prompt_tokens": 90, "completion_tokens": 10}
+        self.client.calls[0][0].callback(response)
+        self.assertEqual(self.limiter.tokens.level, 900)
+        self.assertEqual(self.limiter.requests.level, 9)
+
+    def test_failure_refunded(self):
+        _, results = self._call()
+        self.client.calls[0][0].errback(RuntimeError("boom"))
+        self.assertEqual(results[0].type, RuntimeError)
+        # no text came back, so no tokens were used
+        self.assertEqual(self.limiter.tokens.level, 1000)
+
+    def test_cancel_settled(self):
+        d, _ = self._call(on_text=lambda text: None)
+        self.client.calls[0][1]("Hello there")
+        d.cancel()
+        self.assertEqual(self.limiter.tokens.level, 898)
+        self.assertEqual(self.backend.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_out_of_budget(self):
+        self.limiter.tokens.take(900)
+        _, results = self._call()
+        self.assertEqual(results[0].type, NoBackendAvailable)
+        self.assertEqual(self.client.calls, [])
+        self.assertEqual((self.backend.requests, self.backend.in_flight, self.backend.throttled), (0, 0, 1))
+        self.assertEqual(self.limiter.tokens.level, 100)
+
+    def test_half_open_trial_released(self):
+        self.backend.breaker.state = CircuitBreaker.HALF_OPEN
+        self.limiter.tokens.take(900)
+        self._call()
+        self.assertFalse(self.backend.breaker.trial_in_flight)
+
+    def test_hedge_pays(self):
+        results = []
+        hedge(lambda on_text: self.backend.call([], "You are a test.", prompt_tokens=100, max_tokens=150),
+              1.0).addBoth(results.append)
+        self.clock.advance(1)
+        # both attempts are sent, and both are paid for (with a second's refill in between)
+        self.assertEqual(len(self.client.calls), 2)
+        self.assertEqual(self.limiter.tokens.level, 600)
+        self.client.calls[1][0].callback(_Completion("Hi."))
+        self.assertEqual(results, ["Hi."])
+        # the winner used its prompt and reply, the cancelled loser nothing
+        self.assertEqual(self.limiter.tokens.level, 998)
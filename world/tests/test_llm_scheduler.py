@@ -0,0 +1,123 @@
+"""
+Tests for world.llm_scheduler.
+
+"""
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from twisted.internet import defer, task
+
+from world import llm_scheduler
+from world.llm_scheduler import AMBIENT, PREFETCH, REPLY, RequestScheduler
+
+
+class TestRequestScheduler(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        for patcher in (mock.patch.object(llm_scheduler, "reactor", self.clock),
+                        mock.patch.object(llm_scheduler, "time", SimpleNamespace(time=self.clock.seconds))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.scheduler = RequestScheduler(max_concurrent=1)
+        self.calls = []
+
+    def _call(self, name):
+        d = defer.Deferred()
+        self.calls.append((name, d))
+        return d
+
+    def _results(self, d):
+        results = []
+        d.addBoth(results.append)
+        return results
+
+    def test_priority_order(self):
+        self.scheduler.submit(REPLY, self._call, "first")
+        self.scheduler.submit(AMBIENT, self._call, "ambient")
+        self.scheduler.submit(REPLY, self._call, "reply")
+        self.calls[0][1].callback(None)
+        self.calls[1][1].callback(None)
+        self.assertEqual([name for name, _ in self.calls], ["first", "reply", "ambient"])
+
+    def test_cancel_queued(self):
+        self.scheduler.submit(REPLY, self._call, "running")
+        d = self.scheduler.submit(REPLY, self._call, "queued")
+        results = self._results(d)
+        d.cancel()
+        self.assertIsInstance(results[0].value, defer.CancelledError)
+        self.calls[0][1].callback("done")
+        # the cancelled request never runs
+        self.assertEqual([name for name, _ in self.calls], ["running"])
+        stats = self.scheduler.stats()[REPLY]
+        self.assertEqual((stats["queued"], stats["cancelled"], stats["completed"]), (0, 1, 1))
+
+    def test_cancel_running(self):
+        d = self.scheduler.submit(REPLY, self._call, "running")
+        self.scheduler.submit(REPLY, self._call, "next")
+        results = self._results(d)
+        d.cancel()
+        self.assertIsInstance(results[0].value, defer.CancelledError)
+        self.assertTrue(self.calls[0][1].called)
+        # the slot is freed for the next request
+        self.assertEqual([name for name, _ in self.calls], ["running", "next"])
+        self.assertEqual(self.scheduler.active, 1)
+        self.assertEqual(self.scheduler.stats()[REPLY]["cancelled"], 1)
+
+    def test_deadline_drop(self):
+        self.scheduler.submit(REPLY, self._call, "running")
+        results = self._results(self.scheduler.submit(PREFETCH, self._call, "prefetch"))
+        self.clock.advance(DEFAULT_PREFETCH_DEADLINE + 1)
+        self.calls[0][1].callback(None)
+        self.assertEqual(results, [None])
+        self.assertEqual(len(self.calls), 1)
+        stats = self.scheduler.stats()[PREFETCH]
+        self.assertEqual((stats["queued"], stats["dropped"]), (0, 1))
+
+    def test_within_deadline(self):
+        self.scheduler.submit(REPLY, self._call, "running")
+        self.scheduler.submit(PREFETCH, self._call, "prefetch")
+        self.clock.advance(DEFAULT_PREFETCH_DEADLINE - 1)
+        self.calls[0][1].callback(None)
+        self.assertEqual([name for name, _ in self.calls], ["running", "prefetch"])
+        self.assertEqual(self.scheduler.stats()[PREFETCH]["wait_max"], DEFAULT_PREFETCH_DEADLINE - 1)
+
+    def test_stale_drop(self):
+        wanted = [True]
+        self.scheduler.submit(REPLY, self._call, "running")
+        results = self._results(self.scheduler.submit(REPLY, self._call, "stale",
+                                                      is_valid=lambda: wanted[0]))
+        wanted[0] = False
+        self.calls[0][1].callback(None)
+        self.assertEqual(results, [None])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.scheduler.stats()[REPLY]["stale"], 1)
+
+    def test_throttled_by_limiter(self):
+        limiter = mock.Mock()
+        limiter.wait_time.side_effect = [2.0, 0]
+        self.scheduler.limiter = limiter
+        self.scheduler.submit(REPLY, self._call, "throttled")
+        self.assertEqual(self.calls, [])
+        self.clock.advance(2)
+        self.assertEqual([name for name, _ in self.calls], ["throttled"])
+        self.assertEqual(self.scheduler.stats()[REPLY]["throttled"], 1)
+
+    def test_synchronous_jobs(self):
+        # jobs that finish as they are dispatched, as when the breaker is open, must not recurse
+        blocker = self.scheduler.submit(REPLY, self._call, "running")
+        results = []
+        for index in range(5000):
+            self.scheduler.submit(REPLY, lambda index=index: index).addBoth(results.append)
+        self.calls[0][1].callback(None)
+        self.assertEqual(results, list(range(5000)))
+        self.assertTrue(blocker.called)
+        self.assertEqual(self.scheduler.active, 0)
+        stats = self.scheduler.stats()[REPLY]
+        self.assertEqual((stats["queued"], stats["in_flight"], stats["completed"]), (0, 0, 5001))
+
+    def test_unknown_class(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.submit("gossip", self._call, "gossip")
+
+
+DEFAULT_PREFETCH_DEADLINE = llm_scheduler.DEFAULT_CLASSES[PREFETCH]["deadline"]
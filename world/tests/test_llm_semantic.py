@@ -0,0 +1,84 @@
+"""
+Tests for world.llm_semantic.
+
+"""
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from twisted.internet import task
+
+from world import llm_semantic
+from world.llm_semantic import HashingEmbedder, SemanticCache, SemanticStore
+
+
+class TestHashingEmbedder(TestCase):
+    def setUp(self):
+        self.embedder = HashingEmbedder(dim=256)
+
+    def test_unit_length(self):
+        self.assertAlmostEqual(float(llm_semantic.np.linalg.norm(self.embedder.embed("Where is the smithy?"))),
+                               1.0, places=5)
+        self.assertFalse(self.embedder.embed("").any())
+
+    def test_rewording(self):
+        question = self.embedder.embed("Where is the blacksmith?")
+        self.assertGreater(float(question @ self.embedder.embed("where's the blacksmith")), 0.7)
+        self.assertLess(float(question @ self.embedder.embed("How much is a room for the night?")), 0.5)
+
+
+class TestSemanticStore(TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        patcher = mock.patch.object(llm_semantic, "time", SimpleNamespace(time=self.clock.seconds))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.embedder = HashingEmbedder(dim=256)
+        self.store = SemanticStore(256, max_entries=2, ttl=60)
+
+    def test_lookup(self):
+        self.assertEqual(self.store.nearest(self.embedder.embed("Hello")), (None, 0.0))
+        self.store.add(self.embedder.embed("Where is the blacksmith?"), "North of the square.")
+        self.assertEqual(self.store.lookup(self.embedder.embed("where is the blacksmith"), 0.9),
+                         "North of the square.")
+        self.assertIsNone(self.store.lookup(self.embedder.embed("Who are you?"), 0.9))
+
+    def test_ttl(self):
+        self.store.add(self.embedder.embed("Who are you?"), "Barnaby.")
+        self.clock.advance(61)
+        self.assertIsNone(self.store.lookup(self.embedder.embed("Who are you?"), 0.9))
+
+    def test_least_recently_used_replaced(self):
+        self.store.add(self.embedder.embed("Who are you?"), "Barnaby.")
+        self.clock.advance(1)
+        self.store.add(self.embedder.embed("Where is the blacksmith?"), "North.")
+        self.clock.advance(1)
+        self.store.lookup(self.embedder.embed("Who are you?"), 0.9)
+        self.store.add(self.embedder.embed("How much is a room?"), "Five coins.")
+        self.assertEqual(self.store.size, 2)
+        self.assertEqual(sorted(self.store.answers), ["Barnaby.", "Five coins."])
+
+
+class TestSemanticCache(TestCase):
+    def setUp(self):
+        self.cache = SemanticCache(HashingEmbedder(dim=256), threshold=0.9, max_entries=4, max_npcs=2)
+
+    def test_scoped(self):
+        self.cache.set((1, 10), "Where is the blacksmith?", "North of the square.")
+        self.assertEqual(self.cache.get((1, 10), "where is the blacksmith"), "North of the square.")
+        # another player asking the same NPC, or the same player asking another NPC
+        self.assertIsNone(self.cache.get((1, 11), "where is the blacksmith"))
+        self.assertIsNone(self.cache.get((2, 10), "where is the blacksmith"))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_answer_replaced(self):
+        self.cache.set((1, 10), "Where is the blacksmith?", "North.")
+        self.cache.set((1, 10), "where is the blacksmith", "He moved south.")
+        self.assertEqual(self.cache.stats()["entries"], 1)
+        self.assertEqual(self.cache.get((1, 10), "Where is the blacksmith?"), "He moved south.")
+
+    def test_max_npcs(self):
+        for npc in range(3):
+            self.cache.set((npc, 10), "Who are you?", f"NPC {npc}.")
+        self.assertEqual(self.cache.stats()["npcs"], 2)
+        self.assertIsNone(self.cache.get((0, 10), "Who are you?"))
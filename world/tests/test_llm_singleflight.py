@@ -0,0 +1,87 @@
+"""
+Tests for world.llm_singleflight.
+
+"""
+from unittest import TestCase
+
+from twisted.internet import defer
+
+from world.llm_singleflight import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = []
+
+    def _call(self, *args, **kwargs):
+        d = defer.Deferred()
+        self.calls.append((d, kwargs))
+        return d
+
+    def test_coalesce(self):
+        results = []
+        self.flight.run("key", self._call).addCallback(results.append)
+        self.flight.run("key", self._call).addCallback(results.append)
+        self.flight.run("other", self._call)
+        self.assertEqual(len(self.calls), 2)
+        self.calls[0][0].callback("answer")
+        self.assertEqual(results, ["answer", "answer"])
+        self.assertEqual(self.flight.stats(), {"in_flight": 1, "calls": 2, "coalesced": 1})
+
+    def test_failure_fan_out(self):
+        failures = []
+        self.flight.run("key", self._call).addErrback(failures.append)
+        self.flight.run("key", self._call).addErrback(failures.append)
+        self.calls[0][0].errback(RuntimeError("boom"))
+        self.assertEqual([failure.type for failure in failures], [RuntimeError, RuntimeError])
+        self.assertEqual(len(self.flight), 0)
+
+    def test_detach(self):
+        first = self.flight.run("key", self._call)
+        results = []
+        self.flight.run("key", self._call).addCallback(results.append)
+        first.addErrback(lambda failure: failure.trap(defer.CancelledError))
+        first.cancel()
+        # the other caller still wants it
+        self.assertFalse(self.calls[0][0].called)
+        self.calls[0][0].callback("answer")
+        self.assertEqual(results, ["answer"])
+
+    def test_detach_all(self):
+        callers = [self.flight.run("key", self._call) for _ in range(2)]
+        for d in callers:
+            d.addErrback(lambda failure: failure.trap(defer.CancelledError))
+            d.cancel()
+        self.assertTrue(self.calls[0][0].called)
+        self.assertEqual(len(self.flight), 0)
+        # a new caller starts a new call
+        self.flight.run("key", self._call)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_is_valid(self):
+        wanted = {"first": True, "second": True}
+        self.flight.run("key", self._call, is_valid=lambda: wanted["first"])
+        self.flight.run("key", self._call, is_valid=lambda: wanted["second"])
+        is_valid = self.calls[0][1]["is_valid"]
+        wanted["first"] = False
+        self.assertTrue(is_valid())
+        wanted["second"] = False
+        self.assertFalse(is_valid())
+
+    def test_stream_fan_out(self):
+        first, second = [], []
+        self.flight.run("key", self._call, on_text=first.append)
+        on_text = self.calls[0][1]["on_text"]
+        on_text("Hello")
+        # a late caller catches up on what was already streamed
+        self.flight.run("key", self._call, on_text=second.append)
+        on_text(" there")
+        self.assertEqual(first, ["Hello", " there"])
+        self.assertEqual(second, ["Hello", " there"])
+
+    def test_synchronous_result(self):
+        results = []
+        self.flight.run("key", lambda: "answer").addCallback(results.append)
+        self.assertEqual(results, ["answer"])
+        self.assertEqual(len(self.flight), 0)
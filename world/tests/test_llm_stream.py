@@ -0,0 +1,70 @@
+"""
+Tests for world.llm_stream and the streamed replies NPCs act out.
+
+"""
+from unittest import TestCase, mock
+
+from typeclasses.llm_character import _StreamedReply
+from world.llm_stream import SentenceChunker
+
+
+def _chunk(text, size=5):
+    chunker = SentenceChunker()
+    pieces = []
+    for start in range(0, len(text), size):
+        pieces.extend(chunker.feed(text[start:start + size]))
+    return pieces + chunker.flush()
+
+
+class TestSentenceChunker(TestCase):
+    def test_sentences(self):
+        self.assertEqual(_chunk("say Hello there, traveller. What brings you here? Sit down!"),
+                         [("say Hello there, traveller.", True), ("What brings you here?", False),
+                          ("Sit down!", False)])
+
+    def test_lines(self):
+        self.assertEqual(_chunk("say Welcome.\nemote bows deeply."),
+                         [("say Welcome.", True), ("emote bows deeply.", True)])
+
+    def test_short_sentences_merged(self):
+        self.assertEqual(_chunk("say Mr. Smith was here before you."),
+                         [("say Mr. Smith was here before you.", True)])
+
+    def test_quotes(self):
+        self.assertEqual(_chunk('say She told me "Leave now." Then she left.'),
+                         [('say She told me "Leave now."', True), ("Then she left.", False)])
+
+
+class TestStreamedReply(TestCase):
+    def setUp(self):
+        self.npc = mock.Mock()
+        self.npc.db.llm_autonomy_level = None
+        self.reply = _StreamedReply(self.npc)
+
+    def _act(self, text):
+        for piece, new_line in _chunk(text):
+            self.reply.feed(piece, new_line)
+        self.reply.close()
+        return [call.args[0] for call in self.npc.execute_cmd.call_args_list]
+
+    def test_say_streamed(self):
+        self.reply.feed("say Hello there, traveller.", True)
+        self.npc.execute_cmd.assert_called_once_with("say Hello there, traveller.")
+        self.reply.feed("What brings you here?", False)
+        self.assertEqual(self.npc.execute_cmd.call_count, 2)
+
+    def test_multi_sentence_emote(self):
+        self.assertEqual(self._act("emote looks up from the bar. Then he waves at you.\nsay Welcome!"),
+                         ["emote looks up from the bar. Then he waves at you.", "say Welcome!"])
+
+    def test_pose(self):
+        self.assertEqual(self._act(":shrugs. He has seen worse."), ["emote shrugs. He has seen worse."])
+
+    def test_command(self):
+        self.npc.db.llm_autonomy_level = "high"
+        self.assertEqual(self._act("give the old key to Elara. She looks like she needs it."),
+                         ["give the old key to Elara. She looks like she needs it."])
+
+    def test_held_back(self):
+        self.assertEqual(self._act("say Farewell, friend.\nUPDATE_PROMPT: You are tired."),
+                         ["say Farewell, friend."])
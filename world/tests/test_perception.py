@@ -0,0 +1,59 @@
+"""
+Tests for world.perception.
+
+"""
+from evennia.utils import create
+from evennia.utils.test_resources import EvenniaTest
+
+from world.perception import digest_for
+
+
+class TestRoomDigest(EvenniaTest):
+    room_typeclass = "typeclasses.rooms.Room"
+    exit_typeclass = "typeclasses.exits.Exit"
+    object_typeclass = "typeclasses.objects.Object"
+
+    def test_build(self):
+        digest = digest_for(self.room1)
+        self.assertIs(digest_for(self.room1), digest)
+        self.assertIsNone(digest_for(self.room2, build=False))
+        self.assertEqual(digest.facts(self.char1), [
+            ("Characters here", "Char2"),
+            ("You see", "Obj, Obj2"),
+            ("Exits", "out"),
+        ])
+        self.assertEqual(digest.facts(self.char2)[0], ("Characters here", "Char"))
+
+    def test_move(self):
+        digest = digest_for(self.room1)
+        facts = digest.facts(self.char1)
+        self.assertIs(digest.facts(self.char1), facts)
+        self.obj1.move_to(self.room2)
+        self.assertEqual(digest.version, 1)
+        self.assertEqual(digest.facts(self.char1)[1], ("You see", "Obj2"))
+        self.obj1.move_to(self.room1)
+        self.assertEqual(digest.version, 2)
+        self.assertEqual(digest.facts(self.char1)[1], ("You see", "Obj, Obj2"))
+        # the room's hooks and `enter` may both see the same arrival
+        digest.add(self.obj1)
+        self.assertEqual(digest.version, 2)
+
+    def test_delete(self):
+        digest = digest_for(self.room1)
+        self.obj2.delete()
+        self.exit.delete()
+        self.assertEqual(digest.version, 2)
+        self.assertEqual(digest.facts(self.char1), [
+            ("Characters here", "Char2"),
+            ("You see", "Obj"),
+        ])
+
+    def test_nameless(self):
+        box = create.create_object("typeclasses.objects.Container", key="Box", location=self.room1)
+        box.db.open = False
+        digest = digest_for(self.room1)
+        self.assertIsNone(box.get_display_name(None))
+        self.assertEqual(digest.facts(self.char1)[1], ("You see", "Box, Obj, Obj2"))
+        box.db.open = True
+        digest.add(box)
+        self.assertEqual(digest.facts(self.char1)[1], ("You see", "Obj, Obj2, open Box"))
@@ -0,0 +1,63 @@
+"""
+Tests for world.presence.
+
+"""
+from evennia.utils import create
+from evennia.utils.test_resources import EvenniaTest
+
+from world.presence import PresenceIndex, rooms_within, zone_of
+
+
+class TestPresenceIndex(EvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.room3 = create.create_object(self.room_typeclass, key="Room3")
+        create.create_object(self.exit_typeclass, key="on", location=self.room2, destination=self.room3)
+        self.index = PresenceIndex()
+        # nobody is puppeted yet; don't look at the test session
+        self.index._built = True
+
+    def test_rooms_within(self):
+        self.assertEqual(rooms_within(self.room1, 0), {self.room1})
+        self.assertEqual(rooms_within(self.room1, 1), {self.room1, self.room2})
+        self.assertEqual(rooms_within(self.room1, 5), {self.room1, self.room2, self.room3})
+
+    def test_place_and_move(self):
+        self.index.place(self.char1, self.room1)
+        self.index.place(self.char2, self.room1)
+        self.assertEqual(self.index.count(self.room1), 2)
+        self.index.place(self.char1, self.room2)
+        self.assertEqual((self.index.count(self.room1), self.index.count(self.room2)), (1, 1))
+        self.index.place(self.char2, None)
+        self.index.remove(self.char1)
+        self.index.remove(self.char1)
+        self.assertEqual(self.index.stats(), {"players": 0, "rooms": 0, "zones": {}})
+
+    def test_observed(self):
+        self.assertFalse(self.index.observed(self.room3, 2))
+        self.index.place(self.char1, self.room1)
+        self.assertTrue(self.index.observed(self.room1, 0))
+        self.assertFalse(self.index.observed(self.room2, 0))
+        # exits lead one way only
+        self.assertFalse(self.index.observed(self.room3, 2))
+        self.index.place(self.char1, self.room3)
+        self.assertTrue(self.index.observed(self.room1, 2))
+        self.assertFalse(self.index.observed(self.room1, 1))
+
+    def test_zones(self):
+        for room in (self.room1, self.room3):
+            room.tags.add("harbour", category="zone")
+        self.assertEqual(zone_of(self.room1), "harbour")
+        self.assertIsNone(zone_of(self.room2))
+        self.index.place(self.char1, self.room3)
+        self.assertTrue(self.index.observed(self.room1, "zone"))
+        self.assertEqual(self.index.zone_count("harbour"), 1)
+        # a room without a zone only counts its own players
+        self.assertFalse(self.index.observed(self.room2, "zone"))
+        self.index.place(self.char1, self.room1)
+        self.assertEqual(self.index.stats()["zones"], {"harbour": 1})
+
+    def test_build(self):
+        index = PresenceIndex()
+        self.session.puppet = self.char1
+        self.assertEqual(index.count(self.room1), 1)